@@ -0,0 +1,161 @@
+"""
+File name: benchmarks/generate_ledger.py
+----------------------------------------
+Generates a synthetic (but realistic looking) data directory for the Expense tracker app, at any scale:
+1) "user_profiles_data.txt" - User profiles, in the same JSON format as the app's own file
+2) "user_expenses_data.txt" - Expense Txns of All Users, in the legacy flat csv format, sorted by Txn Date
+
+A few Users have most of the Txns (as in real life), Txn Amounts depend on the Txn Category,
+and most Txns of a User are in their own Country. Rows are generated and written in chunks,
+so memory use stays the same from 10 thousand up to 50 million rows.
+The app converts the flat file to per-user shards on first run (or: python expense_tracker_final.py migrate).
+
+Run from the repository root:
+python benchmarks/generate_ledger.py <output directory> [--rows N] [--users N] [--seed N]
+"""
+
+import argparse     # for the command-line options
+import json         # to write the User profiles file
+import os           # for file paths
+import sys          # to find the app module
+import time         # to time the generation
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from expense_tracker_final import FILE_PATH_TXN, FILE_PATH_USERS, TXN_CATEGORIES, TXN_FIELDS  # noqa: E402
+
+CHUNK_ROWS = 1_000_000  # rows generated and written at a time
+FIRST_TXN_DATE = "2020-01-01"
+LAST_TXN_DATE = "2024-12-31"
+
+COUNTRIES = ["USA", "India", "Canada", "UK", "Germany", "France", "Japan", "Australia", "Mexico", "Brazil"]
+
+# a few Merchants per Txn Category, and the typical (median) Txn Amount of the category
+CATEGORY_MERCHANTS = {"Child Care": (["KinderCare", "Bright Horizons", "none_given"], 120.0),
+                      "Fuel/ Petrol": (["Shell", "Chevron", "BP", "Exxon"], 45.0),
+                      "Groceries": (["Costco", "Walmart", "Trader Joes", "Whole Foods", "Safeway"], 65.0),
+                      "Health Care/ Medical": (["CVS", "Walgreens", "Kaiser"], 80.0),
+                      "Housing": (["ReMax", "Landlord", "none_given"], 1200.0),
+                      "Insurance": (["Geico", "State Farm", "Allstate"], 110.0),
+                      "Memberships/ Subscriptions": (["Netflix", "Spotify", "Costco", "Gym"], 20.0),
+                      "Other Debt Payments": (["Chase", "Amex", "none_given"], 400.0),
+                      "Personal/ Household": (["Amazon", "Target", "IKEA", "Costco"], 50.0),
+                      "Travel/ Transportation": (["Uber", "Alaska Air", "Lyft", "Amtrak"], 60.0),
+                      "Utilities (Electricity/Water/Gas)": (["PG&E", "City Water", "Comcast"], 150.0)
+                      }
+
+
+def username_for(number):
+    # username of the User with this number - same in the profiles file and the Expense Txns file
+    return "user" + str(number).zfill(7)
+
+
+def generate_profiles(user_count, rng):
+    """
+    Generates User profiles, as the app saves them: a dict of column lists.
+    :return: tuple type - (user_profiles_dict, list of each User's Country)
+    """
+    usernames = [username_for(number) for number in range(1, user_count + 1)]
+    user_countries = list(rng.choice(COUNTRIES, size=user_count, p=[0.5] + [0.5 / 9] * 9))
+
+    user_profiles_dict = {"username": usernames,
+                          "password": [username + "pw" for username in usernames],
+                          "name": ["User " + str(number) for number in range(1, user_count + 1)],
+                          "email": [username + "@example.com" for username in usernames],
+                          "country": user_countries}
+
+    return user_profiles_dict, user_countries
+
+
+def generate_txn_chunk(first_row, chunk_rows, total_rows, user_weights, user_countries, rng):
+    """
+    Generates one chunk of Expense Txns - rows first_row to first_row + chunk_rows of the whole file.
+    Txn Dates go up evenly from FIRST_TXN_DATE to LAST_TXN_DATE over the whole file, so the file is sorted.
+    :return: dataframe type - with column fields of TXN_FIELDS
+    """
+    first_day = np.datetime64(FIRST_TXN_DATE, "D")
+    day_span = (np.datetime64(LAST_TXN_DATE, "D") - first_day).astype(np.int64) + 1
+    rows = np.arange(first_row, first_row + chunk_rows, dtype=np.int64)
+    txn_dates = first_day + rows * day_span // total_rows
+
+    user_numbers = rng.choice(len(user_weights), size=chunk_rows, p=user_weights)
+    categories = rng.integers(0, len(TXN_CATEGORIES), size=chunk_rows)
+
+    # Merchant and typical Amount by Txn Category
+    merchants = np.empty(chunk_rows, dtype=object)
+    median_amounts = np.empty(chunk_rows, dtype=np.float64)
+    for category_number, category in enumerate(TXN_CATEGORIES):
+        in_category = categories == category_number
+        category_merchants, median_amount = CATEGORY_MERCHANTS[category]
+        merchants[in_category] = rng.choice(category_merchants, size=int(in_category.sum()))
+        median_amounts[in_category] = median_amount
+    txn_amounts = np.round(median_amounts * rng.lognormal(0.0, 0.6, size=chunk_rows), 2)
+
+    # most Txns are in the User's own Country
+    txn_countries = np.asarray(user_countries, dtype=object)[user_numbers]
+    abroad = rng.random(chunk_rows) < 0.1
+    txn_countries[abroad] = rng.choice(COUNTRIES, size=int(abroad.sum()))
+
+    return pd.DataFrame({"Username": [username_for(number + 1) for number in user_numbers],
+                         "Txn_Date": np.datetime_as_string(txn_dates),
+                         "Txn_Amount": txn_amounts,
+                         "Txn_Category": np.asarray(TXN_CATEGORIES, dtype=object)[categories],
+                         "MerchantName": merchants,
+                         "Txn_Country": txn_countries})[TXN_FIELDS]
+
+
+def generate_ledger(output_dir, row_count, user_count, seed=0):
+    """
+    Writes a User profiles file and a flat Expense Txns file, with row_count Txns of user_count Users,
+    into output_dir (created if needed). Existing files there are replaced.
+    :return: dict type - {username: number of Txns} of the Users that have Txns
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    user_profiles_dict, user_countries = generate_profiles(user_count, rng)
+    with open(os.path.join(output_dir, FILE_PATH_USERS), "w") as file:
+        json.dump(user_profiles_dict, file)
+
+    # Zipf-like share of Txns per User - User 1 has the most
+    user_weights = 1.0 / np.arange(1, user_count + 1) ** 0.8
+    user_weights /= user_weights.sum()
+
+    txn_counts = np.zeros(user_count, dtype=np.int64)
+    txn_path = os.path.join(output_dir, FILE_PATH_TXN)
+    with open(txn_path, "w", newline="") as file:
+        for first_row in range(0, row_count, CHUNK_ROWS):
+            chunk_rows = min(CHUNK_ROWS, row_count - first_row)
+            chunk_df = generate_txn_chunk(first_row, chunk_rows, row_count, user_weights, user_countries, rng)
+            chunk_df.to_csv(file, index=False, header=(first_row == 0))
+            txn_counts += np.bincount(chunk_df["Username"].str[4:].astype(int) - 1, minlength=user_count)
+
+    return {username_for(number + 1): int(count) for number, count in enumerate(txn_counts) if count > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic data directory for the Expense tracker app.")
+    parser.add_argument("output_dir", help="directory to write the data files into")
+    parser.add_argument("--rows", type=int, default=100_000, help="number of Expense Txns (default 100000)")
+    parser.add_argument("--users", type=int, default=100, help="number of Users (default 100)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, for the same data every time (default 0)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    txn_counts = generate_ledger(args.output_dir, args.rows, args.users, args.seed)
+
+    print(json.dumps({"output_dir": args.output_dir,
+                      "rows": args.rows,
+                      "users": args.users,
+                      "users_with_txns": len(txn_counts),
+                      "most_txns_per_user": max(txn_counts.values(), default=0),
+                      "seconds": round(time.perf_counter() - start, 1)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
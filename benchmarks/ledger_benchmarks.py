@@ -0,0 +1,233 @@
+"""
+File name: benchmarks/ledger_benchmarks.py
+------------------------------------------
+Times the storage and report functions of the Expense tracker app on a synthetic data directory
+(see generate_ledger.py), for the User with the most Txns and for a typical User:
+fetch_user_profiles, fetch_user_expenses (from file, and from the ledger cache), last 10 Txns,
+Date range query, save_expense_entry_to_file, update_expense_entry_in_file, the Summary reports and
+spend cube queries (roll-up by month, drill-down to Merchants of a month and category) -
+and the memory held by the Expense Txns dataframe, in MB per million rows.
+
+Run from the repository root, e.g.:
+python benchmarks/ledger_benchmarks.py --rows 1000000 --users 1000 --output results.json
+python benchmarks/ledger_benchmarks.py --rows 1000000 --users 1000 --compare results.json
+With --compare, each median is compared with the same benchmark in an earlier results file,
+and the exit status is 1 if any of them is more than --max-slowdown times slower.
+"""
+
+import argparse     # for the command-line options
+import atexit       # to remove the data directory at exit
+import contextlib   # to hide messages printed by the app while timing
+import json         # to print/ save/ compare the results
+import os           # for file paths and environment variables
+import shutil       # to remove the data directory afterwards
+import statistics   # median of several runs
+import subprocess   # to read the git version of the app
+import sys          # to find the app module
+import tempfile     # data directory for the run
+import time         # to time each call
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def app_version():
+    # git commit of the app being measured, to tell results files apart
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def time_calls(function, repeat, before_each=None):
+    """
+    Calls function() repeat times, and times each call. Messages printed by the app are hidden.
+    params: function - to time, called with No arguments
+            repeat - number of calls
+            before_each - called (untimed) before each call, e.g. to empty the ledger cache. None for nothing.
+    :return: dict type - median, min and max time of a call in ms
+    """
+    times_ms = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            if before_each is not None:
+                before_each()
+            start = time.perf_counter()
+            function()
+            times_ms.append((time.perf_counter() - start) * 1000)
+
+    return {"median_ms": round(statistics.median(times_ms), 3),
+            "min_ms": round(min(times_ms), 3),
+            "max_ms": round(max(times_ms), 3)}
+
+
+def run_user_benchmarks(app, username, repeat):
+    """
+    Times the storage and report functions for one User.
+    :return: dict type - {benchmark name: timings (see time_calls())}
+    """
+    user_expenses_df = app.fetch_user_expenses(username)
+    last_date = user_expenses_df["Txn_Date"].iloc[-1]
+    year_month = last_date[:7]
+    month_start = year_month + "-01"
+    year_start = last_date[:4] + "-01-01"
+    txn_id = user_expenses_df.index[user_expenses_df.shape[0] // 2]
+    txn_to_update = user_expenses_df.loc[txn_id]
+
+    def empty_cache():
+        app.invalidate_ledger_cache(username)
+
+    def update_txn():
+        # Txn amounts are in minor units (cents) - add 1.00
+        expense_entry_list = [username, txn_to_update["Txn_Date"], int(txn_to_update["Txn_Amount"]) + 100,
+                              txn_to_update["Txn_Category"], txn_to_update["MerchantName"],
+                              txn_to_update["Txn_Country"]]
+        app.update_expense_entry_in_file(expense_entry_list, txn_id)
+
+    results = {"txn_count": int(user_expenses_df.shape[0])}
+    results["fetch_user_expenses_from_file"] = time_calls(lambda: app.fetch_user_expenses(username), repeat,
+                                                          before_each=empty_cache)
+    results["fetch_user_expenses_cached"] = time_calls(lambda: app.fetch_user_expenses(username), repeat)
+    results["fetch_last_10_txns"] = time_calls(lambda: app.fetch_user_last_txns(username, 10), repeat)
+    results["daterange_query_month"] = time_calls(
+        lambda: app.fetch_user_expenses_by_daterange(username, month_start, last_date), repeat)
+    results["daterange_query_year"] = time_calls(
+        lambda: app.fetch_user_expenses_by_daterange(username, year_start, last_date), repeat)
+    results["summary_report_month"] = time_calls(lambda: app.fetch_expense_summary_month(username, year_month),
+                                                 repeat)
+    results["summary_report_daterange"] = time_calls(
+        lambda: app.fetch_expense_summary_daterange(username, year_start, last_date), repeat)
+    results["spend_cube_by_month"] = time_calls(lambda: app.fetch_spend_cube(username, ["Year_Month"]), repeat)
+    results["spend_cube_drill_down"] = time_calls(
+        lambda: app.fetch_spend_cube(username, ["MerchantName"],
+                                     {"Year_Month": year_month, "Txn_Category": txn_to_update["Txn_Category"]}),
+        repeat)
+    results["save_expense_entry_to_file"] = time_calls(
+        lambda: app.save_expense_entry_to_file([username, last_date, 1250, app.TXN_CATEGORIES[2], "Bench", "USA"]),
+        repeat)
+    results["update_expense_entry_in_file"] = time_calls(update_txn, repeat)
+
+    return results
+
+
+def frame_memory(app, username):
+    """
+    Memory held by the user's Expense Txns dataframe, as the app keeps it (compact column types) and with
+    every text column field as Python strings (as pd.read_csv() gives them), in MB per million rows.
+    :return: dict type - {"compact": MB, "text": MB}
+    """
+    user_expenses_df = app.fetch_user_expenses(username)
+    text_df = user_expenses_df.astype({field: object for field in app.CATEGORY_FIELDS})
+    per_million_rows = 1_000_000 / max(user_expenses_df.shape[0], 1) / (1024 * 1024)
+
+    return {"compact": round(user_expenses_df.memory_usage(deep=True).sum() * per_million_rows, 1),
+            "text": round(text_df.memory_usage(deep=True).sum() * per_million_rows, 1)}
+
+
+def compare_results(results, baseline, max_slowdown):
+    """
+    Compares the medians of this run with the same benchmarks in an earlier results file.
+    :return: tuple type - (list of comparison dicts, list of names of benchmarks slower than max_slowdown)
+    """
+    comparisons = []
+    regressions = []
+    for user_kind, user_results in results["users"].items():
+        for name, timings in user_results.items():
+            baseline_timings = baseline.get("users", {}).get(user_kind, {}).get(name)
+            if not isinstance(timings, dict) or not isinstance(baseline_timings, dict):
+                continue
+            ratio = timings["median_ms"] / max(baseline_timings["median_ms"], 0.001)
+            comparisons.append({"benchmark": user_kind + "/" + name,
+                                "baseline_median_ms": baseline_timings["median_ms"],
+                                "median_ms": timings["median_ms"],
+                                "ratio": round(ratio, 2)})
+            if ratio > max_slowdown:
+                regressions.append(user_kind + "/" + name)
+
+    return comparisons, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Expense tracker storage and report functions.")
+    parser.add_argument("--rows", type=int, default=100_000, help="number of Expense Txns (default 100000)")
+    parser.add_argument("--users", type=int, default=100, help="number of Users (default 100)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic data (default 0)")
+    parser.add_argument("--repeat", type=int, default=5, help="calls timed per benchmark (default 5)")
+    parser.add_argument("--backend", choices=["files", "sqlite"], default="files", help="storage backend")
+    parser.add_argument("--format", choices=["csv", "npy"], default="csv", help="data file format ('files' only)")
+    parser.add_argument("--data-dir", help="keep the generated data in this directory (default: a temporary one)")
+    parser.add_argument("--output", help="also save the results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON file to compare with")
+    parser.add_argument("--max-slowdown", type=float, default=1.25,
+                        help="with --compare, fail if a median is this many times slower (default 1.25)")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="expense_tracker_bench_"))
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+    if args.data_dir is None:
+        # registered before the app is imported, so it runs after the app's own exit handlers have finished
+        atexit.register(shutil.rmtree, data_dir, True)
+
+    # the app reads its settings from the environment when it is imported
+    os.environ["EXPENSE_TRACKER_BACKEND"] = args.backend
+    os.environ["EXPENSE_TRACKER_LEDGER_FORMAT"] = args.format
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from generate_ledger import generate_ledger
+
+    start = time.perf_counter()
+    txn_counts = generate_ledger(data_dir, args.rows, args.users, args.seed)
+    generate_seconds = time.perf_counter() - start
+
+    # the app finds its data files in the current directory - which stays the data directory until exit,
+    # as background journal compaction may still be writing there
+    os.chdir(data_dir)
+    import expense_tracker_final as app
+
+    setup_ms = {}
+    start = time.perf_counter()
+    app.ensure_partitioned_ledger()  # convert the flat file to per-user shards, as on first run
+    setup_ms["migrate_to_shards"] = round((time.perf_counter() - start) * 1000, 1)
+    if args.backend == "sqlite":
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            app.import_files_into_sqlite()
+        setup_ms["import_sqlite"] = round((time.perf_counter() - start) * 1000, 1)
+
+    # User with the most Txns, and a User with a typical number of Txns
+    usernames_by_count = sorted(txn_counts, key=txn_counts.get, reverse=True)
+    users = {"heaviest_user": usernames_by_count[0],
+             "typical_user": usernames_by_count[len(usernames_by_count) // 2]}
+
+    results = {"app_version": app_version(),
+               "python": sys.version.split()[0],
+               "params": {"rows": args.rows, "users": args.users, "seed": args.seed, "repeat": args.repeat,
+                          "backend": args.backend, "format": args.format},
+               "generate_seconds": round(generate_seconds, 1),
+               "setup_ms": setup_ms,
+               "fetch_user_profiles": time_calls(app.fetch_user_profiles, args.repeat),
+               "users": {}}
+    for user_kind, username in users.items():
+        results["users"][user_kind] = run_user_benchmarks(app, username, args.repeat)
+    results["memory_mb_per_million_rows"] = frame_memory(app, users["heaviest_user"])
+    results["lock_contention"] = app.lock_contention_stats()
+
+    exit_status = 0
+    if baseline is not None:
+        results["comparison"], results["regressions"] = compare_results(results, baseline, args.max_slowdown)
+        exit_status = 1 if results["regressions"] else 0
+
+    print(json.dumps(results, indent=2))
+    if output_path:
+        with open(output_path, "w") as file:
+            json.dump(results, file, indent=2)
+
+    return exit_status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+File name: benchmarks/startup_time.py
+-------------------------------------
+Measures how quickly the Expense tracker app starts up:
+1) import time of expense_tracker_final, with the modules slowest to import (python -X importtime)
+2) time from starting the app until the Login menu prompt is shown - target is under 100 ms
+
+Run from the repository root:
+python benchmarks/startup_time.py [--runs N] [--output results.json]
+Exits with status 1 if the median time to the first prompt is over the target.
+"""
+
+import argparse     # for the command-line options
+import json         # to print/ save the results
+import os           # for file paths
+import statistics   # median of several runs
+import subprocess   # to start the app in a fresh Python process
+import sys          # path of the running Python interpreter
+import time         # to time the start-up
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(REPO_DIR, "expense_tracker_final.py")
+
+FIRST_PROMPT = "Enter your choice here: "  # Login menu prompt
+TARGET_MS = 100
+
+
+def measure_import_time():
+    """
+    Imports the app module in a fresh process with 'python -X importtime'.
+    :return: tuple type - (total import time of the app module in ms, list of (module, self time in ms),
+             slowest 10 modules first)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import expense_tracker_final"],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+
+    # lines are: "import time: <self us> | <cumulative us> | <module name>"
+    modules = []
+    total_ms = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module_name = line[len("import time:"):].split("|")
+        modules.append((module_name.strip(), int(self_us) / 1000))
+        if module_name.strip() == "expense_tracker_final":
+            total_ms = int(cumulative_us) / 1000
+
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return total_ms, modules[:10]
+
+
+def measure_time_to_first_prompt():
+    """
+    Starts the app, and waits for the Login menu prompt on its output.
+    :return: float type - time in ms from starting the process to the first prompt
+    """
+    start = time.perf_counter()
+    app = subprocess.Popen([sys.executable, "-u", APP_FILE], cwd=REPO_DIR, stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = b""
+    try:
+        while FIRST_PROMPT.encode() not in output:
+            data = app.stdout.read1(4096)
+            if not data:  # app exited before showing the prompt
+                raise RuntimeError("app exited before the first prompt:\n" + output.decode(errors="replace"))
+            output += data
+        return (time.perf_counter() - start) * 1000
+    finally:
+        app.kill()
+        app.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure start-up time of the Expense tracker app.")
+    parser.add_argument("--runs", type=int, default=5, help="number of app starts to time (default 5)")
+    parser.add_argument("--output", help="also save the results to this JSON file")
+    args = parser.parse_args()
+
+    import_ms, slowest_modules = measure_import_time()
+    prompt_times = [measure_time_to_first_prompt() for _ in range(args.runs)]
+
+    results = {"import_time_ms": round(import_ms, 1),
+               "slowest_imports_ms": {name: round(self_ms, 1) for name, self_ms in slowest_modules},
+               "first_prompt_ms": [round(prompt_ms, 1) for prompt_ms in prompt_times],
+               "first_prompt_median_ms": round(statistics.median(prompt_times), 1),
+               "target_ms": TARGET_MS}
+    results["within_target"] = results["first_prompt_median_ms"] <= TARGET_MS
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    return 0 if results["within_target"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
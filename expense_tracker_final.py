@@ -13,20 +13,418 @@ This program works as a console-based Expense tracker application, allowing a Us
 # VERSION V1.0
 # coded by - 'Kunal', for Code in Place 2024 final project submission
 
-import pandas as pd             # for DataFrames
+import importlib.util           # to import pandas/ numpy only when first used (see lazy_import())
 import re                       # to check for valid email expressions
 import os                       # to check for file size, empty or nom-empty, etc.
 import sys                      # used in password masking helper function
-import msvcrt                   # used getch() in password masking
+import argparse                 # for the command-line commands (add, list, edit, delete, bulk, report, ...)
+import contextlib               # to send messages to stderr, while a command prints its JSON result
+try:
+    import msvcrt               # used getch() in password masking, on Windows
+except ImportError:
+    msvcrt = None
+    import termios              # on Linux/ macOS, to read password key presses without showing them
+    import tty
+    import fcntl                # on Linux/ macOS, to lock data files shared by several app sessions
+import atexit                   # to save lock contention stats when the program exits
 import json                     # to read/write dictionary into text files and vice versa (User Profiles)
+import sqlite3                  # for the optional SQLite storage engine
+import csv                      # to append single Expense Txn rows to the journal file
+import threading                # to compact the Expense journal in the background
+import random                   # to keep a random sample of call timings (see record_call_timing())
+import functools                # to wrap the timed storage/ report functions (see timed())
 import time                     # for time.sleep()
+import shutil                   # to move a fully migrated shards directory into place
+import tempfile                 # for the copy of a data file that an export streams from
+from urllib.parse import quote, unquote  # to turn a username into a safe directory name and back
+from collections import OrderedDict  # to keep the ledger cache in least-recently-used order
 from datetime import datetime   # to retrieve current date / time
 from datetime import timedelta  # to increment/decrement Date by N number of days
-from tabulate import tabulate   # for tablular data display and formatting
+
+
+def lazy_import(module_name):
+    """
+    Imports a module lazily - it is actually loaded the first time one of its attributes is used.
+    pandas and numpy take several hundred milliseconds to import, and are not needed to show the Login screen.
+    :param module_name: string type - name of the module to import
+    :return: module type - the module (loaded already, if it was imported before)
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    spec = importlib.util.find_spec(module_name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+pd = lazy_import("pandas")      # for DataFrames
+np = lazy_import("numpy")       # for the sorted Txn Date index arrays
+
+
+def tabulate(*args, **kwargs):
+    # tabular data display and formatting - the 'tabulate' package is imported on first use, as it is slow to import
+    import tabulate as tabulate_package
+    return tabulate_package.tabulate(*args, **kwargs)
+
+# storage engine for Expense Txns and User profiles:
+# "files" - csv/JSON text files (default), "sqlite" - a single SQLite database file
+STORAGE_BACKEND = os.environ.get("EXPENSE_TRACKER_BACKEND", "files")
 
 # define File path constants for easy access to reading/writing files in database
 FILE_PATH_USERS = "user_profiles_data.txt"  # txt file with User profiles in JSON format (dictionary)
-FILE_PATH_TXN = "user_expenses_data.txt"  # csv format file with Expense Txn records for ALl Users
+FILE_PATH_TXN = "user_expenses_data.txt"  # legacy csv format file with Expense Txn records for ALl Users
+FILE_PATH_TXN_JOURNAL = "user_expenses_journal.txt"  # legacy append-only journal of New Txns for All Users
+DIR_PATH_TXN_SHARDS = "user_expenses_shards"  # one sub-directory per User, with that User's Expense Txns only
+FILE_PATH_DB = "expense_tracker.db"  # SQLite database, used when STORAGE_BACKEND is "sqlite"
+
+# on-disk format of each User's sorted data file, used when it is (re)written:
+# "csv" - text file (default), "npy" - one memory-mapped NumPy binary file per column field, fast to load
+LEDGER_FORMAT = os.environ.get("EXPENSE_TRACKER_LEDGER_FORMAT", "csv")
+
+# file names inside each User's shard directory
+SHARD_DATA_FILE = "data.txt"  # csv format, Expense Txn records sorted by Txn_Date
+SHARD_COLUMNS_FILE = "data.columns.json"  # "npy" format - lists the NumPy column files of the sorted data
+SHARD_SORTED_FILE = "data.sorted.json"  # "csv" format - modification time and size of data file when last sorted
+SHARD_JOURNAL_FILE = "journal.txt"  # csv format, append-only journal of New Txns, not yet sorted
+SHARD_ROLLUP_FILE = "rollups.json"  # JSON format, monthly per-category totals for the Expense Summary reports
+SHARD_CUBE_FILE = "cube.json"  # JSON format, spend cube cells for the Spend Breakdown report
+
+# column fields of an Expense Txn entry, in file order
+TXN_FIELDS = ["Username", "Txn_Date", "Txn_Amount", "Txn_Category", "MerchantName", "Txn_Country"]
+
+# every Expense Txn also has a Txn_ID that never changes, saved as the last column field of the data files.
+# It is the row index of the user's Txns dataframe, so a Txn is found by its ID with a hash lookup
+# (see update_expense_entry_in_file() and remove_expense_entry_from_file())
+TXN_ID_FIELD = "Txn_ID"
+LEDGER_FIELDS = TXN_FIELDS + [TXN_ID_FIELD]
+
+# in memory, these column fields are held as pandas categoricals (see compact_expense_dtypes()) - a user's Txns
+# have few distinct values of each, so every row holds a small integer code instead of its own Python string.
+# Txn_Amount is held as int64, Txn_ID as int64, and the Date index (txn_days) holds Txn_Date as int32 epoch days
+CATEGORY_FIELDS = ["Username", "Txn_Date", "Txn_Category", "MerchantName", "Txn_Country"]
+
+# Txn_Amount is saved (in memory, in the data files and in the database) as a whole number of the currency's
+# minor unit - e.g. 1250 cents for 12.50 dollars - so sums are exact. It is shown in currency units on screen.
+# number of decimal places of each currency's minor unit - any other currency has 2
+CURRENCY_DECIMALS = {"USD": 2, "EUR": 2, "GBP": 2, "INR": 2, "CAD": 2, "AUD": 2, "MXN": 2, "BRL": 2,
+                     "JPY": 0, "KRW": 0, "BHD": 3, "KWD": 3}
+# currency of the data directory - saved to FILE_PATH_CURRENCY on first run, from EXPENSE_TRACKER_CURRENCY,
+# and fixed from then on: the amounts already saved keep their scale (see ledger_currency())
+FILE_PATH_CURRENCY = "currency.json"
+NEW_LEDGER_CURRENCY = os.environ.get("EXPENSE_TRACKER_CURRENCY", "USD").upper()
+currency_settings = None
+# written once the Txn amounts in the shard files are All in minor units (see convert_amounts_to_minor_units())
+FILE_PATH_SHARDS_AMOUNTS = DIR_PATH_TXN_SHARDS + ".amounts.json"
+# text of a valid amount in currency units - up to 15 digits, and an optional decimal part
+AMOUNT_PATTERN = r"([-+]?)(\d{0,15})(?:\.(\d*))?"
+
+# dimensions of the spend cube (see fetch_spend_cube()), in drill-down order - each User's cube is in their own shard,
+# with the totals of their Expense Txns for each (year-month, Txn_Category, Txn_Country, MerchantName)
+CUBE_DIMENSIONS = ["Year_Month", "Txn_Category", "Txn_Country", "MerchantName"]
+CUBE_DIMENSION_NAMES = {"Year_Month": "Month", "Txn_Category": "Category", "Txn_Country": "Country",
+                        "MerchantName": "Merchant"}
+# number of months shown as columns in the month-over-month grid of the Spend Breakdown screen
+CUBE_GRID_MONTHS = 6
+
+# once the journal grows past this size (in bytes), it is merged into the sorted data file in the background
+JOURNAL_COMPACT_SIZE = 64 * 1024
+
+# Txn Categories an Expense entry can be saved under, in the order shown in the Categories menu
+TXN_CATEGORIES = ["Child Care",
+                  "Fuel/ Petrol",
+                  "Groceries",
+                  "Health Care/ Medical",
+                  "Housing",
+                  "Insurance",
+                  "Memberships/ Subscriptions",
+                  "Other Debt Payments",
+                  "Personal/ Household",
+                  "Travel/ Transportation",
+                  "Utilities (Electricity/Water/Gas)"
+                  ]
+
+# number of rows read at a time from a bank/ credit-card statement file, by import_statement_file()
+IMPORT_CHUNK_ROWS = 100_000
+
+# number of Expense Txn rows read and written at a time, by export_user_expenses()
+EXPORT_CHUNK_ROWS = 100_000
+
+# number of Expense Txn rows shown on one page of the Date range screens (see display_txns_by_daterange())
+TXN_PAGE_ROWS = 20
+
+# shared by all readers/writers of the Expense shard files in this process,
+# so that a background compaction never runs in the middle of a read or an update
+ledger_lock = threading.RLock()
+compaction_thread = None
+
+# lock files, so that several app sessions (processes) can safely share one data directory - see file_lock()
+SHARD_LOCK_FILE = "lock"  # in each User's shard directory, held while reading/ writing that User's files
+FILE_PATH_USERS_LOCK = FILE_PATH_USERS + ".lock"  # held while updating the User profiles file
+FILE_PATH_SHARDS_LOCK = DIR_PATH_TXN_SHARDS + ".lock"  # held while migrating the legacy flat data file
+FILE_PATH_LOCK_STATS = "lock_stats.jsonl"  # one line of lock contention stats per session that had to wait
+LOCK_TIMEOUT_SECONDS = float(os.environ.get("EXPENSE_TRACKER_LOCK_TIMEOUT", "10"))
+
+# event log - one JSON record per line for every save/ edit/ delete, login, lock timeout and error (see log_event())
+# written by a background thread, and rotated once it reaches EVENT_LOG_MAX_BYTES ("event_logs.jsonl.1", ...)
+FILE_PATH_EVENT_LOG = "event_logs.jsonl"
+EVENT_LOG_MAX_BYTES = 1024 * 1024
+EVENT_LOG_BACKUPS = 3  # number of rotated files kept
+EVENT_LOG_LEVEL = os.environ.get("EXPENSE_TRACKER_LOG_LEVEL", "INFO").upper()  # DEBUG, INFO, WARNING or ERROR
+EVENT_LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}  # same numbers as the logging package
+event_logger = None
+event_logger_lock = threading.Lock()  # so that only one thread sets up the event log
+
+# lock files held by this process: lock file path -> open lock file
+held_file_locks = {}
+
+# lock contention metric for this process - see lock_contention_stats()
+lock_stats = {"acquired": 0, "contended": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+# in-process cache of each User's parsed Expense Txns, so that menu screens don't re-read the same files
+# username -> (shard_version, ledger_df, txn_days, size in bytes), least recently used first
+# txn_days is the Date index - Txn_Date of each row of ledger_df as epoch days, in the same (sorted) order
+LEDGER_CACHE_MAX_MB = 64
+ledger_cache = OrderedDict()
+ledger_cache_bytes = 0
+
+# tables and indexes of the SQLite database
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    Username TEXT NOT NULL,
+    Txn_Date TEXT NOT NULL,
+    Txn_Amount INTEGER NOT NULL,
+    Txn_Category TEXT NOT NULL,
+    MerchantName TEXT NOT NULL,
+    Txn_Country TEXT NOT NULL,
+    Txn_ID INTEGER
+);
+CREATE INDEX IF NOT EXISTS expenses_username_txn_date ON expenses (Username, Txn_Date);
+CREATE TABLE IF NOT EXISTS user_profiles (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    country TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_profiles_email ON user_profiles (email);
+"""
+db_connection = None
+
+# in-process store of All User profiles, with hash indexes on username and email (value -> position in the lists)
+# loaded once, and re-loaded only when the profiles file changes on disk ("version" is its mtime and size)
+profile_store = {"version": "not loaded",
+                 "profiles": None,
+                 "username_index": {},
+                 "email_index": {}
+                 }
+
+# opt-in timing of the storage and report functions (see timed()): set the environment variable
+# EXPENSE_TRACKER_METRICS to a file path, and latency histograms are saved there when the program exits -
+# in Prometheus text format if the path ends with ".prom" or ".txt", as a JSON snapshot otherwise
+METRICS_FILE = os.environ.get("EXPENSE_TRACKER_METRICS")
+
+# upper bounds (in ms) of the latency histogram buckets; the last bucket has No upper bound
+METRICS_BUCKETS_MS = [0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# number of call timings kept per function, to work out p50/ p95/ p99 - so memory use stays the same,
+# however many calls there are. Percentiles are exact up to this many calls, and estimated from a sample after that
+METRICS_SAMPLE_SIZE = 1000
+
+# call timings of this process: function name ->
+# {"count": number of calls, "total_ms", "max_ms", "samples": random sample of ms, "buckets": count per bucket}
+call_timings = {}
+call_timings_lock = threading.Lock()
+
+
+def timed(function):
+    """
+    Decorator for the storage and report functions: while metrics are on (METRICS_FILE is set), each call of
+    the function is timed and added to its latency histogram. While off, the function is left as it is.
+    :param function: function type - to time
+    :return: function type - the timed function (or the same function, if metrics are off)
+    """
+    if not METRICS_FILE:
+        return function
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record_call_timing(function.__name__, (time.perf_counter() - start) * 1000)
+
+    return timed_function
+
+
+def record_call_timing(function_name, elapsed_ms):
+    # add one call of function_name, that took elapsed_ms, to its latency histogram
+    with call_timings_lock:
+        timings = call_timings.setdefault(function_name,
+                                          {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "samples": [],
+                                           "buckets": [0] * (len(METRICS_BUCKETS_MS) + 1)})
+        timings["count"] += 1
+        timings["total_ms"] += elapsed_ms
+        timings["max_ms"] = max(timings["max_ms"], elapsed_ms)
+
+        # reservoir sampling: once METRICS_SAMPLE_SIZE calls are kept, the N-th call replaces a random kept one
+        # with chance METRICS_SAMPLE_SIZE / N - so every call is equally likely to be in the sample
+        if len(timings["samples"]) < METRICS_SAMPLE_SIZE:
+            timings["samples"].append(elapsed_ms)
+        else:
+            position = random.randrange(timings["count"])
+            if position < METRICS_SAMPLE_SIZE:
+                timings["samples"][position] = elapsed_ms
+
+        bucket = 0
+        while bucket < len(METRICS_BUCKETS_MS) and elapsed_ms > METRICS_BUCKETS_MS[bucket]:
+            bucket += 1
+        timings["buckets"][bucket] += 1
+
+
+def percentile(sorted_samples, fraction):
+    # nearest-rank percentile of a sorted list, e.g. fraction 0.95 for p95
+    rank = int(-(-len(sorted_samples) * fraction // 1))  # len * fraction, rounded up
+    return sorted_samples[max(rank, 1) - 1]
+
+
+def call_timing_stats():
+    """
+    Latency stats of each timed function for this process: number of calls, total time,
+    p50/ p95/ p99 (of a sample of up to METRICS_SAMPLE_SIZE calls) and longest call in ms,
+    and the number of calls in each histogram bucket.
+    :return: dict type - {function name: stats dict}
+    """
+    stats = {}
+    with call_timings_lock:
+        for function_name, timings in sorted(call_timings.items()):
+            samples = sorted(timings["samples"])
+            stats[function_name] = {"count": timings["count"],
+                                    "total_ms": round(timings["total_ms"], 3),
+                                    "p50_ms": round(percentile(samples, 0.50), 3),
+                                    "p95_ms": round(percentile(samples, 0.95), 3),
+                                    "p99_ms": round(percentile(samples, 0.99), 3),
+                                    "max_ms": round(timings["max_ms"], 3),
+                                    "buckets": dict(zip([str(bound) for bound in METRICS_BUCKETS_MS] + ["+Inf"],
+                                                        timings["buckets"]))
+                                    }
+
+    return stats
+
+
+def format_prometheus_metrics(stats, lock_stats_dict):
+    """
+    Formats the call timing stats and lock contention stats in the Prometheus text exposition format:
+    a histogram "expense_tracker_call_duration_seconds" (label: function), with its p50/ p95/ p99 as a summary.
+    :return: string type - contents of the metrics file
+    """
+    lines = ["# HELP expense_tracker_call_duration_seconds Time taken by the storage and report functions.",
+             "# TYPE expense_tracker_call_duration_seconds histogram"]
+    for function_name, function_stats in stats.items():
+        label = 'function="' + function_name + '"'
+        cumulative_count = 0
+        for bound, count in function_stats["buckets"].items():
+            cumulative_count += count
+            le = bound if bound == "+Inf" else repr(float(bound) / 1000)
+            lines.append('expense_tracker_call_duration_seconds_bucket{' + label + ',le="' + le + '"} '
+                         + str(cumulative_count))
+        lines.append("expense_tracker_call_duration_seconds_sum{" + label + "} "
+                     + repr(function_stats["total_ms"] / 1000))
+        lines.append("expense_tracker_call_duration_seconds_count{" + label + "} " + str(function_stats["count"]))
+
+    lines += ["# HELP expense_tracker_call_duration_quantile_seconds p50/ p95/ p99 of the call durations.",
+              "# TYPE expense_tracker_call_duration_quantile_seconds gauge"]
+    for function_name, function_stats in stats.items():
+        for quantile, stat in [("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")]:
+            value_ms = function_stats[stat]
+            lines.append('expense_tracker_call_duration_quantile_seconds{function="' + function_name
+                         + '",quantile="' + quantile + '"} ' + repr(value_ms / 1000))
+
+    for name, value in lock_stats_dict.items():
+        metric = "expense_tracker_lock_" + name
+        lines += ["# TYPE " + metric + " gauge", metric + " " + repr(value)]
+
+    return "\n".join(lines) + "\n"
+
+
+def save_metrics():
+    # at program exit, save this session's call timings (and lock stats) to METRICS_FILE - if metrics are on
+    if not METRICS_FILE:
+        return
+
+    stats = call_timing_stats()
+    if METRICS_FILE.endswith((".prom", ".txt")):
+        contents = format_prometheus_metrics(stats, lock_contention_stats())
+    else:
+        contents = json.dumps({"time": datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+                               "pid": os.getpid(),
+                               "functions": stats,
+                               "locks": lock_contention_stats()}, indent=2) + "\n"
+    replace_file(METRICS_FILE, lambda file: file.write(contents))
+
+
+atexit.register(save_metrics)
+
+
+def get_event_logger():
+    """
+    Sets up the event log, the first time an event is logged: records are put on a queue, and a background
+    thread (logging.handlers.QueueListener) writes them to FILE_PATH_EVENT_LOG - so logging an event never waits
+    for the disk. The file is rotated by size (logging.handlers.RotatingFileHandler).
+    The logging package is only imported here, as it is not needed to show the Login screen.
+    :return: logging.Logger - the event logger
+    """
+    global event_logger
+
+    with event_logger_lock:
+        if event_logger is not None:
+            return event_logger
+
+        import logging.handlers
+        import queue
+
+        file_handler = logging.handlers.RotatingFileHandler(FILE_PATH_EVENT_LOG, maxBytes=EVENT_LOG_MAX_BYTES,
+                                                            backupCount=EVENT_LOG_BACKUPS, delay=True)
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, file_handler)
+        listener.start()
+        atexit.register(listener.stop)  # writes out the events still in the queue at exit
+
+        logger = logging.getLogger("expense_tracker")
+        logger.setLevel(EVENT_LOG_LEVEL)
+        logger.propagate = False
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        event_logger = logger
+
+    return event_logger
+
+
+def log_event(event, level="INFO", error=None, **details):
+    """
+    Logs one event to the event log, as a single line JSON record, e.g.
+    {"time": "2024-06-20 10:15:02.123", "level": "ERROR", "event": "ledger_read_failed", "pid": 4242,
+     "username": "kkk", "error_type": "FileNotFoundError", "error": "...", "filename": "..."}
+    params: event - string type - what happened, e.g. "expense_saved"
+            level - string type - "DEBUG", "INFO", "WARNING" or "ERROR"
+            error - exception that caused the event, if any
+            details - other fields of the record, e.g. username=..., txn_id=...
+    """
+    record = {"time": datetime.today().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+              "level": level,
+              "event": event,
+              "pid": os.getpid()}
+    record.update(details)
+    if error is not None:
+        record["error_type"] = type(error).__name__
+        record["error"] = str(error)
+        if getattr(error, "filename", None) is not None:
+            record["filename"] = error.filename
+
+    get_event_logger().log(EVENT_LOG_LEVELS[level], json.dumps(record, default=str))
 
 
 # data file saved as .txt to retain Date formatting when reading and writing Txn Dates.
@@ -63,6 +461,20 @@ def clear_terminal():
     os.system(cls)
 
 
+def format_menu_table(menu_dict):
+    """
+    Formats a menu dict. as a table, the same as tabulate(menu_dict, headers="keys") -
+    without importing tabulate, so that the menus are shown straight away on startup.
+    :param menu_dict: dict type - 'keys' as column headers, 'values' as lists of column cells
+    :return: string type - the table
+    """
+    # each column is as wide as its widest cell, and at least 2 spaces wider than its header
+    widths = [max([len(key) + 2] + [len(cell) for cell in values]) for key, values in menu_dict.items()]
+
+    rows = [list(menu_dict.keys()), ["-" * width for width in widths]] + [list(row) for row in zip(*menu_dict.values())]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+
 def menu_options_user_login():
     # Display User Login options menu on the landing page of the app.
 
@@ -78,7 +490,7 @@ def menu_options_user_login():
                  op_2: ["Press '2' and Enter"]
                  }
     # display menu dict. in tabular format
-    print(tabulate(menu_dict, headers="keys"))
+    print(format_menu_table(menu_dict))
 
 
 def menu_options_user_dashboard():
@@ -104,26 +516,15 @@ def menu_options_user_dashboard():
                  op_6: ["Press '6' and Enter"]
                  }
     # display menu dict. in tabular format
-    print(tabulate(menu_dict, headers="keys"))
+    print(format_menu_table(menu_dict))
 
 
 def menu_options_txn_category():
     # Display Txn Category menu options for New Expense entry
     # return: menu_dict
 
-    # create a Dictionary: 'keys' as menu option texts, 'values' as corresponding Categories
-    menu_dict = {"1": "Child Care",
-                 "2": "Fuel/ Petrol",
-                 "3": "Groceries",
-                 "4": "Health Care/ Medical",
-                 "5": "Housing",
-                 "6": "Insurance",
-                 "7": "Memberships/ Subscriptions",
-                 "8": "Other Debt Payments",
-                 "9": "Personal/ Household",
-                 "10": "Travel/ Transportation",
-                 "11": "Utilities (Electricity/Water/Gas)"
-                 }
+    # create a Dictionary: 'keys' as menu option texts ("1", "2", ...), 'values' as corresponding Categories
+    menu_dict = {str(option): category for option, category in enumerate(TXN_CATEGORIES, start=1)}
 
     # print menu to user
     # split display in half for clear formatted view (use dictionary length)
@@ -158,7 +559,7 @@ def menu_options_modify_txn():
                  op_6: ["Press '6'"]
                  }
     # display menu dict. in tabular format
-    print(tabulate(menu_dict, headers="keys"))
+    print(format_menu_table(menu_dict))
 
 
 def menu_options_expense_summary():
@@ -169,14 +570,16 @@ def menu_options_expense_summary():
     op_2 = "View Summary for Previous Month"
     op_3 = "View Summary by Date Range"
     op_4 = "View Graphical Summary of Expenses"
+    op_5 = "View Spend Breakdown (drill down)"
 
     menu_dict = {op_1: ["Press '1' and Enter"],
                  op_2: ["Press '2' and Enter"],
                  op_3: ["Press '3' and Enter"],
-                 op_4: ["Press '4' and Enter"]
+                 op_4: ["Press '4' and Enter"],
+                 op_5: ["Press '5' and Enter"]
                  }
     # display menu dict. in tabular format
-    print(tabulate(menu_dict, headers="keys"))
+    print(format_menu_table(menu_dict))
 
 
 def valid_username(username):
@@ -311,6 +714,92 @@ def valid_txn_date(date_input):
         return False
 
 
+def ledger_currency():
+    """
+    Returns the currency of the data directory, and the number of decimal places of its minor unit.
+    Read from FILE_PATH_CURRENCY - which is written on first run, with the currency set by the environment
+    variable EXPENSE_TRACKER_CURRENCY (default "USD") - so amounts already saved never change their scale.
+    :return: dict type - e.g. {"currency": "USD", "decimals": 2}
+    """
+    global currency_settings
+
+    if currency_settings is None:
+        try:
+            with open(FILE_PATH_CURRENCY, "r") as file:
+                currency_settings = json.load(file)
+        except FileNotFoundError:
+            settings = {"currency": NEW_LEDGER_CURRENCY, "decimals": CURRENCY_DECIMALS.get(NEW_LEDGER_CURRENCY, 2)}
+            replace_file(FILE_PATH_CURRENCY, lambda file: json.dump(settings, file))
+            currency_settings = settings
+
+    return currency_settings
+
+
+def amount_scale():
+    # number of minor units in one unit of the currency - e.g. 100 cents in a dollar
+    return 10 ** ledger_currency()["decimals"]
+
+
+def amount_floatfmt():
+    # float format of amounts in currency units, for tabulate() - e.g. '.2f' for 2 decimal places
+    return "." + str(ledger_currency()["decimals"]) + "f"
+
+
+def parse_amount(amount_input):
+    """
+    Converts an amount in currency units, as text (e.g. "12.5"), to a whole number of minor units (1250).
+    The conversion is exact - digits are read from the text, Not through a float.
+    :param amount_input: string type
+    :return: int type - amount in minor units, or None if not a valid amount for the currency
+             (Not a number, or more decimal places than the currency has)
+    """
+    decimals = ledger_currency()["decimals"]
+    match = re.fullmatch(AMOUNT_PATTERN, amount_input.strip())
+    if match is None:
+        return None
+
+    sign, whole, fraction = match.group(1), match.group(2), match.group(3) or ""
+    if whole + fraction == "" or len(fraction) > decimals:
+        return None
+
+    minor_units = int(whole or "0") * 10 ** decimals + int(fraction.ljust(decimals, "0") or "0")
+    return -minor_units if sign == "-" else minor_units
+
+
+def parse_amounts(amount_inputs):
+    """
+    Same as parse_amount(), for a whole column of amounts at once - e.g. the rows of a statement file.
+    :param amount_inputs: Series of text
+    :return: Series type, of Int64 - amounts in minor units, <NA> where the text is not a valid amount
+    """
+    decimals = ledger_currency()["decimals"]
+    parts = amount_inputs.str.strip().str.extract("^" + AMOUNT_PATTERN + "$").fillna({1: "", 2: ""})
+    valid = parts[0].notna() & (parts[1] + parts[2]).ne("") & parts[2].str.len().le(decimals)
+
+    wholes = pd.to_numeric(parts[1].where(valid & parts[1].ne(""), "0")).astype(np.int64)
+    fractions = pd.to_numeric(parts[2].where(valid, "").str.ljust(decimals, "0").replace("", "0")).astype(np.int64)
+    minor_units = wholes * 10 ** decimals + fractions
+    minor_units = minor_units.where(parts[0].ne("-"), -minor_units)
+
+    return minor_units.astype("Int64").where(valid, pd.NA)
+
+
+def amounts_to_minor_units(amounts):
+    # amounts in currency units, as saved by earlier versions of the app (e.g. 12.5) -> int64 minor units (1250)
+    return np.round(np.asarray(amounts, dtype=np.float64) * amount_scale()).astype(np.int64)
+
+
+def format_amount(minor_units):
+    # amount in minor units (e.g. 1250) -> text in currency units ("12.50"), for display - exact, Not through a float
+    decimals = ledger_currency()["decimals"]
+    whole, fraction = divmod(abs(int(minor_units)), 10 ** decimals)
+    amount_text = ("-" if minor_units < 0 else "") + str(whole)
+    if decimals > 0:
+        amount_text += "." + str(fraction).zfill(decimals)
+
+    return amount_text
+
+
 def user_signup():
     """
     Sets up a New User for the app.
@@ -318,6 +807,7 @@ def user_signup():
     Validation helper functions are called for each data field input.
     After sign up is complete, new user is created in the database with a helper function,
     and program flow moves to user Dashboard display.
+    :return: next screen to show - (screen function, arguments)
     """
     # ---------------
     # NEW USER SIGNUP
@@ -386,17 +876,19 @@ def user_signup():
     if country == "":
         country = "none_given"
 
-    print("\nAwesome! You are all set.")
-    input("Press ENTER and Head straight to Dashboard...")
-
     # save new user data to a list
     new_user = [username, passwd, name, email, country]
 
-    # create user entry in Users DB
-    create_user_in_db(new_user)
+    # create user entry in Users DB - if it couldn't be saved, go back to Login home page
+    if not create_user_in_db(new_user):
+        input("Please press Enter to go back to Login home page...")
+        return login_home_screen, ()
+
+    print("\nAwesome! You are all set.")
+    input("Press ENTER and Head straight to Dashboard...")
 
     # display User dashboard
-    display_main_menu(username)
+    return display_main_menu, (username,)
 
 
 def create_user_in_db(new_user):
@@ -404,84 +896,58 @@ def create_user_in_db(new_user):
     Creates a new user profile entry in the database for this application.
     User profiles database is a text file, for now.
     :param new_user: list type, holds all the user data collected in the user_signup()
+    :return: True if the user was created, else False
     """
     # ---------------------------
     # CREATE NEW USER IN DATABASE
     # ---------------------------
-
-    # handles case - empty file, non-empty file
-    # handles exception - file not found at filepath
+    # handles case - empty file, non-empty file, file not found at filepath (see load_profile_store())
+    # handles exception - profiles locked by another session for too long, or file could not be written
     try:
-        file_size = os.path.getsize(FILE_PATH_USERS)
-
-        # file is empty
-        if file_size == 0:
-
-            # create user_profiles_dict
-            user_profiles_dict = {"username": [],
-                                  "password": [],
-                                  "name": [],
-                                  "email": [],
-                                  "country": []
-                                  }
-
-            # populate New User data to user profiles dict
-            index = 0
-            for key in user_profiles_dict.keys():
-                user_profiles_dict[key].append(new_user[index])
-                index += 1
-
-            # open filepath and write dictionary data to file
-            with open(FILE_PATH_USERS, "w") as file:
-                json.dump(user_profiles_dict, file)
-
-        # file is Not empty
+        if STORAGE_BACKEND == "sqlite":
+            sqlite_create_user(new_user)
         else:
-            with open(FILE_PATH_USERS, "r") as file:  # open file
-                user_profiles_dict = json.load(file)  # load data from file into dictionary
+            # re-load the profiles under the lock, so a user signing up in another session at the same time isn't lost
+            with file_lock(FILE_PATH_USERS_LOCK):
+                store = load_profile_store()
 
-                # populate new user data to user profiles dict
+                # populate New User data to a copy of the user profiles dict - the profile store only changes
+                # once the file is saved
+                user_profiles_dict = {}
                 index = 0
-                for key in user_profiles_dict.keys():
-                    user_profiles_dict[key].append(new_user[index])
+                for key, values in store["profiles"].items():
+                    user_profiles_dict[key] = values + [new_user[index]]
                     index += 1
 
-            with open(FILE_PATH_USERS, "w") as file:  # open file again
-                json.dump(user_profiles_dict, file)  # write updated dictionary to file
-
-    # File not found: log the error, create new file and upload user profiles data
-    except FileNotFoundError as e:
-        error = [e.strerror, e.filename, datetime.today().strftime('%Y-%m-%d %H:%M:%S')]
-
-        with open("error_logs.txt", "a") as logfile:
-            for data in error:
-                logfile.write(f"{data}\n")
-
-        # create user_profiles_dict
-        user_profiles_dict = {"username": [],
-                              "password": [],
-                              "name": [],
-                              "email": [],
-                              "country": []
-                              }
-
-        # populate New User data to user profiles dict
-        index = 0
-        for key in user_profiles_dict.keys():
-            user_profiles_dict[key].append(new_user[index])
-            index += 1
+                # add New User to copies of the username and email indexes
+                position = len(user_profiles_dict["username"]) - 1
+                username_index = dict(store["username_index"])
+                username_index.setdefault(new_user[0], position)
+                email_index = dict(store["email_index"])
+                email_index.setdefault(new_user[3], position)
+
+                # write updated dictionary to file, then switch the profile store to it
+                save_user_profiles(user_profiles_dict)
+                profile_store["username_index"] = username_index
+                profile_store["email_index"] = email_index
+
+    except (TimeoutError, OSError) as error:
+        print("\nSorry! There seems to be some error saving your data. Try again in some time.")
+        log_event("user_create_failed", "ERROR", error, username=new_user[0])
+        return False
 
-        # open filepath and write dictionary data to file
-        with open(FILE_PATH_USERS, "w") as file:
-            json.dump(user_profiles_dict, file)
+    log_event("user_created", username=new_user[0])
+    return True
 
 
+@timed
 def fetch_user_profiles():
     """
     Fetch All User profiles from database - and load data in a dictionary.
     This can now be used in other helper functions to:
     1) fetch user-specific data
     2) fetch column-field specific data
+    Note: other helper functions should use load_profile_store(), which only re-reads the file when it changes.
     :return: user profiles dictionary
     """
 
@@ -491,28 +957,129 @@ def fetch_user_profiles():
 
         return user_profiles_dict  # return user profiles dict to helper function
 
-    except FileNotFoundError as e:
-        error = [e.strerror, e.filename, datetime.today().strftime('%Y-%m-%d %H:%M:%S')]
+    except FileNotFoundError as error:
         print("Sorry! There seems to be some error locating your data. Try again in some time.")
+        log_event("profiles_read_failed", "ERROR", error)
 
-        # log error
-        with open("error_logs.txt", "a") as logfile:
-            for data in error:
-                logfile.write(f"{data}\n")
+
+def profile_file_version():
+    # return modification time and size of the user profiles file, or None if the file doesn't exist
+    try:
+        stat = os.stat(FILE_PATH_USERS)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
 
 
-def fetch_user_name(username):
-    # fetch user's name from user profiles database, for given username
+@timed
+def load_profile_store():
+    """
+    Returns the in-process store of All User profiles, re-loading it from file only if the file has changed.
+    Indexes on username and email map each value to its position in the user profiles lists,
+    so that looking up a user is a single dictionary lookup, however many users there are.
+    An empty or missing file gives a store with No users - a first user sign up creates the file.
+    :return: dict type - profile_store
+    """
+    version = profile_file_version()
+    if version == profile_store["version"]:
+        return profile_store
+
+    user_profiles_dict = None
+    if version is not None and version[1] > 0:
+        user_profiles_dict = fetch_user_profiles()
+
+    if user_profiles_dict is None:  # No users yet
+        user_profiles_dict = {"username": [],
+                              "password": [],
+                              "name": [],
+                              "email": [],
+                              "country": []
+                              }
+
+    profile_store["version"] = version
+    profile_store["profiles"] = user_profiles_dict
+    profile_store["username_index"] = build_profile_index(user_profiles_dict["username"])
+    profile_store["email_index"] = build_profile_index(user_profiles_dict["email"])
+
+    return profile_store
+
+
+def build_profile_index(values):
+    """
+    Builds a hash index for a user profiles list, mapping each value to its position in the list.
+    Like list.index(), the first position wins if a value appears more than once.
+    :param values: list type - usernames or emails, from the user profiles dict
+    :return: dict type - value -> index
+    """
+    index = {}
+    for position, value in enumerate(values):
+        index.setdefault(value, position)
+
+    return index
 
-    # load user profiles
-    user_profiles_dict = fetch_user_profiles()
 
-    # find index of username in the usernames list
-    index = user_profiles_dict["username"].index(username)
+def save_user_profiles(user_profiles_dict):
+    """
+    Writes All User profiles to the profiles file, and marks the profile store as up to date with it,
+    so the file isn't read back in. If the file can't be written, the profile store is left as it was.
+    Caller must update the store's indexes to match, after the save.
+    Caller must hold the User profiles lock (FILE_PATH_USERS_LOCK).
+    :param user_profiles_dict: dict type - All User profiles, as held in the profile store
+    """
+    replace_file(FILE_PATH_USERS, lambda file: json.dump(user_profiles_dict, file))
+
+    profile_store["version"] = profile_file_version()
+    profile_store["profiles"] = user_profiles_dict
+
+
+def find_user_profile(field, value):
+    """
+    Finds a User profile by username or by email.
+    :param field: string type - "username" or "email"
+    :param value: string type - username or email to look for
+    :return: dict type - the user's profile (username, password, name, email, country), or None if not found
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return sqlite_find_user_profile(field, value)
+
+    # load user profiles, and find index of the given value in the usernames or emails index
+    store = load_profile_store()
+    index = store[field + "_index"].get(value)
+    if index is None:
+        return None
+
+    return {key: values[index] for key, values in store["profiles"].items()}
+
+
+def update_user_password(username, passwd):
+    # update user's password in the user profiles database - return True if it was saved, else False
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            sqlite_update_user_password(username, passwd)
+            return True
+
+        # re-load the profiles under the lock, so an update by another session isn't lost
+        with file_lock(FILE_PATH_USERS_LOCK):
+            store = load_profile_store()
+
+            # change a copy of the passwords list - the profile store only changes once the file is saved
+            user_profiles_dict = dict(store["profiles"])
+            user_profiles_dict["password"] = list(user_profiles_dict["password"])
+            user_profiles_dict["password"][store["username_index"][username]] = passwd
 
-    # find 'name' for the given username
-    name = user_profiles_dict["name"][index]
-    return name
+            save_user_profiles(user_profiles_dict)
+
+    except (TimeoutError, OSError) as error:
+        print("\nSorry! There seems to be some error saving your data. Try again in some time.")
+        log_event("password_update_failed", "ERROR", error, username=username)
+        return False
+
+    return True
+
+
+def fetch_user_name(username):
+    # fetch user's name from user profiles database, for given username
+    return find_user_profile("username", username)["name"]
 
 
 def verify_username(username):
@@ -526,17 +1093,8 @@ def verify_username(username):
     :param username: string type - to look for match in user profiles db
     :return: True if username found in db, else False
     """
-    # load user profiles
-    user_profiles_dict = fetch_user_profiles()
-
-    # populate usernames from user profiles dict
-    users = user_profiles_dict["username"]
-
-    # search for given username
-    if username in users:
-        return True
-    else:
-        return False
+    # search for given username in the usernames index
+    return find_user_profile("username", username) is not None
 
 
 def verify_email(email):
@@ -545,33 +1103,19 @@ def verify_email(email):
     :param email: string type - to look for match in user profiles db
     :return: True if email found in db, else False
     """
-    # load user profiles
-    user_profiles_dict = fetch_user_profiles()
-
-    # populate emails from user profiles dict
-    emails = user_profiles_dict["email"]
-
-    # search for given email in emails list
-    if email in emails:
-        return True
-    else:
-        return False
+    # search for given email in the emails index
+    return find_user_profile("email", email) is not None
 
 
 def reset_password(email):
     """
     Allows user to reset their password, after Email verification
     :param email: string type - verified
+    :return: True if the New password was saved, else False
     """
 
-    # load user profiles
-    user_profiles_dict = fetch_user_profiles()
-
-    # find index of user's email in the emails list
-    index = user_profiles_dict["email"].index(email)
-
-    # find username and display it to the user
-    username = user_profiles_dict["username"][index]
+    # find username for user's email and display it to the user
+    username = find_user_profile("email", email)["username"]
     print("Your username is: ", username)
 
     # prompt user to enter a password that matches the given criteria
@@ -583,15 +1127,17 @@ def reset_password(email):
         passwd = input("Please enter New password: ").strip()
 
     # update user's password in the user profiles data
-    user_profiles_dict["password"][index] = passwd
+    if not update_user_password(username, passwd):
+        return False
 
-    with open(FILE_PATH_USERS, "w") as file:
-        json.dump(user_profiles_dict, file)
+    log_event("password_reset", username=username)
+    return True
 
 
 def reset_user_login():
     """
     resets user login/password by setting up a system generated password for the user.
+    :return: next screen to show - (screen function, arguments)
     """
     clear_terminal()
     display_header()
@@ -600,69 +1146,125 @@ def reset_user_login():
     email = input("Please enter your email: ")
 
     if verify_email(email):
-        reset_password(email)  # email authenticated, reset user password for this email
-        print("\n Your password has been updated!")
+        # email authenticated, reset user password for this email
+        if reset_password(email):
+            print("\n Your password has been updated!")
         input("Please press Enter to proceed to Login home page...")
-        main()
     else:
         print("\n Email not found! We do Not have a user registered with this email")
         input("Please press Enter to go back to Login home page...")
-        main()
 
+    return login_home_screen, ()
 
-def fetch_user_expenses(username):
+
+@timed
+def fetch_user_expenses(username, columns=None):
     """
     Fetch Expense Txns from database (csv file) for the give User - and load data into a pandas DateFrame
     This can now be used in other helper functions to:
     1) fetch specific Expense txns
     2) fetch column-field specific data
+    :param columns: list of column fields needed (must include "Txn_Date"), or None for All column fields.
+                    If the user's Txns aren't in the ledger cache, only these columns are read from file.
     :return: dataframe type - user_expenses_df
     """
 
     try:
-        # read csv file and load it into a dataframe
-        user_expenses_df = pd.read_csv(FILE_PATH_TXN)
+        if STORAGE_BACKEND == "sqlite":
+            user_expenses_df = sqlite_fetch_user_expenses(username)
+            return user_expenses_df if columns is None else user_expenses_df[columns]
+
+        if columns is not None:
+            with user_ledger_lock(username):
+                entry = current_cache_entry(username)
+                if entry is None:
+                    # read only the needed column fields of this user's shard, without caching them
+                    return read_user_ledger(username, columns)
 
-        # subset rows with Txn entries for given username only
-        user_expenses_df = user_expenses_df[user_expenses_df["Username"] == username]
+            return entry[1][columns]
+
+        # read this user's shard only - data file and journal - or reuse it from the ledger cache
+        user_expenses_df = fetch_indexed_user_ledger(username)[0]
 
         return user_expenses_df
 
     # csv file not found. Log error details.
-    except Exception:
+    except Exception as error:
+        print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+        log_event("ledger_read_failed", "ERROR", error, username=username, function="fetch_user_expenses")
+        return None
+
+
+@timed
+def fetch_user_last_txns(username, count=10):
+    """
+    Fetch the last Expense Txns by Txn_Date for the given user, without reading All their Txns where possible:
+    the tail of their sorted data file is read backward from the end, and merged with the unsorted journal.
+    Falls back to reading All the user's Txns only if the data file is not known to be sorted.
+    params: username - to fetch Txns for the given username
+            count - number of Txns to fetch
+    :return: dataframe type - up to 'count' Txns, sorted by Txn_Date, or None if data could not be read
+    """
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            return sqlite_fetch_last_txns(username, count)
+
+        ensure_partitioned_ledger()  # before the tail of the data file is read on its own
+        with user_ledger_lock(username):
+            entry = current_cache_entry(username)
+            if entry is not None:
+                return entry[1].iloc[-count:]
+
+            if not shard_data_is_sorted(username):
+                return read_user_ledger(username).iloc[-count:]
+
+            data_df = read_shard_data(username, last_rows=count)
+            journal_df = read_user_journal(username)
+
+            if data_df is None:
+                data_df = journal_df.iloc[0:0]
+
+            # Txns in the journal may be dated anywhere in the data file - merge them in, and keep the last ones
+            last_txns_df = concat_expense_frames([data_df, journal_df], ignore_index=True)
+            last_txns_df = last_txns_df.sort_values("Txn_Date", kind="stable")
+
+            # Txns saved before Txn IDs were added get their IDs from a full read
+            if last_txns_df[TXN_ID_FIELD].isna().any():
+                return read_user_ledger(username).iloc[-count:]
+
+    except Exception as error:
         print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+        log_event("ledger_read_failed", "ERROR", error, username=username, function="fetch_user_last_txns")
         return None
 
+    return index_by_txn_id(last_txns_df.iloc[-count:])
+
 
 def fetch_last_10_txns(username):
     """
     Fetch last 10 Expense txn entries for the given user
     :param username: to fetch Txns for the given username
+    :return: next screen to show - (screen function, arguments)
     """
-    # populate All Expense Txns for this user Only.
-    user_expenses_df = fetch_user_expenses(username)
+    # populate last 10 Expense Txns for this user Only.
+    last_10_txn_df = fetch_user_last_txns(username, 10)
 
     # if there was No Exception reading into data file
-    if user_expenses_df is not None:
-        # get row index of last entry in the dataframe
-        last_index = user_expenses_df.shape[0]
-
+    if last_10_txn_df is not None:
         # check for Number of rows returned, to determine further program flow:
-        if last_index == 0:  # if there are 0 rows returned, user has No Txn Entries in database
+        if last_10_txn_df.shape[0] == 0:  # if there are 0 rows returned, user has No Txn Entries in database
             print("\n\tYou have 0 Txn Entries in our record! ")
 
-        elif last_index > 10:  # use row indexing to filter last 10 txn entries
-            display_last_10_txns(user_expenses_df[last_index - 10:])
-
-        else:  # create a copy of the dataframe
-            display_last_10_txns(user_expenses_df[:])
+        else:
+            display_last_10_txns(last_10_txn_df)
 
     # prompt user to input menu option to continue program control flow
     input("\nPress Enter to go back to Main Menu ->  ")
     # navigate to Dashboard home screen
-    display_main_menu(username)
+    return display_main_menu, (username,)
 
 
+@timed
 def display_last_10_txns(last_10_txn_df):
     """
      Display last 10 Expense txn entries for the given user
@@ -672,10 +1274,12 @@ def display_last_10_txns(last_10_txn_df):
     summary_txn_fields = ["Txn_Date", "Txn_Amount", "MerchantName"]
     # sort Display by Txn_Date, most recent to earlier
     last_10_summary_df = last_10_txn_df[summary_txn_fields].sort_values("Txn_Date", ascending=False)
+    # Txn_Amount is saved in minor units (e.g. cents) - show it in currency units
+    last_10_summary_df = last_10_summary_df.assign(Txn_Amount=last_10_summary_df["Txn_Amount"] / amount_scale())
 
     # print(last_10_summary_df.to_string(index=False))
     print(tabulate(last_10_summary_df,
-                   floatfmt=(None, '.2f', None),  # to retain decimal formating of Txn_Amount field
+                   floatfmt=(None, amount_floatfmt(), None),  # to retain decimal formating of Txn_Amount field
                    headers="keys",
                    showindex=False))
 
@@ -684,75 +1288,147 @@ def display_last_10_txns(last_10_txn_df):
     print("To view Historical Txns by Date Range and Detailed View, go to Main Menu.")
 
 
-def display_txns_by_daterange(username, daterange_expenses_df, modify_txn):
+@timed
+def display_txns_page(daterange_df, page, floatfmt):
+    """
+    Prints one page of Expense Txn entries - only the TXN_PAGE_ROWS rows on this page are formatted,
+    however many entries there are in the Date range. Txn_Amount (in minor units) is shown in currency units.
+    params: daterange_df - Expense Txn entries to display, one page at a time
+            page - int type - page number to print, starting from 0
+            floatfmt - tuple type - float format of each column field, passed on to tabulate()
+    :return: int type - number of pages
+    """
+    page_count = max(1, -(-daterange_df.shape[0] // TXN_PAGE_ROWS))  # rounded up
+    first_row = page * TXN_PAGE_ROWS
+    page_df = daterange_df.iloc[first_row:first_row + TXN_PAGE_ROWS]
+    page_df = page_df.assign(Txn_Amount=page_df["Txn_Amount"] / amount_scale())
+
+    print(tabulate(page_df,
+                   floatfmt=floatfmt,
+                   headers="keys",
+                   showindex=False))
+    if page_count > 1:
+        print("\nPage", page + 1, "of", page_count, "-", daterange_df.shape[0], "entries")
+
+    return page_count
+
+
+def display_txns_by_daterange(username, daterange_expenses_df, modify_txn, pending_changes=None, page=0):
     """
-    Displays Expense Txn entries in given Date Range for this user
+    Displays Expense Txn entries in given Date Range for this user, TXN_PAGE_ROWS entries per page
     Additionally, displays a row number for each record if modify_txn is set to True
-    For Modify Txn mode, this function will prompt user to enter a valid row number to select a row for modification
+    For Modify Txn mode, this function will prompt user to enter a valid row number to select a row for modification,
+    or to review and save the changes made so far in this edit session
     params: username - for passing username reference to other helper functions
             daterange_expenses_df - holds Date specific Txns in dataframe,
             modify_txn - Boolean value, set to True if display Txn entries in Edit mode, else False.
-
+            pending_changes - dict type - edits/ deletes made in this edit session, Not saved yet
+                              {Txn_ID: Updated Expense entry List, or None for Delete}. None for a New session.
+            page - int type - page of entries to display, starting from 0
+    :return: next screen to show - (screen function, arguments)
     """
     # show All column fields (except Username)
     # subset a new dataframe, daterange_df
     expense_txn_fields = ["Txn_Date", "Txn_Amount", "Txn_Category", "MerchantName", "Txn_Country"]
     daterange_df = daterange_expenses_df[expense_txn_fields]
 
+    if pending_changes is not None:
+        # back from modifying an entry - show the list again on a clean screen
+        clear_terminal()
+        display_header(username)
+
     print("")
     # print(daterange_expenses_df.to_string(index=False))
 
+    # page navigation options, shown below the entries
+    page_options = {}
+    page_count = max(1, -(-daterange_df.shape[0] // TXN_PAGE_ROWS))
+    if page + 1 < page_count:
+        page_options["n"] = page + 1
+    if page > 0:
+        page_options["p"] = page - 1
+
     if modify_txn:  # Display Expense entries by Row Number for easy selection and modification
-        row_num = 1
-        # iterate dataframe and create a New column - "modify_row"
-        # to identify particular record to modify
-        for label, row in daterange_df.iterrows():
-            daterange_df.loc[label, "modify_row"] = row_num
-            row_num += 1
+        if pending_changes is None:
+            pending_changes = {}  # New edit session
+
+        # show the edited values of entries changed in this session, so further edits start from them
+        # (as text - a categorical column only takes values from its categories)
+        daterange_df = daterange_df.astype({field: str for field in expense_txn_fields if field != "Txn_Amount"})
+        for txn_id, expense_entry_list in pending_changes.items():
+            if expense_entry_list is not None:
+                daterange_df.loc[txn_id, expense_txn_fields] = expense_entry_list[1:]
+
+        # create a New column - "modify_row" - with the row number of each record, to identify the record to modify
         # Note: we are assigning a row number for display purposes only, and this doesn't change the original Row Index
-        print(tabulate(daterange_df,
-                       floatfmt=(None, '.2f', None, None, None),
-                       headers="keys",
-                       showindex=False))
+        daterange_df["modify_row"] = np.arange(1, daterange_df.shape[0] + 1)
+
+        # mark entries changed in this session - they are Not saved until the user reviews and saves them
+        display_df = daterange_df
+        if pending_changes:
+            pending_status = {}
+            for txn_id, expense_entry_list in pending_changes.items():
+                pending_status[txn_id] = "deleted" if expense_entry_list is None else "edited"
+            display_df = daterange_df.assign(pending=daterange_df.index.map(pending_status).fillna(""))
+
+        display_txns_page(display_df, page, floatfmt=(None, amount_floatfmt(), None, None, None))
 
         # call helper function to select and modify an Expense Txn
         print("\nPlease enter a Row Number to modify: ")
-        print("To go back to Main Menu, just press Enter...")
+        if "n" in page_options:
+            print("For the Next page of entries, press 'n' and Enter...")
+        if "p" in page_options:
+            print("For the Previous page of entries, press 'p' and Enter...")
+        if pending_changes:
+            print("To review and save your", len(pending_changes), "pending change(s), press 's' and Enter...")
+            print("To go back to Main Menu without saving them, just press Enter...")
+        else:
+            print("To go back to Main Menu, just press Enter...")
 
         # prompt user to input menu option to continue program control flow
-        user_choice = input("\nEnter your choice here: ").strip()
+        user_choice = input("\nEnter your choice here: ").strip().lower()
+        # prompt user to enter a valid row number for selection, or a blank
+        while user_choice != "" and not (user_choice.isdigit() and 1 <= int(user_choice) <= daterange_df.shape[0]):
+            if user_choice in page_options:
+                return display_txns_by_daterange, (username, daterange_expenses_df, True, pending_changes,
+                                                   page_options[user_choice])
+            if pending_changes and user_choice == "s":
+                # review All pending changes, and save them in one go
+                return review_pending_changes, (username, daterange_expenses_df, pending_changes, page)
+            user_choice = input("Invalid input. Please enter a valid Row Number to modify: ").strip().lower()
+
+        # while loop breaks, user has entered a blank, or a valid row number
         if user_choice == "":
-            # navigate to Main menu
-            display_main_menu(username)
-        else:  # check if user input is a valid Row Number, or user has pressed Enter
-            # convert dataframe to nested dictionary
-            daterange_expenses_dict = daterange_df.to_dict()
-            # create a list of row numbers populated
-            row_nums_list = []
-            for values in daterange_expenses_dict["modify_row"].values():
-                row_nums_list.append(str(int(values)))
-            # prompt user to enter a valid row number for selection
-            while user_choice not in row_nums_list:
-                if user_choice == "":
-                    break
-                user_choice = input("Invalid input. Please enter a valid Row Number to modify: ").strip()
-            # while loop breaks, user has entered a blank, or a valid row number
-            if user_choice == "":
-                # navigate user to Main menu
-                display_main_menu(username)
-            else:
-                row_num = float(user_choice)
-                modify_txns_by_daterange(username, daterange_expenses_dict, row_num)
+            # navigate user to Main menu
+            return display_main_menu, (username,)
+        else:
+            # row number is the position of the record in the dataframe - No need to search for it
+            position = int(user_choice) - 1
+            txn_id = daterange_df.index[position]
+            expense_txn_dict = daterange_df.iloc[position][expense_txn_fields].to_dict()
+            expense_txn_dict["Txn_Amount"] = int(expense_txn_dict["Txn_Amount"])  # minor units, as a Python int
+            return modify_txns_by_daterange, (username, daterange_expenses_df, txn_id, expense_txn_dict,
+                                              pending_changes, page)
 
     else:  # display Expense entries in View Only mode
-        print(tabulate(daterange_df,
-                       floatfmt=(None, '.2f', None, None, None),  # to retain decimal formating of Txn_Amount field
-                       headers="keys",
-                       showindex=False))
+        # to retain decimal formating of Txn_Amount field
+        display_txns_page(daterange_df, page, floatfmt=(None, amount_floatfmt(), None, None, None))
+
+        input_msg = "\nPress Enter to go back to Main Menu"
+        if "n" in page_options:
+            input_msg += ", 'n' and Enter for the Next page"
+        if "p" in page_options:
+            input_msg += ", 'p' and Enter for the Previous page"
+        user_choice = input(input_msg + "... ").strip().lower()
+
+        if user_choice in page_options:
+            # show the other page on a clean screen
+            clear_terminal()
+            display_header(username)
+            return display_txns_by_daterange, (username, daterange_expenses_df, False, None, page_options[user_choice])
 
-        input("\nPress Enter to go back to Main Menu... ")
         # navigate user to Main menu
-        display_main_menu(username)
+        return display_main_menu, (username,)
 
 
 def fetch_txns_by_daterange(username, modify_txn=False):
@@ -760,6 +1436,7 @@ def fetch_txns_by_daterange(username, modify_txn=False):
     Fetch Expense Txn entries for the given Date Range for this user
     params: username - to fetch Expense Txn entries for this user,
             modify_txn - Boolean value, set to True if Txn entries to display in Edit mode, else False.
+    :return: next screen to show - (screen function, arguments)
     """
     # input Start Date from user
     input_msg = "\nPlease enter Start Date in 'yyyy-mm-dd' format, or Press Enter for today's date: "
@@ -795,50 +1472,47 @@ def fetch_txns_by_daterange(username, modify_txn=False):
         user_choice = input("\nEnter your choice here: ")
 
         if user_choice == '1':
-            display_main_menu(username)  # abort, and go back to Main Menu...
+            return display_main_menu, (username,)  # abort, and go back to Main Menu...
         else:
-            fetch_txns_by_daterange(username, modify_txn)  # call function recursively, user wants to continue...
+            return fetch_txns_by_daterange, (username, modify_txn)  # show this screen again, user wants to continue...
     else:
-        # populate All Expense Txns for this user Only.
-        user_expenses_df = fetch_user_expenses(username)
+        # populate Expense Txns for specified Date Range, for this user Only.
+        daterange_expenses_df = fetch_user_expenses_by_daterange(username, start_date, end_date)
 
-        # Subset Expense Txns for specified Date Range from above dataframe
-        daterange_expenses_df = user_expenses_df[(user_expenses_df["Txn_Date"] >= start_date) &
-                                                 (user_expenses_df["Txn_Date"] <= end_date)]
+        # Txns could not be read from database - error msg is already displayed to the user
+        if daterange_expenses_df is None:
+            input("\nPress Enter to go back to Main Menu... ")
+            return display_main_menu, (username,)
 
         # If No Txns are present in given Date Range for this user
-        if daterange_expenses_df.shape[0] == 0:
+        elif daterange_expenses_df.shape[0] == 0:
             print("\n\tYou have 0 Txns for the given Date Range!")
             input("\nPress Enter to go back to Main Menu... ")
-            display_main_menu(username)
+            return display_main_menu, (username,)
 
         else:
             # Display Txn entries to the user for given date range
-            display_txns_by_daterange(username, daterange_expenses_df, modify_txn)
+            return display_txns_by_daterange, (username, daterange_expenses_df, modify_txn)
 
 
-def modify_txns_by_daterange(username, daterange_expenses_dict, row_num):
+def modify_txns_by_daterange(username, daterange_expenses_df, txn_id, expense_txn_dict, pending_changes, page):
     """
     Allow given user to Modify / Delete historical Expense txns, one txn at a time
-    Prompts user to specify a date range to pull Txns to modify
+    Changes are only staged in pending_changes here - they are saved together from review_pending_changes()
     :params username: to fetch and modify Expense Txn entries for this user
-            daterange_expense_df: to modify Expense Txn from given dictionary
-            row_num: row number selected by the user to modify record
+            daterange_expenses_df: Expense Txns in the Date range, as read from database - to go back to the list
+            txn_id: Txn_ID of the Expense Txn entry selected by the user to modify
+            expense_txn_dict: dict type - column field values of this Expense Txn entry, to modify
+            pending_changes: dict type - edits/ deletes staged so far in this edit session
+            page: page of the list the entry was selected from - to go back to it
+    :return: next screen to show - (screen function, arguments)
     """
-    row_index = None
-
-    # iterate the nested dictionary to find the given row number
-    for key, values in daterange_expenses_dict["modify_row"].items():
-        if row_num == values:
-            row_index = key
-
-    # this row index identifies the Expense Txn entry user has selected to modify
-    # and corresponds to actual row index number in the Expenses database for this Txn record
+    # the Txn_ID identifies the Expense Txn entry user has selected to modify
+    # it never changes, even if other Txns are saved or re-sorted meanwhile
     # print the Expense Txn record to the user and prompt for modification
     print("Expense Entry selected for modification: \n")
-    for key, values in daterange_expenses_dict.items():
-        if row_index in values and key != "modify_row":
-            print(key, ":", daterange_expenses_dict[key][row_index])
+    for key, value in expense_txn_dict.items():
+        print(key, ":", format_amount(value) if key == "Txn_Amount" else value)
 
     # display Expense Entry modification choices to user
     print("")
@@ -854,167 +1528,2080 @@ def modify_txns_by_daterange(username, daterange_expenses_dict, row_num):
     if user_choice == "1":  # EDIT TXN_DATE (mandatory field)
         txn_date = input_expense_txn_date()
         # update Txn_Date in Expense record
-        daterange_expenses_dict["Txn_Date"][row_index] = txn_date
+        expense_txn_dict["Txn_Date"] = txn_date
 
     elif user_choice == "2":  # EDIT TXN_AMOUNT (mandatory field)
         txn_amount = input_expense_txn_amount()
         # update Txn_Amount in Expense record
-        daterange_expenses_dict["Txn_Amount"][row_index] = txn_amount
+        expense_txn_dict["Txn_Amount"] = txn_amount
 
     elif user_choice == "3":  # EDIT TXN_CATEGORY (mandatory field)
         txn_cat = input_expense_txn_category()
         # update Expense Txn record
-        daterange_expenses_dict["Txn_Category"][row_index] = txn_cat
+        expense_txn_dict["Txn_Category"] = txn_cat
 
     elif user_choice == "4":  # EDIT MERCHANT NAME (optional field)
         merchant_name = input_expense_txn_merchant_name()
         # update Expense Txn record
-        daterange_expenses_dict["MerchantName"][row_index] = merchant_name
+        expense_txn_dict["MerchantName"] = merchant_name
 
     elif user_choice == "5":  # EDIT TXN_COUNTRY (optional field)
         txn_country = input_expense_txn_country()
         # update Expense Txn record
-        daterange_expenses_dict["Txn_Country"][row_index] = txn_country
+        expense_txn_dict["Txn_Country"] = txn_country
 
     elif user_choice == "6":  # DELETE Expense Txn in database
-        input_msg_del = "\nPress Enter to confirm Deletion...\nor, press any other key and Enter go to Main Menu: "
+        input_msg_del = "\nPress Enter to mark this entry for Deletion...\nor, press any other key and Enter go back: "
         submit = input(input_msg_del).strip()
         if submit == "":
-            # call helper function to Delete Expense Txn in database, for given Row Index num
-            remove_expense_entry_from_file(row_index)
-            print("\nExpense entry successfully deleted from records...")
-            time.sleep(1)  # purely for user experience, to see the Success msg.
+            # stage the Deletion - it is saved with the other pending changes, after review
+            pending_changes[txn_id] = None
 
-        # navigate user to Main Menu
-        display_main_menu(username)
+        # navigate user back to the list of Expense entries
+        return display_txns_by_daterange, (username, daterange_expenses_df, True, pending_changes, page)
 
     if user_choice != "6":
         # print the Updated Expense Txn record to the user and prompt for confirmation
         print("\nUpdated Expense Txn Entry:\n")
-        for key, values in daterange_expenses_dict.items():
-            if row_index in values and key != "modify_row":
-                print(key + ":", daterange_expenses_dict[key][row_index])
+        for key, value in expense_txn_dict.items():
+            print(key + ":", format_amount(value) if key == "Txn_Amount" else value)
 
-        submit = input("\nPress Enter to confirm and Submit.\nor Press '1' and Enter to Edit more fields: ").strip()
+        submit = input("\nPress Enter to confirm this change.\nor Press '1' and Enter to Edit more fields: ").strip()
         if submit == "1":
             # start over for further Editing of Expense entry
-            modify_txns_by_daterange(username, daterange_expenses_dict, row_num)
+            return modify_txns_by_daterange, (username, daterange_expenses_df, txn_id, expense_txn_dict,
+                                              pending_changes, page)
         else:
             # construct a new Expense Txn entry list to save to database
             # add 'username' argument as the first element of this list
             expense_entry_list = [username]
-            # iterate the nested dictionary passed as argument to this function, to retrieve the values for Txn fields
-            for key, values in daterange_expenses_dict.items():
-                if row_index in values and key != "modify_row":
-                    expense_entry_list.append(daterange_expenses_dict[key][row_index])
+            # iterate the dictionary passed as argument to this function, to retrieve the values for Txn fields
+            for key, value in expense_txn_dict.items():
+                expense_entry_list.append(value)
 
-            # call helper function to save the new Expense Entry in database
-            update_expense_entry_in_file(expense_entry_list, row_index)
+            # stage the Updated Expense entry (replacing an earlier edit or Deletion of it in this session)
+            pending_changes[txn_id] = expense_entry_list
 
-            # print success msg to user and navigate to User Dashboard home screen - Main menu
-            print("\nExpense entry successfully saved in records...")
-            time.sleep(1)  # purely for user experience, to see the Success msg.
+            # navigate user back to the list of Expense entries, to modify more entries or save the changes
+            return display_txns_by_daterange, (username, daterange_expenses_df, True, pending_changes, page)
 
-            display_main_menu(username)
 
-
-def remove_expense_entry_from_file(row_index):
+def review_pending_changes(username, daterange_expenses_df, pending_changes, page):
     """
-    Deletes an Expense Txn record from the data file at the given Row Index number
-    param: row_index - int - to delete Txn record at this index in data file.
+    Shows the edits/ deletes staged in this edit session side by side with the saved values,
+    and saves them All together - one write of the user's data file - once the user confirms.
+    params: username - to save the changes for this user
+            daterange_expenses_df - Expense Txns in the Date range, as read from database (the saved values)
+            pending_changes - dict type - {Txn_ID: Updated Expense entry List, or None for Delete}
+            page - page of the list to go back to, for more changes
+    :return: next screen to show - (screen function, arguments)
     """
-    # read csv data file and load it into a dataframe
-    user_expenses_df = pd.read_csv(FILE_PATH_TXN)
+    clear_terminal()
+    display_header(username)
 
-    # DELETE Expense Txn record at given Row Index
-    user_expenses_df = user_expenses_df[user_expenses_df.index != row_index]
+    print("\t---------------------------------")
+    print("\tReview Pending Changes")
+    print("\t---------------------------------\n")
 
-    # Write the updated Expense Entries dataframe to data file
-    user_expenses_df.to_csv(FILE_PATH_TXN, mode="w", index=False)
+    # one line per changed field of an edited entry, and one line per deleted entry
+    expense_txn_fields = ["Txn_Date", "Txn_Amount", "Txn_Category", "MerchantName", "Txn_Country"]
+    changes_list = []
+    for txn_id, expense_entry_list in pending_changes.items():
+        saved_txn = daterange_expenses_df.loc[txn_id]
+        if expense_entry_list is None:
+            changes_list.append([saved_txn["Txn_Date"], "Delete", "",
+                                 format_amount(saved_txn["Txn_Amount"]) + ", " + saved_txn["MerchantName"], ""])
+            continue
+
+        for field, new_value in zip(expense_txn_fields, expense_entry_list[1:]):
+            if new_value != saved_txn[field]:
+                if field == "Txn_Amount":  # in currency units, with the currency's decimal places
+                    changes_list.append([saved_txn["Txn_Date"], "Edit", field,
+                                         format_amount(saved_txn[field]), format_amount(new_value)])
+                else:
+                    changes_list.append([saved_txn["Txn_Date"], "Edit", field, saved_txn[field], new_value])
 
+    if changes_list:
+        print(tabulate(changes_list, headers=["Txn_Date", "Change", "Field", "Saved value", "New value"],
+                       disable_numparse=True))  # values are already formatted text
+    else:
+        print("\tNo field values were changed.")
 
-def update_expense_entry_in_file(expense_entry_list, row_index):
-    """
-    Updates Expense Txn record in data file, as per the arguments received.
-    params: expense_entry_list: Updated Expense Txn record stored as a List type.
-            row_index: row index number of this Expense Txn record in data file for update.
-    """
-    # read csv data file and load it into a dataframe
-    user_expenses_df = pd.read_csv(FILE_PATH_TXN)
-
-    # construct an Expense Txn dict. from given List
-    expense_txn_dict = {"Username": [],
-                        "Txn_Date": [],
-                        "Txn_Amount": [],
-                        "Txn_Category": [],
-                        "MerchantName": [],
-                        "Txn_Country": []}
-    item_index = 0
-    for key in expense_txn_dict.keys():
-        expense_txn_dict[key] = expense_entry_list[item_index]
-        item_index += 1
-
-    # update Expense Txn record at given Row Index number in the dataframe
-    for key, values in expense_txn_dict.items():
-        user_expenses_df.loc[row_index, key] = values
-
-    # Sort the dataframe by Txn_Date so that final Txn entries in the data file appear in order of Txn Date
-    user_expenses_df = user_expenses_df.sort_values("Txn_Date")
+    input_msg = ("\nPress Enter to save All changes.\nPress '1' and Enter to go back and modify more entries."
+                 "\nPress '2' and Enter to discard All changes and go to Main Menu: ")
+    user_choice = input(input_msg).strip()
+    while user_choice not in ["", "1", "2"]:
+        user_choice = input("Invalid input. " + input_msg).strip()
 
-    # Write the sorted Expense Entries df to database
-    user_expenses_df.to_csv(FILE_PATH_TXN, mode="w", index=False)
+    if user_choice == "1":
+        return display_txns_by_daterange, (username, daterange_expenses_df, True, pending_changes, page)
 
+    if user_choice == "":
+        # call helper function to save All changes to database, in one write
+        try:
+            apply_expense_changes(username, pending_changes)
+            print("\n" + str(len(pending_changes)), "Expense entries successfully saved in records...")
+        except TimeoutError:  # another session kept the records locked for too long
+            print("\nYour records are busy in another session. Please try again.")
+        except KeyError as error:  # Txn_ID not found - an entry was deleted in another session
+            print("\nSome of these Expense entries are No longer in your records. No changes were saved.")
+            log_event("expenses_change_failed", "WARNING", error, username=username)
+        time.sleep(1)  # purely for user experience, to see the Success msg.
 
-def save_expense_entry_to_file(expense_entry_list):
-    """
-    Save the Expense Entry to file/ database
-    :param expense_entry_list: holds values for all column fields of the 'user_expenses_data' data file.
-    """
+    # navigate user to Main Menu
+    return display_main_menu, (username,)
 
-    # create a DataFrame object from this Expense record List
-    # note: enclosing Expense List argument within [] to make compatible for dataframe.
-    expense_df = pd.DataFrame([expense_entry_list])
 
+def try_lock_file(file):
+    # try once to take an exclusive lock on an open lock file, without waiting - return True if taken
     try:
-        # Write the new Expense Entry to database in 'Append' mode
-        expense_df.to_csv(FILE_PATH_TXN, mode="a", index=False, header=False)
-    except Exception:
-        print("\nThere was an error appending the new Expense Txn record to data file. Please try again.")
-
-    # read Updated csv file and load it into a dataframe
-    user_expenses_df = pd.read_csv(FILE_PATH_TXN)
+        if msvcrt is not None:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
 
-    # Sort the dataframe by Txn_Date so that final Txn entries in the data file appear in order of Txn Date
-    user_expenses_df = user_expenses_df.sort_values("Txn_Date")
 
-    # Write the sorted Expense Entries df to database
-    user_expenses_df.to_csv(FILE_PATH_TXN, mode="w", index=False)
+def unlock_file(file):
+    # release the lock taken by try_lock_file()
+    if msvcrt is not None:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
 
 
-def create_new_expense_entry(username):
+@contextlib.contextmanager
+def file_lock(lock_path):
     """
-    Create a new Expense entry in the database for the given user.
-    'Uses Expenses' database is a csv file.
-    Display a preview of the Expense entry before final submission, and
-    confirm entry submission status - entry saved or display error msg.
-    :param username:
+    Holds an exclusive advisory lock on a lock file, shared by All app sessions (processes) using the same data
+    directory - fcntl.flock() on Linux/ macOS, msvcrt.locking() on Windows. Also holds ledger_lock, for the threads
+    of this process. Locks are only held while files are read or written - never while waiting for user input.
+    Holding the same lock again further down the call stack is allowed.
+    Waits up to LOCK_TIMEOUT_SECONDS for another session to release the lock, then raises TimeoutError.
+    Usage: with file_lock(path): ...
     """
-    # Input Expense Txn Entry data fields from user, one field at a time, validating each field's input
+    with ledger_lock:
+        if lock_path in held_file_locks:  # already held by this thread, further up the call stack
+            yield
+            return
+
+        os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+        file = open(lock_path, "a+b")
+
+        start = time.perf_counter()
+        while not try_lock_file(file):
+            if time.perf_counter() - start > LOCK_TIMEOUT_SECONDS:
+                file.close()
+                lock_stats["timeouts"] += 1
+                log_event("lock_timeout", "WARNING", lock_path=lock_path, timeout_seconds=LOCK_TIMEOUT_SECONDS)
+                raise TimeoutError("Timed out waiting for another session to release: " + lock_path)
+            time.sleep(0.01)
+
+        # record how long this session had to wait for the lock
+        wait_seconds = time.perf_counter() - start
+        lock_stats["acquired"] += 1
+        if wait_seconds > 0.001:
+            lock_stats["contended"] += 1
+        lock_stats["wait_seconds"] += wait_seconds
+        lock_stats["max_wait_seconds"] = max(lock_stats["max_wait_seconds"], wait_seconds)
+
+        held_file_locks[lock_path] = file
+        try:
+            yield
+        finally:
+            del held_file_locks[lock_path]
+            unlock_file(file)
+            file.close()
 
-    # TXN_DATE (mandatory field)
-    # -------------------------
-    txn_date = input_expense_txn_date()
-    print("")
 
-    # TXN_AMOUNT (mandatory)
-    # ----------------------
-    txn_amount = input_expense_txn_amount()
-    print("")
+def user_ledger_lock(username):
+    # lock on the given user's shard files (see file_lock()): with user_ledger_lock(username): ...
+    ensure_partitioned_ledger()  # shards directory must not be created before the legacy data file is migrated
+    return file_lock(os.path.join(shard_dir_path(username), SHARD_LOCK_FILE))
 
-    # TXN_CATEGORY (mandatory)
-    # ------------------------
-    txn_cat = input_expense_txn_category()
-    print("")
+
+def lock_contention_stats():
+    """
+    Lock contention metric for this session: how many locks were taken, how many had to wait for another
+    session, how many timed out, and the total/ average/ longest wait in seconds.
+    :return: dict type - lock stats
+    """
+    stats = dict(lock_stats)
+    stats["average_wait_seconds"] = stats["wait_seconds"] / stats["acquired"] if stats["acquired"] else 0.0
+
+    return stats
+
+
+def save_lock_contention_stats():
+    # at program exit, append this session's lock stats to FILE_PATH_LOCK_STATS - if it ever waited for a lock
+    if lock_stats["contended"] == 0 and lock_stats["timeouts"] == 0:
+        return
+
+    stats = lock_contention_stats()
+    stats["pid"] = os.getpid()
+    stats["time"] = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    with open(FILE_PATH_LOCK_STATS, "a") as file:
+        file.write(json.dumps(stats) + "\n")
+
+
+atexit.register(save_lock_contention_stats)
+
+
+def replace_file(file_path, write_contents):
+    """
+    Writes a text file safely: the contents are written to a temporary file, flushed to disk, and the temporary file
+    is then renamed over the file in one step (os.replace) - so a crash part way through never leaves a half-written
+    file, and readers see either the old or the new file.
+    params: file_path - file to write
+            write_contents - function that writes the contents, given the open temporary file
+    """
+    temp_path = file_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temp_path, "w", newline="") as file:
+            write_contents(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def shard_dir_path(username):
+    """
+    Returns the path of the shard directory holding Expense Txns for the given user.
+    Username is quoted, so that any character allowed in a username is safe in a directory name.
+    """
+    return os.path.join(DIR_PATH_TXN_SHARDS, quote(username, safe=""))
+
+
+def list_shard_usernames():
+    # return usernames of All Users with a shard directory in the database
+    if not os.path.isdir(DIR_PATH_TXN_SHARDS):
+        return []
+
+    return [unquote(name) for name in sorted(os.listdir(DIR_PATH_TXN_SHARDS))]
+
+
+def migrate_flat_ledger_to_shards():
+    """
+    Converts the legacy flat data file (Expense Txns for All Users, in one csv file) and its journal
+    into per-user shard directories, so that reading a user's Txns only touches that user's rows.
+    The flat file is read in chunks, and is left in place untouched. Its Txn amounts (in currency units)
+    are converted to minor units on the way (see convert_amounts_to_minor_units()).
+    Shards are built in a temporary directory and moved into place only when complete.
+    """
+    if os.path.isdir(DIR_PATH_TXN_SHARDS):
+        print("Expense data is already partitioned by user in:", DIR_PATH_TXN_SHARDS)
+        return
+
+    temp_dir = DIR_PATH_TXN_SHARDS + ".tmp"
+    if os.path.isdir(temp_dir):
+        shutil.rmtree(temp_dir)  # left behind by an interrupted migration
+    os.makedirs(temp_dir)
+
+    # copy rows of each user into their own shard, one chunk at a time
+    if os.path.exists(FILE_PATH_TXN) and os.path.getsize(FILE_PATH_TXN) > 0:
+        for chunk_df in pd.read_csv(FILE_PATH_TXN, chunksize=100_000):
+            # every Txn gets its Txn_ID here, so the shards don't need rewriting to add them later
+            chunk_df[TXN_ID_FIELD] = new_txn_ids(chunk_df.shape[0])
+            chunk_df["Txn_Amount"] = amounts_to_minor_units(chunk_df["Txn_Amount"])
+            for username, user_chunk_df in chunk_df.groupby("Username", sort=False):
+                data_path = os.path.join(temp_dir, quote(username, safe=""), SHARD_DATA_FILE)
+                os.makedirs(os.path.dirname(data_path), exist_ok=True)
+                user_chunk_df.to_csv(data_path, mode="a", index=False, header=not os.path.exists(data_path))
+
+    # rows of the legacy journal go into each user's journal, to be merged in at compaction
+    if os.path.exists(FILE_PATH_TXN_JOURNAL) and os.path.getsize(FILE_PATH_TXN_JOURNAL) > 0:
+        journal_df = pd.read_csv(FILE_PATH_TXN_JOURNAL, header=None, names=TXN_FIELDS)
+        journal_df[TXN_ID_FIELD] = new_txn_ids(journal_df.shape[0])
+        journal_df["Txn_Amount"] = amounts_to_minor_units(journal_df["Txn_Amount"])
+        for username, user_journal_df in journal_df.groupby("Username", sort=False):
+            journal_path = os.path.join(temp_dir, quote(username, safe=""), SHARD_JOURNAL_FILE)
+            os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+            user_journal_df.to_csv(journal_path, mode="a", index=False, header=False)
+
+    shutil.move(temp_dir, DIR_PATH_TXN_SHARDS)
+    replace_file(FILE_PATH_SHARDS_AMOUNTS, lambda file: json.dump(ledger_currency(), file))
+
+    # sort every shard by Txn_Date, and merge in the legacy journal rows
+    convert_ledger_format()
+    log_event("ledger_migrated", users=len(list_shard_usernames()))
+
+
+def ensure_partitioned_ledger():
+    # migrate the legacy flat data file to per-user shards, the first time Expense data is accessed -
+    # and convert Txn amounts of shards saved by earlier versions of the app to minor units
+    if not os.path.isdir(DIR_PATH_TXN_SHARDS) or not os.path.exists(FILE_PATH_SHARDS_AMOUNTS):
+        with file_lock(FILE_PATH_SHARDS_LOCK):
+            if not os.path.isdir(DIR_PATH_TXN_SHARDS):  # another session may have migrated it meanwhile
+                migrate_flat_ledger_to_shards()
+            if not os.path.exists(FILE_PATH_SHARDS_AMOUNTS):
+                convert_amounts_to_minor_units()
+
+
+def convert_amounts_to_minor_units():
+    """
+    One-time conversion of the Txn amounts in All Users' shard files, from currency units (e.g. 12.5 - as saved
+    by earlier versions of the app) to whole numbers of minor units (1250 cents), and of their rollups:
+    python expense_tracker_final.py convert-amounts
+    Runs on first run (see ensure_partitioned_ledger()), and caller must hold FILE_PATH_SHARDS_LOCK.
+    Amounts saved by earlier versions always have a decimal point, and are read as floats - a data file or
+    journal already in minor units is read as integers, and left as it is. So after an interruption, it is safe
+    to run again. FILE_PATH_SHARDS_AMOUNTS is written last, once All shards are converted.
+    The SQLite database is converted when it is opened (see get_db_connection()).
+    """
+    converted_users = 0
+    for username in list_shard_usernames():
+        # Not user_ledger_lock(), which would start this conversion again
+        with file_lock(os.path.join(shard_dir_path(username), SHARD_LOCK_FILE)):
+            shard_dir = shard_dir_path(username)
+            data_path = shard_data_path(username)
+            journal_path = os.path.join(shard_dir, SHARD_JOURNAL_FILE)
+
+            # amounts are read as they are saved - read_shard_data() and read_user_journal() take them as integers
+            frames = []
+            converted = False
+            if os.path.exists(data_path):
+                data_df = read_shard_data(username, [field for field in LEDGER_FIELDS if field != "Txn_Amount"])
+                if data_path.endswith(SHARD_COLUMNS_FILE):
+                    with open(data_path, "r") as file:
+                        amounts_file = json.load(file)["columns"]["Txn_Amount"][0]
+                    txn_amounts = np.load(os.path.join(shard_dir, amounts_file))
+                else:
+                    txn_amounts = pd.read_csv(data_path, usecols=["Txn_Amount"])["Txn_Amount"].to_numpy()
+                if txn_amounts.dtype.kind == "f":
+                    txn_amounts = amounts_to_minor_units(txn_amounts)
+                    converted = True
+                frames.append(data_df.assign(Txn_Amount=txn_amounts))
+
+            if os.path.exists(journal_path) and os.path.getsize(journal_path) > 0:
+                column_types = {field: "category" for field in CATEGORY_FIELDS}
+                column_types[TXN_ID_FIELD] = "Int64"
+                journal_df = pd.read_csv(journal_path, header=None, names=LEDGER_FIELDS, dtype=column_types)
+                if journal_df["Txn_Amount"].dtype.kind == "f":
+                    journal_df["Txn_Amount"] = amounts_to_minor_units(journal_df["Txn_Amount"])
+                    converted = True
+                frames.append(journal_df)
+
+            if converted:
+                write_user_ledger(username, concat_expense_frames(frames, ignore_index=True))
+
+                # rollups still hold totals in currency units - they are rebuilt when next needed
+                rollup_path = os.path.join(shard_dir, SHARD_ROLLUP_FILE)
+                if os.path.exists(rollup_path):
+                    os.remove(rollup_path)
+                converted_users += 1
+
+    replace_file(FILE_PATH_SHARDS_AMOUNTS, lambda file: json.dump(ledger_currency(), file))
+    log_event("amounts_converted", users=converted_users, currency=ledger_currency()["currency"])
+
+
+def read_user_journal(username):
+    """
+    Reads the append-only journal of New Expense Txns for the given user, not yet merged into their data file.
+    Journal rows have No header, and are in the order they were saved - Not sorted by Txn_Date.
+    Each row holds the column fields of LEDGER_FIELDS.
+    Journal rows already in the data file - left by a write_user_ledger() that stopped before emptying the journal -
+    are dropped here, and the journal is emptied (see drop_merged_journal_rows()).
+    Caller must hold user_ledger_lock(username).
+    :return: dataframe type - journal_df, with 0 rows if the journal is empty or doesn't exist yet
+    """
+    journal_path = os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE)
+    if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+        return compact_expense_dtypes(pd.DataFrame(columns=LEDGER_FIELDS))
+
+    # rows saved before Txn IDs were added have No Txn_ID - read as missing (<NA>).
+    # text column fields are parsed straight into categoricals, as in read_shard_data() - so a value that looks like
+    # a number (e.g. MerchantName "007") stays text
+    column_types = {field: "category" for field in CATEGORY_FIELDS}
+    column_types["Txn_Amount"] = "int64"
+    column_types[TXN_ID_FIELD] = "Int64"
+    journal_df = pd.read_csv(journal_path, header=None, names=LEDGER_FIELDS, dtype=column_types)
+    return drop_merged_journal_rows(username, compact_expense_dtypes(journal_df))
+
+
+def drop_merged_journal_rows(username, journal_df):
+    """
+    write_user_ledger() replaces the data file (with the journal rows merged in) and then empties the journal -
+    a crash in between leaves the same Txns in both files. This finishes such an interrupted merge:
+    journal rows whose Txn_ID is already in the data file are dropped, and the journal is emptied if None are left.
+    The Txn IDs of the data file are only read when the journal was last changed before the data file was written -
+    a journal appended to (or emptied) after the last merge is always newer than the data file.
+    Caller must hold user_ledger_lock(username).
+    params: username - to check this user's shard
+            journal_df - the rows read from the user's journal
+    :return: dataframe type - journal_df, without the rows already in the data file
+    """
+    data_version, journal_version = shard_version(username)
+    if data_version is None or journal_version is None or journal_version[0] > data_version[0]:
+        return journal_df
+
+    data_txn_ids = read_shard_data(username, [TXN_ID_FIELD])[TXN_ID_FIELD]
+    merged_rows = journal_df[TXN_ID_FIELD].isin(data_txn_ids.dropna()).to_numpy(dtype=bool)
+    if not merged_rows.any():
+        return journal_df
+
+    journal_df = journal_df[~merged_rows]
+    if journal_df.shape[0] == 0:
+        open(os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE), "w").close()
+    log_event("journal_recovered", "WARNING", username=username, merged_rows=int(merged_rows.sum()),
+              journal_rows=journal_df.shape[0])
+    return journal_df
+
+
+@timed
+def read_user_ledger(username, columns=None):
+    """
+    Reads Expense Txns for the given user - their sorted data file, and the unsorted journal on top of it -
+    and merges them on the fly into a single dataframe, in order of Txn_Date.
+    Row index of each Txn record is its Txn_ID (see index_by_txn_id()).
+    Txns saved before Txn IDs were added are given their IDs here, and the user's shard is rewritten with them.
+    params: username - to read this user's shard
+            columns - list of column fields to read (must include "Txn_Date"), or None for All column fields.
+                      The Txn_ID column field is always read.
+    :return: dataframe type - ledger_df, with 0 rows for a user with No Expense Txns
+    """
+    ensure_partitioned_ledger()
+
+    if columns is not None and TXN_ID_FIELD not in columns:
+        columns = columns + [TXN_ID_FIELD]
+
+    with user_ledger_lock(username):
+        journal_df = read_user_journal(username)
+        if columns is not None:
+            journal_df = journal_df[columns]
+
+        ledger_df = read_shard_data(username, columns)
+        if ledger_df is None:
+            ledger_df = journal_df  # user's Txns are all still in the journal
+        elif journal_df.shape[0] > 0:
+            ledger_df = concat_expense_frames([ledger_df, journal_df], ignore_index=True)
+
+        if ledger_df[TXN_ID_FIELD].isna().any():
+            # one-time upgrade of a shard from before Txn IDs: save the New IDs, so they never change
+            if columns is not None:
+                return read_user_ledger(username)[columns]
+            return write_user_ledger(username, ledger_df)
+
+    if journal_df.shape[0] > 0:
+        # stable sort, so that Txns on the same Txn_Date stay in the order they were saved
+        ledger_df = ledger_df.sort_values("Txn_Date", kind="stable")
+
+    return index_by_txn_id(ledger_df)
+
+
+def new_txn_ids(count):
+    """
+    Generates New random Txn IDs - unique without a shared counter, so that sessions can add Txns independently.
+    IDs are below 2**53, so they are exact as JSON numbers too.
+    :param count: number of IDs to generate
+    :return: numpy array of int64 - txn_ids
+    """
+    return np.random.default_rng().integers(1, 2 ** 53, size=count, dtype=np.int64)
+
+
+def index_by_txn_id(ledger_df):
+    """
+    Sets the row index of a dataframe of Expense Txns to their Txn_ID column field.
+    pandas looks up a label in a (unique) row index through a hash table, built once per index -
+    so index.get_loc(txn_id) finds a Txn's position without scanning the rows.
+    :return: dataframe type - ledger_df, with Txn_ID values as its row index
+    """
+    txn_ids = ledger_df[TXN_ID_FIELD].to_numpy(dtype=np.int64)
+    return ledger_df.astype({TXN_ID_FIELD: np.int64}).set_axis(pd.Index(txn_ids), axis=0)
+
+
+def compact_expense_dtypes(ledger_df):
+    """
+    Converts a dataframe of Expense Txns to compact column types: categoricals for the column fields of
+    CATEGORY_FIELDS, and int64 (minor units) for Txn_Amount. Column fields already of these types are left as they are,
+    so this costs next to nothing for a dataframe that is compact already.
+    Categories are kept in sorted order - so sorting by Txn_Date still sorts by Date,
+    and reports grouped by Txn_Category list the categories alphabetically, as before.
+    :return: dataframe type - ledger_df, with compact column types
+    """
+    text_fields = [field for field in CATEGORY_FIELDS
+                   if field in ledger_df.columns and not isinstance(ledger_df[field].dtype, pd.CategoricalDtype)]
+    if text_fields:
+        # columns of Python objects (e.g. an empty column) as text first, so categories are always of the same type
+        object_fields = [field for field in text_fields if ledger_df[field].dtype == object]
+        if object_fields:
+            ledger_df = ledger_df.astype({field: str for field in object_fields})
+        ledger_df = ledger_df.astype({field: "category" for field in text_fields})
+    if "Txn_Amount" in ledger_df.columns and ledger_df["Txn_Amount"].dtype != np.int64:
+        ledger_df = ledger_df.astype({"Txn_Amount": np.int64})
+
+    for field in CATEGORY_FIELDS:
+        if field in ledger_df.columns and not ledger_df[field].cat.categories.is_monotonic_increasing:
+            categories = ledger_df[field].cat.categories.sort_values()
+            ledger_df = ledger_df.assign(**{field: ledger_df[field].cat.reorder_categories(categories)})
+
+    return ledger_df
+
+
+def concat_expense_frames(frames, ignore_index=False):
+    """
+    Same as pd.concat() for dataframes of Expense Txns, but keeps the compact column types:
+    pandas falls back to text for categoricals with different categories, so All frames are first given
+    the same (sorted) categories - the union of their categories (or distinct values, for a text column).
+    :return: dataframe type - the frames one after another, with compact column types
+    """
+    column_types = {}
+    for field in CATEGORY_FIELDS:
+        if field not in frames[0].columns:
+            continue
+        categories = pd.Index([], dtype=str)
+        for frame_df in frames:
+            if isinstance(frame_df[field].dtype, pd.CategoricalDtype):
+                categories = categories.union(frame_df[field].cat.categories)
+            else:
+                categories = categories.union(pd.Index(frame_df[field].unique()).astype(str))
+        column_types[field] = pd.CategoricalDtype(categories.sort_values())
+    if "Txn_Amount" in frames[0].columns:
+        column_types["Txn_Amount"] = np.dtype(np.int64)
+
+    # each frame is converted only where its column types differ
+    frames = [frame_df.astype({field: column_type for field, column_type in column_types.items()
+                               if frame_df[field].dtype != column_type}) for frame_df in frames]
+
+    return pd.concat(frames, ignore_index=ignore_index)
+
+
+@timed
+def write_user_ledger(username, ledger_df, txn_days=None):
+    """
+    Rewrites the given user's data file with All their Expense Txns, sorted by Txn_Date, and empties their journal.
+    Caller must hold user_ledger_lock(username), and pass in the user's whole ledger - data file and journal rows.
+    params: username - to write this user's shard
+            ledger_df - dataframe with All Expense Txns for this user. Txns with No Txn_ID are given a New one.
+            txn_days - Date index of ledger_df, if ledger_df is already sorted by Txn_Date. Else None.
+    :return: dataframe type - ledger_df, as written, with Txn_ID as its row index
+    """
+    os.makedirs(shard_dir_path(username), exist_ok=True)
+    ledger_df = compact_expense_dtypes(ledger_df)
+
+    if txn_days is None:
+        # Sort the dataframe by Txn_Date so that final Txn entries in the data file appear in order of Txn Date
+        ledger_df = ledger_df.sort_values("Txn_Date", kind="stable")
+        txn_days = build_date_index(ledger_df)
+
+    # give a Txn_ID to Txns saved before Txn IDs were added, or imported in bulk
+    if TXN_ID_FIELD not in ledger_df.columns:
+        ledger_df = ledger_df.assign(Txn_ID=pd.NA)
+    missing_ids = ledger_df[TXN_ID_FIELD].isna().to_numpy()
+    if missing_ids.any():
+        txn_ids = ledger_df[TXN_ID_FIELD].astype("Int64").to_numpy(dtype=np.int64, na_value=0)
+        txn_ids[missing_ids] = new_txn_ids(int(missing_ids.sum()))
+        ledger_df = ledger_df.assign(Txn_ID=txn_ids)
+
+    ledger_df = index_by_txn_id(ledger_df[LEDGER_FIELDS])
+
+    # Write the sorted Expense Entries df to database
+    write_shard_data(username, ledger_df, txn_days)
+
+    # journal rows are now part of the data file, so empty the journal
+    open(os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE), "w").close()
+
+    # the dataframe just written is exactly what the files now hold
+    cache_user_ledger(username, ledger_df, txn_days)
+
+    return ledger_df
+
+
+def shard_data_path(username):
+    # return path of the user's sorted data file - the columns list, if it was last written in "npy" format
+    columns_path = os.path.join(shard_dir_path(username), SHARD_COLUMNS_FILE)
+    if os.path.exists(columns_path):
+        return columns_path
+
+    return os.path.join(shard_dir_path(username), SHARD_DATA_FILE)
+
+
+def read_shard_data(username, columns=None, last_rows=None, row_range=None):
+    """
+    Reads the user's sorted data file, in whichever format it was last written in.
+    Only the given column fields are read from disk. In "npy" format, the amounts column is used straight
+    from the memory-mapped file, and text columns are rebuilt from small arrays of distinct values.
+    params: username - to read this user's data file
+            columns - list of column fields to read, or None for All column fields (LEDGER_FIELDS)
+            last_rows - read only this many rows from the end of the data file, or None for All rows.
+                        Only for a data file known to be sorted (see shard_data_is_sorted()).
+            row_range - tuple type - (first row, stop row) to read, or None for All rows. "npy" format only.
+    :return: dataframe type - data_df, or None if the user has No data file yet
+    """
+    data_path = shard_data_path(username)
+    if not os.path.exists(data_path):
+        return None
+
+    # data files written before Txn IDs were added have No Txn_ID column field - it is read as missing (<NA>)
+    columns = columns or LEDGER_FIELDS
+
+    if not data_path.endswith(SHARD_COLUMNS_FILE):
+        if last_rows is None:
+            # text column fields are parsed straight into categoricals (see compact_expense_dtypes())
+            column_types = {field: "category" for field in CATEGORY_FIELDS}
+            column_types["Txn_Amount"] = "int64"
+            column_types[TXN_ID_FIELD] = "Int64"
+            data_df = pd.read_csv(data_path, usecols=lambda column: column in columns, dtype=column_types)
+            return compact_expense_dtypes(data_df.reindex(columns=columns))
+
+        header, rows = read_last_csv_rows(data_path, last_rows)
+        data_df = pd.DataFrame(rows, columns=header).reindex(columns=columns)
+        for field in ("Txn_Amount", TXN_ID_FIELD):
+            if field in data_df.columns:
+                data_df[field] = pd.to_numeric(data_df[field])
+        return compact_expense_dtypes(data_df)
+
+    with open(data_path, "r") as file:
+        columns_dict = json.load(file)
+
+    # rows to take from each memory-mapped column - only these rows are ever touched on disk
+    first_row, stop_row = row_range or (0, columns_dict["rows"])
+    if last_rows is not None:
+        first_row = max(columns_dict["rows"] - last_rows, 0)
+
+    return shard_columns_frame(open_shard_columns(username, columns_dict, columns), first_row, stop_row)
+
+
+def open_shard_columns(username, columns_dict, columns):
+    """
+    Opens the NumPy column files of the user's "npy" data file, memory-mapped - Nothing is read from disk yet.
+    The arrays stay readable even after the data file is rewritten and the old column files are removed.
+    params: username - to open this user's column files
+            columns_dict - contents of the user's columns list (SHARD_COLUMNS_FILE)
+            columns - list of column fields to open
+    :return: dict type - {column field: list of arrays, or None for a column the data file doesn't have}
+    """
+    # an empty array can't be memory-mapped
+    mmap_mode = "r" if columns_dict["rows"] > 0 else None
+
+    column_files = {}
+    for field in columns:
+        if field not in columns_dict["columns"]:  # Txn_ID, in a data file from before Txn IDs
+            column_files[field] = None
+            continue
+
+        files = [os.path.join(shard_dir_path(username), file_name) for file_name in columns_dict["columns"][field]]
+        column_files[field] = [np.load(files[0], mmap_mode=mmap_mode)] + [np.load(file) for file in files[1:]]
+
+    return column_files
+
+
+def shard_columns_frame(column_files, first_row, stop_row):
+    """
+    Builds a dataframe of Expense Txns from a range of rows of the column files opened by open_shard_columns().
+    :return: dataframe type - data_df, with rows first_row to stop_row (Not included)
+    """
+    column_arrays = {}
+    for field, arrays in column_files.items():
+        if arrays is None:
+            column_arrays[field] = pd.array([pd.NA] * (stop_row - first_row), dtype="Int64")
+        elif field == "Txn_Date":  # saved as epoch days - each distinct day is turned into text only once
+            days, codes = np.unique(arrays[0][first_row:stop_row], return_inverse=True)
+            column_arrays[field] = pd.Categorical.from_codes(codes, np.datetime_as_string(days.astype("datetime64[D]")))
+        elif field == "Txn_Amount" or field == TXN_ID_FIELD:
+            column_arrays[field] = arrays[0][first_row:stop_row]
+        else:  # saved as codes into an array of distinct values - which is a categorical already
+            column_arrays[field] = pd.Categorical.from_codes(arrays[0][first_row:stop_row], arrays[1])
+
+    return compact_expense_dtypes(pd.DataFrame(column_arrays, copy=False))
+
+
+def write_shard_data(username, ledger_df, txn_days):
+    """
+    Writes the user's sorted data file in LEDGER_FORMAT, and removes the data file of the other format, if any.
+    In "npy" format, each column field is saved to its own NumPy file, named with a new generation number,
+    and the columns list is replaced last - so a reader never sees a mix of old and new column files.
+    params: username - to write this user's data file
+            ledger_df - dataframe with All Expense Txns for this user, sorted by Txn_Date
+            txn_days - Date index of ledger_df
+    """
+    shard_dir = shard_dir_path(username)
+    csv_path = os.path.join(shard_dir, SHARD_DATA_FILE)
+    columns_path = os.path.join(shard_dir, SHARD_COLUMNS_FILE)
+
+    sorted_path = os.path.join(shard_dir, SHARD_SORTED_FILE)
+
+    if LEDGER_FORMAT != "npy":
+        replace_file(csv_path, lambda file: ledger_df.to_csv(file, index=False))
+
+        # record that the data file, as it is now, is sorted by Txn_Date
+        stat = os.stat(csv_path)
+        replace_file(sorted_path, lambda file: json.dump([stat.st_mtime_ns, stat.st_size], file))
+
+        if os.path.exists(columns_path):
+            os.remove(columns_path)
+        remove_column_files(shard_dir, keep=[])
+        return
+
+    generation = str(time.time_ns())
+    columns_dict = {"rows": ledger_df.shape[0], "columns": {}}
+
+    for field in LEDGER_FIELDS:
+        file_prefix = "data." + generation + "." + field
+
+        if field == "Txn_Date":  # the Date index holds Txn_Date as epoch days
+            arrays = [txn_days.astype(np.int32)]
+        elif field == "Txn_Amount":
+            arrays = [ledger_df[field].to_numpy(dtype=np.int64)]
+        elif field == TXN_ID_FIELD:
+            arrays = [ledger_df[field].to_numpy(dtype=np.int64)]
+        else:  # text columns have few distinct values - save codes, and the distinct values once
+            codes, values = pd.factorize(ledger_df[field], use_na_sentinel=False)
+            arrays = [codes.astype(np.int32), np.asarray(values, dtype=str)]
+
+        file_names = []
+        for number, array in enumerate(arrays):
+            file_names.append(file_prefix + "." + str(number) + ".npy")
+            np.save(os.path.join(shard_dir, file_names[-1]), array)
+        columns_dict["columns"][field] = file_names
+
+    replace_file(columns_path, lambda file: json.dump(columns_dict, file))
+
+    for file_path in (csv_path, sorted_path):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    remove_column_files(shard_dir, keep=[name for names in columns_dict["columns"].values() for name in names])
+
+
+def shard_data_is_sorted(username):
+    """
+    Checks if the user's data file is known to be sorted by Txn_Date - that is, it was last written by
+    write_shard_data(), and hasn't been changed since. "npy" data files are only ever written sorted.
+    :return: True if the data file is known to be sorted, else False
+    """
+    data_path = shard_data_path(username)
+    if data_path.endswith(SHARD_COLUMNS_FILE):
+        return True
+
+    try:
+        with open(os.path.join(shard_dir_path(username), SHARD_SORTED_FILE), "r") as file:
+            sorted_version = json.load(file)
+        stat = os.stat(data_path)
+    except (OSError, ValueError):
+        return False
+
+    return sorted_version == [stat.st_mtime_ns, stat.st_size]
+
+
+def shard_has_txn_ids(username):
+    # check if the user's data file has the Txn_ID column field - data files from before Txn IDs don't
+    data_path = shard_data_path(username)
+    if data_path.endswith(SHARD_COLUMNS_FILE):
+        with open(data_path, "r") as file:
+            return TXN_ID_FIELD in json.load(file)["columns"]
+
+    with open(data_path, "r", newline="") as file:
+        return TXN_ID_FIELD in next(csv.reader(file), [])
+
+
+def read_last_csv_rows(file_path, count, block_size=8192):
+    """
+    Reads the last rows of a csv file by scanning backward from the end of the file, one block at a time,
+    until it has found enough rows - so the time taken doesn't depend on the size of the file.
+    params: file_path - csv file, with a header line
+            count - number of rows to read from the end of the file
+            block_size - number of bytes read at a time
+    :return: tuple type - (header, rows) - list of column names, and up to 'count' rows as lists, in file order
+    """
+    with open(file_path, "rb") as file:
+        header = next(csv.reader([file.readline().decode()]))
+        header_end = file.tell()
+
+        file.seek(0, os.SEEK_END)
+        position = file.tell()
+        data = b""
+
+        # count + 1 line breaks are needed, to be sure the first of the last 'count' rows is complete
+        while position > header_end and data.count(b"\n") <= count:
+            read_size = min(block_size, position - header_end)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + data
+
+    # split into lines while still bytes - a block can start in the middle of a multi-byte (UTF-8) character,
+    # which is only in the first line, so that line is dropped before anything is decoded
+    byte_lines = data.split(b"\n")
+    if position > header_end:
+        byte_lines = byte_lines[1:]  # first line is only part of a row
+    if byte_lines and byte_lines[-1] == b"":
+        byte_lines = byte_lines[:-1]  # nothing after the last line break
+
+    # only "\n" ends a row - splitlines() would also split at "\r", "\x0b" or "\u2028" inside a field value
+    lines = [line.decode().rstrip("\r") for line in byte_lines[-count:]] if count > 0 else []
+
+    return header, list(csv.reader(lines))
+
+
+def remove_column_files(shard_dir, keep):
+    # remove NumPy column files of earlier generations from a shard directory, except file names in keep
+    for file_name in os.listdir(shard_dir):
+        if file_name.startswith("data.") and file_name.endswith(".npy") and file_name not in keep:
+            try:
+                os.remove(os.path.join(shard_dir, file_name))
+            except OSError:
+                pass  # still memory-mapped by a reader (Windows) - removed at the next write
+
+
+def convert_ledger_format():
+    """
+    Rewrites the sorted data files of All Users in LEDGER_FORMAT, merging in their journals:
+    EXPENSE_TRACKER_LEDGER_FORMAT=npy python expense_tracker_final.py convert-format
+    """
+    ensure_partitioned_ledger()
+    for username in list_shard_usernames():
+        with user_ledger_lock(username):
+            rollups = load_user_rollups(username)
+            write_user_ledger(username, read_user_ledger(username))
+            save_user_rollups(username, rollups)
+
+
+def to_epoch_day(date_str):
+    # convert a 'yyyy-mm-dd' Date string to number of days since 1970-01-01
+    return int(np.datetime64(date_str, "D").astype(np.int64))
+
+
+def build_date_index(ledger_df):
+    """
+    Builds the Date index for a dataframe of Expense Txns already sorted by Txn_Date:
+    an array with the Txn_Date of each row, as epoch days, in the same order as the rows.
+    Binary search on this array finds the rows for a Date range, without comparing Date strings row by row.
+    :return: numpy array of int32 - txn_days
+    """
+    txn_dates = pd.to_datetime(ledger_df["Txn_Date"], format="%Y-%m-%d").to_numpy()
+    return txn_dates.astype("datetime64[D]").astype(np.int32)
+
+
+def shard_version(username):
+    """
+    Returns a version stamp of the user's shard files - modification time and size of data file and journal.
+    It changes whenever either file is written, by this process or any other.
+    """
+    version = []
+    for file_path in (shard_data_path(username), os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE)):
+        try:
+            stat = os.stat(file_path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            version.append(None)
+
+    return tuple(version)
+
+
+def cache_user_ledger(username, ledger_df, txn_days):
+    """
+    Saves the user's parsed Expense Txns and their Date index in the ledger cache,
+    stamped with the current version of their shard files.
+    Least recently used entries are evicted to keep the cache under LEDGER_CACHE_MAX_MB.
+    Caller must hold user_ledger_lock(username), and ledger_df must match what the shard files currently hold.
+    """
+    global ledger_cache_bytes
+
+    invalidate_ledger_cache(username)
+
+    size = int(ledger_df.memory_usage(deep=True).sum()) + txn_days.nbytes
+    max_bytes = LEDGER_CACHE_MAX_MB * 1024 * 1024
+    if size > max_bytes:
+        return  # too big to cache
+
+    ledger_cache[username] = (shard_version(username), ledger_df, txn_days, size)
+    ledger_cache_bytes += size
+
+    # evict least recently used users
+    while ledger_cache_bytes > max_bytes:
+        evicted_username, evicted_entry = ledger_cache.popitem(last=False)
+        ledger_cache_bytes -= evicted_entry[3]
+
+
+def invalidate_ledger_cache(username):
+    # drop the user's Expense Txns from the ledger cache
+    global ledger_cache_bytes
+
+    entry = ledger_cache.pop(username, None)
+    if entry is not None:
+        ledger_cache_bytes -= entry[3]
+
+
+def current_cache_entry(username):
+    # return the user's ledger cache entry if the shard files haven't changed since it was cached, else None
+    entry = ledger_cache.get(username)
+    if entry is not None and entry[0] == shard_version(username):
+        return entry
+
+    return None
+
+
+def fetch_indexed_user_ledger(username):
+    """
+    Returns the user's Expense Txns and their Date index from the ledger cache,
+    if the shard files haven't changed since they were cached.
+    Otherwise reads them from file with read_user_ledger(), builds the Date index, and caches them.
+    Note: the returned dataframe is shared with the cache - filter or copy it, but do not modify it in place.
+    :return: tuple type - (ledger_df, txn_days)
+    """
+    with user_ledger_lock(username):
+        entry = current_cache_entry(username)
+        if entry is not None:
+            ledger_cache.move_to_end(username)  # mark as most recently used
+            return entry[1], entry[2]
+
+        ledger_df = read_user_ledger(username)
+        txn_days = build_date_index(ledger_df)
+        cache_user_ledger(username, ledger_df, txn_days)
+
+    return ledger_df, txn_days
+
+
+@timed
+def fetch_user_expenses_by_daterange(username, start_date, end_date):
+    """
+    Fetch Expense Txns for the given user, with Txn_Date from Start Date to End Date (both included).
+    Uses binary search on the Date index, so only the rows in the Date range are touched.
+    params: username - to fetch Expense Txns for this user
+            start_date, end_date - string type, in 'yyyy-mm-dd' format
+    :return: dataframe type - daterange_expenses_df, sorted by Txn_Date, or None if data could not be read
+    """
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            return sqlite_fetch_user_expenses(username, start_date, end_date)
+
+        ledger_df, txn_days = fetch_indexed_user_ledger(username)
+    except Exception as error:
+        print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+        log_event("ledger_read_failed", "ERROR", error, username=username,
+                  function="fetch_user_expenses_by_daterange")
+        return None
+
+    first_row = np.searchsorted(txn_days, to_epoch_day(start_date), side="left")
+    last_row = np.searchsorted(txn_days, to_epoch_day(end_date), side="right")
+
+    return ledger_df.iloc[first_row:last_row]
+
+
+@timed
+def compact_user_journal(username):
+    """
+    Merges the journal of New Expense Txns into the user's data file, so the data file stays sorted by Txn_Date.
+    Runs in the background once the journal gets big (see schedule_journal_compaction()),
+    and explicitly at user Logout.
+    """
+    with user_ledger_lock(username):
+        # nothing to merge
+        journal_df = read_user_journal(username)
+        journal_rows = journal_df.shape[0]
+        if journal_rows == 0:
+            return
+
+        # totals don't change, but are re-stamped with the new version of the shard files
+        rollups = load_user_rollups(username)
+        cube_df = load_user_cube(username)
+        write_user_ledger(username, read_user_ledger(username))
+        save_user_rollups(username, rollups)
+
+        # the spend cube of the data file now also has the journal Txns
+        save_user_cube(username, merge_cube_cells([cube_df, spend_cube_cells(journal_df)]))
+
+    log_event("journal_compacted", username=username, journal_rows=journal_rows)
+
+
+def compact_all_journals():
+    # merge journals of All Users into their data files
+    ensure_partitioned_ledger()
+    for username in list_shard_usernames():
+        compact_user_journal(username)
+
+
+def schedule_journal_compaction(username):
+    """
+    Starts compaction of the user's journal in a background thread, once it grows past JOURNAL_COMPACT_SIZE.
+    Only one compaction runs at a time.
+    """
+    global compaction_thread
+
+    try:
+        journal_size = os.path.getsize(os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE))
+    except OSError:
+        return
+
+    if journal_size < JOURNAL_COMPACT_SIZE:
+        return
+
+    if compaction_thread is not None and compaction_thread.is_alive():
+        return
+
+    # Note: not a daemon thread, so the program waits for the data file to be fully written before it exits
+    compaction_thread = threading.Thread(target=compact_user_journal, args=(username,), name="journal-compaction")
+    compaction_thread.start()
+
+
+def rollup_version_stamp(username):
+    # version of the user's shard files, in the form it is saved in the rollups file (JSON lists)
+    return [list(version) if version is not None else None for version in shard_version(username)]
+
+
+def rebuild_user_rollups(username):
+    """
+    Rebuilds the user's monthly rollups from All their Expense Txns, and saves them to the rollups file.
+    Rollups hold, for each (year-month, Txn_Category): [count, sum, max, sum of squares] of Txn_Amount -
+    count, sum and max as exact integers (minor units), sum of squares as a float, as it may not fit in an int64.
+    :return: dict type - rollups, as saved to file
+    """
+    with user_ledger_lock(username):
+        ledger_df = fetch_indexed_user_ledger(username)[0]
+
+        # group Txns by year-month of Txn_Date, and Txn_Category
+        rollup_df = ledger_df.assign(Year_Month=ledger_df["Txn_Date"].str[:7],
+                                     Amount_Squared=ledger_df["Txn_Amount"].astype(np.float64) ** 2)
+        rollup_df = rollup_df.groupby(["Year_Month", "Txn_Category"], observed=True).agg(
+            count=("Txn_Amount", "count"),
+            sum=("Txn_Amount", "sum"),
+            max=("Txn_Amount", "max"),
+            sum_sq=("Amount_Squared", "sum"))
+
+        months = {}
+        for (year_month, category), row in zip(rollup_df.index, rollup_df.itertuples(index=False)):
+            months.setdefault(year_month, {})[category] = [int(row.count), int(row.sum),
+                                                           int(row.max), float(row.sum_sq)]
+
+        rollups = {"months": months}
+        save_user_rollups(username, rollups)
+
+    log_event("rollups_rebuilt", username=username)
+    return rollups
+
+
+def rebuild_all_rollups():
+    # rebuild monthly rollups and spend cubes of All Users, for recovery:
+    # python expense_tracker_final.py rebuild-rollups
+    ensure_partitioned_ledger()
+    for username in list_shard_usernames():
+        rebuild_user_rollups(username)
+        rebuild_user_cube(username)
+
+
+def save_user_rollups(username, rollups):
+    """
+    Saves the user's monthly rollups to file, stamped with the current version of their shard files.
+    Caller must hold user_ledger_lock(username), and rollups must match what the shard files currently hold.
+    """
+    rollups["version"] = rollup_version_stamp(username)
+
+    os.makedirs(shard_dir_path(username), exist_ok=True)
+    replace_file(os.path.join(shard_dir_path(username), SHARD_ROLLUP_FILE), lambda file: json.dump(rollups, file))
+
+
+def load_user_rollups(username):
+    """
+    Loads the user's monthly rollups from file.
+    If the file is missing, damaged, or out of date with the shard files (for example, the program stopped
+    between writing a Txn and its rollup), the rollups are rebuilt from the user's Expense Txns.
+    :return: dict type - rollups
+    """
+    with user_ledger_lock(username):
+        try:
+            with open(os.path.join(shard_dir_path(username), SHARD_ROLLUP_FILE), "r") as file:
+                rollups = json.load(file)
+            if rollups.get("version") == rollup_version_stamp(username):
+                return rollups
+        except (OSError, ValueError):
+            pass
+
+        return rebuild_user_rollups(username)
+
+
+def add_to_rollups(rollups, txn_date, txn_category, txn_amount):
+    # add one New Expense Txn to the (year-month, Txn_Category) totals of the user's rollups
+    totals = rollups["months"].setdefault(txn_date[:7], {}).get(txn_category)
+    if totals is None:
+        rollups["months"][txn_date[:7]][txn_category] = [1, txn_amount, txn_amount, float(txn_amount) ** 2]
+    else:
+        totals[0] += 1
+        totals[1] += txn_amount
+        totals[2] = max(totals[2], txn_amount)
+        totals[3] += float(txn_amount) ** 2
+
+
+def recompute_rollup(rollups, ledger_df, txn_days, year_month, txn_category):
+    """
+    Recomputes the (year-month, Txn_Category) totals of the user's rollups from their Expense Txns,
+    after a Txn in that group was edited or deleted. Max of a group cannot be updated by subtraction,
+    so only this group is recomputed - its Txns are found with a binary search on the Date index.
+    :return: dataframe type - Expense Txns of the group, to recompute its spend cube cells from
+    """
+    month = np.datetime64(year_month, "M")
+    first_row = np.searchsorted(txn_days, month.astype("datetime64[D]").astype(np.int32), side="left")
+    last_row = np.searchsorted(txn_days, (month + 1).astype("datetime64[D]").astype(np.int32), side="left")
+
+    month_df = ledger_df.iloc[first_row:last_row]
+    group_df = month_df[month_df["Txn_Category"] == txn_category]
+    amounts = group_df["Txn_Amount"]
+
+    month_totals = rollups["months"].setdefault(year_month, {})
+    if amounts.shape[0] == 0:
+        month_totals.pop(txn_category, None)
+        if len(month_totals) == 0:
+            rollups["months"].pop(year_month)
+    else:
+        month_totals[txn_category] = [int(amounts.shape[0]), int(amounts.sum()),
+                                      int(amounts.max()), float((amounts.astype(np.float64) ** 2).sum())]
+
+    return group_df
+
+
+def spend_cube_cells(txns_df):
+    """
+    Aggregates Expense Txns into spend cube cells: count, sum and max of Txn_Amount (exact integers, minor units)
+    for each (year-month, Txn_Category, Txn_Country, MerchantName) that has Txns.
+    :return: dataframe type - cube_df, with columns: CUBE_DIMENSIONS, count, sum, max
+    """
+    cube_df = txns_df.assign(Year_Month=txns_df["Txn_Date"].str[:7].astype("category"))
+    cube_df = cube_df.groupby(CUBE_DIMENSIONS, observed=True)["Txn_Amount"].agg(["count", "sum", "max"])
+
+    return cube_df.reset_index().astype(cube_column_types())
+
+
+def cube_column_types():
+    # column types of a spend cube dataframe - dimensions as categoricals, count/ sum/ max as exact integers
+    column_types = {field: "category" for field in CUBE_DIMENSIONS}
+    column_types.update({"count": np.int64, "sum": np.int64, "max": np.int64})
+    return column_types
+
+
+def concat_cube_cells(cube_frames):
+    # same as pd.concat() for spend cube cells - frames are first given the same categories for each dimension,
+    # as pandas falls back to text for categoricals with different categories (see concat_expense_frames())
+    column_types = {}
+    for field in CUBE_DIMENSIONS:
+        categories = cube_frames[0][field].cat.categories
+        for frame_df in cube_frames[1:]:
+            categories = categories.union(frame_df[field].cat.categories)
+        column_types[field] = pd.CategoricalDtype(categories)
+
+    return pd.concat([frame_df.astype(column_types) for frame_df in cube_frames], ignore_index=True)
+
+
+def merge_cube_cells(cube_frames):
+    # add up spend cube cells of the same (year-month, Txn_Category, Txn_Country, MerchantName) from several frames
+    # counts and sums add up, max is the max of maxes
+    cube_df = concat_cube_cells(cube_frames)
+    return cube_df.groupby(CUBE_DIMENSIONS, observed=True, as_index=False, sort=False).agg(
+        {"count": "sum", "sum": "sum", "max": "max"})
+
+
+def rebuild_user_cube(username):
+    """
+    Rebuilds the user's spend cube from the Expense Txns in their data file, and saves it to the cube file.
+    Txns still in the journal are Not in the cube file - they are added when the cube is queried
+    (see fetch_spend_cube()), so saving a New Txn never has to rewrite the cube file.
+    :return: dataframe type - cube_df, as saved to file
+    """
+    with user_ledger_lock(username):
+        data_df = read_shard_data(username, ["Txn_Date", "Txn_Amount", "Txn_Category", "MerchantName",
+                                             "Txn_Country"])
+        if data_df is None:
+            data_df = compact_expense_dtypes(pd.DataFrame(columns=LEDGER_FIELDS))
+
+        cube_df = spend_cube_cells(data_df)
+        save_user_cube(username, cube_df)
+
+    log_event("cube_rebuilt", username=username)
+    return cube_df
+
+
+def save_user_cube(username, cube_df):
+    """
+    Saves the user's spend cube to file, stamped with the current version of their data file.
+    Cells are saved one list per column - each dimension as its distinct values (categories), and a small integer
+    code per cell, as the "npy" data format does for text columns - so loading it needs No text parsing per cell.
+    Caller must hold user_ledger_lock(username), and cube_df must match what the data file currently holds.
+    """
+    cells = {}
+    for field in CUBE_DIMENSIONS:
+        cells[field] = {"categories": cube_df[field].cat.categories.tolist(),
+                        "codes": cube_df[field].cat.codes.tolist()}
+    for field in ("count", "sum", "max"):
+        cells[field] = cube_df[field].tolist()
+    cube = {"version": rollup_version_stamp(username)[0], "cells": cells}
+
+    os.makedirs(shard_dir_path(username), exist_ok=True)
+    # written as one string - json.dump() writes many small pieces, which is slow for a big cube
+    replace_file(os.path.join(shard_dir_path(username), SHARD_CUBE_FILE), lambda file: file.write(json.dumps(cube)))
+
+
+def load_user_cube(username):
+    """
+    Loads the user's spend cube from file - the cells of the Expense Txns in their data file (Not the journal).
+    If the file is missing, damaged, or out of date with the data file, the cube is rebuilt from the data file.
+    :return: dataframe type - cube_df, with columns: CUBE_DIMENSIONS, count, sum, max
+    """
+    with user_ledger_lock(username):
+        try:
+            with open(os.path.join(shard_dir_path(username), SHARD_CUBE_FILE), "r") as file:
+                cube = json.load(file)
+            if cube.get("version") == rollup_version_stamp(username)[0]:
+                cells = cube["cells"]
+                columns = {}
+                for field in CUBE_DIMENSIONS:
+                    columns[field] = pd.Categorical.from_codes(cells[field]["codes"],
+                                                               categories=cells[field]["categories"])
+                for field in ("count", "sum", "max"):
+                    columns[field] = np.array(cells[field], dtype=np.int64)
+                return pd.DataFrame(columns)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        return rebuild_user_cube(username)
+
+
+def refresh_cube_cells(cube_df, journal_df, group_frames):
+    """
+    Brings the user's spend cube up to date after their data file was rewritten with edited/ deleted Txns:
+    Txns that were in the journal are added, and the cells of each changed (year-month, Txn_Category)
+    are replaced with cells recomputed from the Txns of that group - only these groups are recomputed.
+    params: cube_df - spend cube of the data file before it was rewritten (see load_user_cube())
+            journal_df - Txns that were in the journal before it was emptied
+            group_frames - dict type - {(year-month, Txn_Category): Expense Txns of the group after the change}
+                           of each changed group (see recompute_rollup())
+    :return: dataframe type - cube_df of the rewritten data file
+    """
+    if journal_df.shape[0] > 0:
+        cube_df = merge_cube_cells([cube_df, spend_cube_cells(journal_df)])
+
+    changed_groups = pd.MultiIndex.from_tuples(list(group_frames.keys()))
+    in_changed_groups = pd.MultiIndex.from_frame(cube_df[["Year_Month", "Txn_Category"]]).isin(changed_groups)
+
+    return merge_cube_cells([cube_df[~in_changed_groups]] +
+                            [spend_cube_cells(group_df) for group_df in group_frames.values()])
+
+
+@timed
+def remove_expense_entry_from_file(username, txn_id):
+    """
+    Deletes an Expense Txn record from the user's data file, found by its Txn_ID
+    params: username - to delete Txn record from this user's data file
+            txn_id - int - Txn_ID of the Txn record to delete.
+    Raises KeyError if the user has No Expense Txn with this Txn_ID (for example, already deleted in another session).
+    """
+    apply_expense_changes(username, {txn_id: None})
+
+
+@timed
+def update_expense_entry_in_file(expense_entry_list, txn_id):
+    """
+    Updates Expense Txn record in data file, as per the arguments received.
+    params: expense_entry_list: Updated Expense Txn record stored as a List type, with username as the first element.
+            txn_id: Txn_ID of this Expense Txn record - it stays the same after the update.
+    Raises KeyError if the user has No Expense Txn with this Txn_ID (for example, deleted in another session).
+    """
+    apply_expense_changes(expense_entry_list[0], {txn_id: list(expense_entry_list)})
+
+
+@timed
+def apply_expense_changes(username, expense_changes):
+    """
+    Saves a batch of edits and deletes of the user's Expense Txns together, in one write of their data file -
+    so that changing many entries costs the same single write as changing one.
+    If any Txn_ID is Not found, No change is saved at all.
+    params: username - to change Expense Txns of this user
+            expense_changes - dict type - {Txn_ID: Updated Expense entry List (with username as the first element),
+                              or None to delete the Expense Txn}
+    Raises KeyError if the user has No Expense Txn with one of these Txn_IDs (for example, deleted in another session).
+    """
+    deleted_count = sum(expense_entry_list is None for expense_entry_list in expense_changes.values())
+
+    if STORAGE_BACKEND == "sqlite":
+        sqlite_apply_expense_changes(username, expense_changes)
+        log_event("expenses_changed", username=username, updated=len(expense_changes) - deleted_count,
+                  deleted=deleted_count)
+        return
+
+    with user_ledger_lock(username):
+        # this user's data file and journal, loaded into a dataframe, with its Date index, rollups and spend cube
+        user_expenses_df, txn_days = fetch_indexed_user_ledger(username)
+        rollups = load_user_rollups(username)
+        cube_df = load_user_cube(username)
+        journal_df = read_user_journal(username)
+
+        # find All changed Expense Txn records by their Txn_ID - hash lookups in the row index
+        txn_ids = list(expense_changes.keys())
+        positions = user_expenses_df.index.get_indexer(txn_ids)
+        if (positions < 0).any():
+            raise KeyError(txn_ids[int(np.argmin(positions))])
+        old_txns_df = user_expenses_df.iloc[positions]
+
+        # take the changed records out of the dataframe and Date index, All in one pass
+        keep_rows = np.ones(user_expenses_df.shape[0], dtype=bool)
+        keep_rows[positions] = False
+        user_expenses_df = user_expenses_df[keep_rows]
+        txn_days = txn_days[keep_rows]
+
+        # Updated records, in order of their (possibly new) Txn_Date ...
+        updated_entries = []
+        for txn_id, expense_entry_list in expense_changes.items():
+            if expense_entry_list is not None:
+                updated_entries.append(list(expense_entry_list) + [txn_id])
+        updated_df = pd.DataFrame(updated_entries, columns=LEDGER_FIELDS, index=[row[-1] for row in updated_entries])
+
+        if updated_df.shape[0] > 0:
+            updated_df = updated_df.sort_values("Txn_Date", kind="stable")
+            updated_days = build_date_index(updated_df)
+
+            # ... are put back in at the positions for their Txn_Date, found by binary search, in a single insert
+            insert_positions = np.searchsorted(txn_days, updated_days, side="right")
+            row_order = np.insert(np.arange(user_expenses_df.shape[0]), insert_positions,
+                                  user_expenses_df.shape[0] + np.arange(updated_df.shape[0]))
+            user_expenses_df = concat_expense_frames([user_expenses_df, updated_df]).iloc[row_order]
+            txn_days = np.insert(txn_days, insert_positions, updated_days)
+
+        # Write the sorted Expense Entries df to database
+        write_user_ledger(username, user_expenses_df, txn_days)
+
+        # update monthly totals of every (month, category) a changed Txn was in, before or after the change
+        changed_groups = set(zip(old_txns_df["Txn_Date"].str[:7], old_txns_df["Txn_Category"]))
+        changed_groups.update(zip(updated_df["Txn_Date"].str[:7], updated_df["Txn_Category"]))
+        group_frames = {}
+        for year_month, txn_category in changed_groups:
+            group_frames[(year_month, txn_category)] = recompute_rollup(rollups, user_expenses_df, txn_days,
+                                                                        year_month, txn_category)
+        save_user_rollups(username, rollups)
+        save_user_cube(username, refresh_cube_cells(cube_df, journal_df, group_frames))
+
+    log_event("expenses_changed", username=username, updated=len(expense_changes) - deleted_count,
+              deleted=deleted_count)
+
+
+def select_expense_rows(ledger_df, txn_days, filters):
+    """
+    Finds the user's Expense Txns matching All the given filters, in one vectorized pass over the columns.
+    params: ledger_df, txn_days - user's Expense Txns and their Date index (see fetch_indexed_user_ledger())
+            filters - dict type, any of: "start", "end" ('yyyy-mm-dd', both included), "Txn_Category",
+                      "MerchantName", "Txn_Country" (equal, ignoring upper/ lower case),
+                      "min_amount", "max_amount" (in minor units, both included)
+    :return: numpy array of bool - True for each matching row of ledger_df
+    """
+    matches = np.ones(ledger_df.shape[0], dtype=bool)
+
+    # Date range - rows outside it are found by binary search on the Date index
+    if filters.get("start") is not None:
+        matches[:np.searchsorted(txn_days, to_epoch_day(filters["start"]), side="left")] = False
+    if filters.get("end") is not None:
+        matches[np.searchsorted(txn_days, to_epoch_day(filters["end"]), side="right"):] = False
+
+    for field in ("Txn_Category", "MerchantName", "Txn_Country"):
+        if filters.get(field) is not None:
+            matches &= (ledger_df[field].str.lower() == filters[field].lower()).to_numpy()
+
+    if filters.get("min_amount") is not None:
+        matches &= ledger_df["Txn_Amount"].to_numpy() >= filters["min_amount"]
+    if filters.get("max_amount") is not None:
+        matches &= ledger_df["Txn_Amount"].to_numpy() <= filters["max_amount"]
+
+    return matches
+
+
+@timed
+def bulk_change_expenses(username, filters, new_values=None, commit=False):
+    """
+    Bulk update or delete of the user's Expense Txns matching the filters - e.g. recategorise every "Costco" Txn
+    from Groceries to Personal/ Household, delete a Date range, or fill in "none_given" Merchant Names.
+    The matching rows are found, and changed, in one vectorized pass, and saved in one write of the data file.
+    params: username - to change Expense Txns of this user
+            filters - dict type - which Txns to change, see select_expense_rows()
+            new_values - dict type - {column field: New value} to set in All matching Txns
+                         ("Txn_Category", "MerchantName", "Txn_Country"), or None to delete them
+            commit - False to only preview the changes, True to save them
+    :return: dataframe type - matching Expense Txns, as they were before the change
+    """
+    if STORAGE_BACKEND == "sqlite":
+        matched_df = sqlite_bulk_change_expenses(username, filters, new_values, commit)
+        if commit and matched_df.shape[0] > 0:
+            log_event("bulk_change", username=username, filters=filters, new_values=new_values,
+                      rows=matched_df.shape[0])
+        return matched_df
+
+    with user_ledger_lock(username):
+        user_expenses_df, txn_days = fetch_indexed_user_ledger(username)
+        matches = select_expense_rows(user_expenses_df, txn_days, filters)
+        matched_df = user_expenses_df[matches]
+
+        if not commit or matched_df.shape[0] == 0:
+            return matched_df
+
+        rollups = load_user_rollups(username)
+        cube_df = load_user_cube(username)
+        journal_df = read_user_journal(username)
+
+        if new_values is None:  # DELETE matching Txns, and their entries in the Date index
+            user_expenses_df = user_expenses_df[~matches]
+            txn_days = txn_days[~matches]
+        else:  # set New values in matching Txns - Txn_Date doesn't change, so the order stays the same
+            user_expenses_df = user_expenses_df.copy()
+            for field, value in new_values.items():
+                # a categorical column only takes values from its categories
+                if value not in user_expenses_df[field].cat.categories:
+                    user_expenses_df[field] = user_expenses_df[field].cat.add_categories([value])
+                user_expenses_df.loc[matches, field] = value
+
+        # Write the updated Expense Entries df to database
+        write_user_ledger(username, user_expenses_df, txn_days)
+
+        # update monthly totals of every (month, category) a changed Txn was in, before and after the change
+        changed_groups = set(zip(matched_df["Txn_Date"].str[:7], matched_df["Txn_Category"]))
+        if new_values is not None and "Txn_Category" in new_values:
+            changed_groups.update((year_month, new_values["Txn_Category"]) for year_month, _ in list(changed_groups))
+        group_frames = {}
+        for year_month, txn_category in changed_groups:
+            group_frames[(year_month, txn_category)] = recompute_rollup(rollups, user_expenses_df, txn_days,
+                                                                        year_month, txn_category)
+        save_user_rollups(username, rollups)
+        save_user_cube(username, refresh_cube_cells(cube_df, journal_df, group_frames))
+
+    log_event("bulk_change", username=username, filters=filters, new_values=new_values, rows=matched_df.shape[0])
+    return matched_df
+
+
+@timed
+def save_expense_entry_to_file(expense_entry_list):
+    """
+    Save the Expense Entry to file/ database
+    New entries are appended to the user's journal and are durable as soon as this returns.
+    They are merged into the user's sorted data file later, by compact_user_journal().
+    :param expense_entry_list: holds values for all column fields of TXN_FIELDS.
+    :return: Txn_ID given to the New Expense Txn, or None if it could not be saved
+    """
+    username = expense_entry_list[0]
+    txn_id = int(new_txn_ids(1)[0])
+
+    if STORAGE_BACKEND == "sqlite":
+        sqlite_save_expense_entry(expense_entry_list, txn_id)
+        log_event("expense_saved", username=username, txn_id=txn_id)
+        return txn_id
+
+    ensure_partitioned_ledger()
+
+    txn_saved = False
+    try:
+        with user_ledger_lock(username):
+            # monthly totals as they are before the New Txn - loaded first, as they would be rebuilt (with the
+            # New Txn already in them) once the journal changes. If they can't be loaded, the rollups file is
+            # left as it is: it is then out of date with the journal, and rebuilt when next needed
+            try:
+                rollups = load_user_rollups(username)
+            except Exception as error:
+                log_event("rollups_update_failed", "ERROR", error, username=username)
+                rollups = None
+
+            # cached Txns for this user are still current, so they can be patched instead of re-read
+            entry = current_cache_entry(username)
+
+            # Write the new Expense Entry to the user's journal in 'Append' mode
+            os.makedirs(shard_dir_path(username), exist_ok=True)
+            with open(os.path.join(shard_dir_path(username), SHARD_JOURNAL_FILE), "a", newline="") as file:
+                csv.writer(file).writerow(expense_entry_list + [txn_id])
+                file.flush()
+                os.fsync(file.fileno())  # make sure the entry is on disk before confirming to the user
+            txn_saved = True
+
+            # the entry is saved - from here on, an error only leaves the ledger cache or the rollups file out of
+            # date, and they are re-read/ rebuilt from the shard files when next needed
+            try:
+                if entry is not None:
+                    ledger_df, txn_days = entry[1], entry[2]
+
+                    # new journal row is indexed by its Txn_ID, same as read_user_ledger() would give it
+                    expense_df = pd.DataFrame([expense_entry_list + [txn_id]], columns=LEDGER_FIELDS, index=[txn_id])
+
+                    # insert it after any Txns on the same Txn_Date, found by binary search on the Date index
+                    txn_day = to_epoch_day(expense_entry_list[1])
+                    position = np.searchsorted(txn_days, txn_day, side="right")
+                    ledger_df = concat_expense_frames([ledger_df.iloc[:position], expense_df,
+                                                       ledger_df.iloc[position:]])
+                    txn_days = np.insert(txn_days, position, txn_day)
+
+                    cache_user_ledger(username, ledger_df, txn_days)
+                else:
+                    invalidate_ledger_cache(username)
+
+                # add the New Txn to its monthly category totals
+                if rollups is not None:
+                    add_to_rollups(rollups, expense_entry_list[1], expense_entry_list[3], int(expense_entry_list[2]))
+                    save_user_rollups(username, rollups)
+            except Exception as error:
+                invalidate_ledger_cache(username)
+                log_event("rollups_update_failed", "ERROR", error, username=username, txn_id=txn_id)
+    except Exception as error:
+        if not txn_saved:
+            print("\nThere was an error appending the new Expense Txn record to data file. Please try again.")
+            log_event("expense_save_failed", "ERROR", error, username=username)
+            return None
+        # only releasing the lock failed - the entry is on disk
+        log_event("ledger_unlock_failed", "ERROR", error, username=username)
+
+    log_event("expense_saved", username=username, txn_id=txn_id)
+
+    # merge journal into the data file, if it has grown big enough
+    schedule_journal_compaction(username)
+
+    return txn_id
+
+
+def get_db_connection():
+    """
+    Opens the SQLite database (once per program run), used when STORAGE_BACKEND is "sqlite".
+    Creates the tables and indexes if they don't exist yet.
+    WAL mode lets other sessions keep reading while one session writes.
+    :return: sqlite3 connection
+    """
+    global db_connection
+
+    if db_connection is None:
+        db_connection = sqlite3.connect(FILE_PATH_DB)
+        db_connection.execute("PRAGMA journal_mode=WAL")
+        db_connection.execute("PRAGMA synchronous=NORMAL")
+        db_connection.executescript(DB_SCHEMA)
+
+        # databases created before Txn IDs were added: add the column, and give every Txn its ID
+        with db_connection:
+            # take the write lock first - a session opening the same database meanwhile waits for this one
+            db_connection.execute("BEGIN IMMEDIATE")
+            columns = [row[1] for row in db_connection.execute("PRAGMA table_info(expenses)")]
+            if TXN_ID_FIELD not in columns:
+                db_connection.execute("ALTER TABLE expenses ADD COLUMN Txn_ID INTEGER")
+            rowids = [row[0] for row in db_connection.execute("SELECT rowid FROM expenses WHERE Txn_ID IS NULL")]
+            if rowids:
+                db_connection.executemany("UPDATE expenses SET Txn_ID = ? WHERE rowid = ?",
+                                          zip(new_txn_ids(len(rowids)).tolist(), rowids))
+            db_connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS expenses_username_txn_id"
+                                  " ON expenses (Username, Txn_ID)")
+
+        # databases from before Txn amounts were saved in minor units (user_version 0): convert them, once.
+        # (in a table created with a REAL Txn_Amount column, the whole numbers are still stored as REAL - exactly)
+        # user_version is read after BEGIN IMMEDIATE has taken the write lock: if two sessions open an old database
+        # at the same time, the second one waits, then finds it converted already - amounts are never scaled twice
+        with db_connection:
+            db_connection.execute("BEGIN IMMEDIATE")
+            if db_connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+                db_connection.execute("UPDATE expenses SET Txn_Amount = CAST(ROUND(Txn_Amount * ?) AS INTEGER)",
+                                      [amount_scale()])
+                db_connection.execute("PRAGMA user_version = 1")
+
+    return db_connection
+
+
+def sqlite_fetch_user_expenses(username, start_date=None, end_date=None):
+    """
+    Fetch Expense Txns for the given user from the SQLite database, optionally for a date range only.
+    Row index of the returned dataframe is the Txn_ID of each Txn record, used to update or delete it.
+    :return: dataframe type - user_expenses_df, sorted by Txn_Date
+    """
+    query = "SELECT " + ", ".join(LEDGER_FIELDS) + " FROM expenses WHERE Username = ?"
+    params = [username]
+    if start_date is not None:
+        query += " AND Txn_Date BETWEEN ? AND ?"
+        params += [start_date, end_date]
+    query += " ORDER BY Txn_Date, rowid"
+
+    user_expenses_df = pd.read_sql_query(query, get_db_connection(), params=params)
+
+    return index_by_txn_id(compact_expense_dtypes(user_expenses_df))
+
+
+def sqlite_fetch_last_txns(username, count):
+    # fetch the user's last 'count' Expense Txns by Txn_Date from the SQLite database, sorted by Txn_Date
+    query = ("SELECT " + ", ".join(LEDGER_FIELDS) + " FROM expenses WHERE Username = ?"
+             " ORDER BY Txn_Date DESC, rowid DESC LIMIT ?")
+
+    last_txns_df = pd.read_sql_query(query, get_db_connection(), params=[username, count])
+
+    return index_by_txn_id(compact_expense_dtypes(last_txns_df.iloc[::-1]))
+
+
+def sqlite_save_expense_entry(expense_entry_list, txn_id):
+    # insert a New Expense Txn record, as a list of values for all column fields, into the SQLite database
+    connection = get_db_connection()
+    with connection:  # commits the statement, or rolls it back on error
+        connection.execute("INSERT INTO expenses (" + ", ".join(LEDGER_FIELDS) + ") VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           expense_entry_list + [int(txn_id)])
+
+
+def sqlite_apply_expense_changes(username, expense_changes):
+    # save a batch of edits and deletes (see apply_expense_changes()) in the SQLite database, in one transaction
+    updates = []
+    deletes = []
+    for txn_id, expense_entry_list in expense_changes.items():
+        if expense_entry_list is None:
+            deletes.append([username, int(txn_id)])
+        else:
+            updates.append(list(expense_entry_list[1:]) + [username, int(txn_id)])
+
+    connection = get_db_connection()
+    with connection:  # commits All statements together, or rolls them All back on error
+        changed_rows = connection.executemany("UPDATE expenses SET Txn_Date = ?, Txn_Amount = ?, Txn_Category = ?,"
+                                              " MerchantName = ?, Txn_Country = ? WHERE Username = ? AND Txn_ID = ?",
+                                              updates).rowcount
+        changed_rows += connection.executemany("DELETE FROM expenses WHERE Username = ? AND Txn_ID = ?",
+                                               deletes).rowcount
+        if changed_rows < len(expense_changes):
+            raise KeyError("Txn_ID not found")
+
+
+def sqlite_bulk_change_expenses(username, filters, new_values, commit):
+    # bulk update or delete of the user's Expense Txns matching the filters (see bulk_change_expenses()),
+    # pushed down to the SQLite database as single statements
+    where = "Username = ?"
+    params = [username]
+    if filters.get("start") is not None:
+        where += " AND Txn_Date >= ?"
+        params.append(filters["start"])
+    if filters.get("end") is not None:
+        where += " AND Txn_Date <= ?"
+        params.append(filters["end"])
+    for field in ("Txn_Category", "MerchantName", "Txn_Country"):
+        if filters.get(field) is not None:
+            where += " AND lower(" + field + ") = lower(?)"
+            params.append(filters[field])
+    if filters.get("min_amount") is not None:
+        where += " AND Txn_Amount >= ?"
+        params.append(filters["min_amount"])
+    if filters.get("max_amount") is not None:
+        where += " AND Txn_Amount <= ?"
+        params.append(filters["max_amount"])
+
+    connection = get_db_connection()
+    with connection:  # the rows previewed are exactly the rows changed
+        matched_df = pd.read_sql_query("SELECT " + ", ".join(LEDGER_FIELDS) + " FROM expenses WHERE " + where +
+                                       " ORDER BY Txn_Date, rowid", connection, params=params)
+        if commit:
+            if new_values is None:
+                connection.execute("DELETE FROM expenses WHERE " + where, params)
+            else:
+                set_fields = ", ".join(field + " = ?" for field in new_values.keys())
+                connection.execute("UPDATE expenses SET " + set_fields + " WHERE " + where,
+                                   list(new_values.values()) + params)
+
+    return index_by_txn_id(compact_expense_dtypes(matched_df))
+
+
+def sqlite_fetch_expense_summary(username, start_date, end_date):
+    """
+    Summarizes the user's Expense Txns for a date range by Txn Category, inside the SQLite database
+    :return: dataframe type - indexed by Txn_Category, with columns: count, sum, mean, max (in minor units)
+    """
+    query = ("SELECT Txn_Category, COUNT(*) AS count, SUM(Txn_Amount) AS sum, AVG(Txn_Amount) AS mean,"
+             " MAX(Txn_Amount) AS max FROM expenses WHERE Username = ? AND Txn_Date BETWEEN ? AND ?"
+             " GROUP BY Txn_Category ORDER BY Txn_Category")
+
+    expense_summary_df = pd.read_sql_query(query, get_db_connection(), params=[username, start_date, end_date],
+                                           index_col="Txn_Category")
+
+    return expense_summary_df.astype({"sum": np.int64, "max": np.int64})
+
+
+def sqlite_fetch_spend_cube(username, dimensions, filters):
+    """
+    Aggregates the user's Expense Txns by the given spend cube dimensions, inside the SQLite database
+    params: dimensions, filters - same as fetch_spend_cube()
+    :return: dataframe type - with the dimensions, and columns: count, sum, max (in minor units)
+    """
+    where = "Username = ?"
+    params = [username]
+    for dimension, value in filters.items():
+        if dimension == "Year_Month":
+            # a month filter is a Date range - so it can use the (Username, Txn_Date) index
+            where += " AND Txn_Date BETWEEN ? AND ?"
+            params += list(month_date_range(value))
+        else:
+            where += " AND " + dimension + " = ?"
+            params.append(value)
+
+    # dimension names are from CUBE_DIMENSIONS only - never from user input
+    group_by = ", ".join(dimensions)
+    query = ("SELECT " + group_by + ", COUNT(*) AS count, SUM(Txn_Amount) AS sum, MAX(Txn_Amount) AS max"
+             " FROM (SELECT *, substr(Txn_Date, 1, 7) AS Year_Month FROM expenses WHERE " + where + ")"
+             " GROUP BY " + group_by)
+
+    cells_df = pd.read_sql_query(query, get_db_connection(), params=params)
+
+    return cells_df.astype({"count": np.int64, "sum": np.int64, "max": np.int64})
+
+
+def sqlite_find_user_profile(field, value):
+    # find a User profile by "username" or "email" in the SQLite database, and return it as a dict, or None
+    if field not in ("username", "email"):
+        raise ValueError("User profiles can only be looked up by username or email")
+
+    row = get_db_connection().execute("SELECT username, password, name, email, country FROM user_profiles"
+                                      " WHERE " + field + " = ? ORDER BY rowid LIMIT 1", [value]).fetchone()
+    if row is None:
+        return None
+
+    return dict(zip(["username", "password", "name", "email", "country"], row))
+
+
+def sqlite_create_user(new_user):
+    # insert a New User profile - [username, password, name, email, country] - into the SQLite database
+    connection = get_db_connection()
+    with connection:
+        connection.execute("INSERT INTO user_profiles (username, password, name, email, country)"
+                           " VALUES (?, ?, ?, ?, ?)", new_user)
+
+
+def sqlite_update_user_password(username, passwd):
+    # update user's password in the SQLite database
+    connection = get_db_connection()
+    with connection:
+        connection.execute("UPDATE user_profiles SET password = ? WHERE username = ?", [passwd, username])
+
+
+def import_files_into_sqlite():
+    """
+    Imports User profiles and Expense Txns from the text files into the SQLite database:
+    python expense_tracker_final.py import-sqlite
+    Each user's Expense Txns in the database are replaced with those in the files, so it is safe to run again.
+    """
+    connection = get_db_connection()
+
+    # User profiles
+    user_profiles_dict = load_profile_store()["profiles"]
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO user_profiles (username, password, name, email, country)"
+                               " VALUES (?, ?, ?, ?, ?)",
+                               zip(*[user_profiles_dict[key] for key in user_profiles_dict.keys()]))
+
+    # Expense Txns, one user's shard at a time
+    ensure_partitioned_ledger()
+    for username in list_shard_usernames():
+        user_expenses_df = read_user_ledger(username)
+        with connection:
+            connection.execute("DELETE FROM expenses WHERE Username = ?", [username])
+            connection.executemany("INSERT INTO expenses (" + ", ".join(LEDGER_FIELDS) + ")"
+                                   " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   user_expenses_df[LEDGER_FIELDS].itertuples(index=False, name=None))
+
+    print("Imported", len(user_profiles_dict["username"]), "User profiles and Expense Txns of",
+          len(list_shard_usernames()), "Users into:", FILE_PATH_DB)
+
+
+def validate_statement_rows(statement_df, username):
+    """
+    Validates a chunk of statement rows All at once, with the same rules as the prompts of a New Expense entry:
+    Txn_Date as 'yyyy-mm-dd' (see valid_txn_date()), Txn_Amount a number with at most the currency's decimal
+    places (saved in minor units, see parse_amount()), Txn_Category from TXN_CATEGORIES,
+    Txn_Country alphabets only (see valid_country()). Blank MerchantName/ Txn_Country become "none_given".
+    params: statement_df - chunk of statement rows, with (mapped) Expense column fields as text
+            username - User the rows are imported for
+    :return: tuple type - (valid_df, rejected_df) - valid rows with All column fields of TXN_FIELDS,
+             and rejected rows with a 'Reject_Reason' column
+    """
+    statement_df = statement_df.reindex(columns=TXN_FIELDS[1:]).fillna("")
+    statement_df = statement_df.apply(lambda column: column.astype(str).str.strip())
+
+    # Txn_Date is saved as 'yyyy-mm-dd' text, so sorting text keeps Txns in Date order
+    txn_dates = pd.to_datetime(statement_df["Txn_Date"], format="%Y-%m-%d", errors="coerce")
+    txn_amounts = parse_amounts(statement_df["Txn_Amount"])
+    countries = statement_df["Txn_Country"]
+
+    # one reason per rejected row - the first rule it fails
+    reasons = pd.Series("", index=statement_df.index)
+    reasons = reasons.mask(~countries.eq("") & ~countries.str.isalpha(), "invalid Txn_Country")
+    reasons = reasons.mask(~statement_df["Txn_Category"].isin(TXN_CATEGORIES), "unknown Txn_Category")
+    reasons = reasons.mask(txn_amounts.isna(), "invalid Txn_Amount")
+    reasons = reasons.mask(txn_dates.isna(), "invalid Txn_Date")
+    valid = reasons.eq("")
+
+    valid_df = statement_df[valid].assign(Username=username,
+                                          Txn_Date=txn_dates[valid].dt.strftime("%Y-%m-%d"),
+                                          Txn_Amount=txn_amounts[valid].astype(np.int64))
+    valid_df = valid_df.replace({"MerchantName": {"": "none_given"}, "Txn_Country": {"": "none_given"}})
+
+    return valid_df[TXN_FIELDS], statement_df[~valid].assign(Reject_Reason=reasons[~valid])
+
+
+@timed
+def import_statement_file(file_path, username, column_map=None):
+    """
+    Bulk imports Expense Txns for a User from a bank/ credit-card statement csv file:
+    python expense_tracker_final.py import-statement <file> <username> [Expense_Field=Statement_Column ...]
+    The file is read IMPORT_CHUNK_ROWS rows at a time, and each chunk is validated All at once.
+    Valid rows are merged into the user's Expense Txns in one write, and the monthly rollups rebuilt once.
+    Rejected rows are written to '<file>.rejected.csv' with the reason, to fix and import again.
+    params: file_path - statement csv file, with a header line
+            username - User to import the Expense Txns for
+            column_map - dict type - {Expense column field: statement column name}, for column fields named
+                         differently in the statement. Other column fields are looked up by their own name.
+    :return: tuple type - (number of rows imported, number of rows rejected), or None if nothing was imported
+    """
+    if find_user_profile("username", username) is None:
+        print("No User found with username:", username)
+        return None
+
+    # statement column name -> Expense column field
+    rename_map = {column: field for field, column in (column_map or {}).items()}
+    rejected_path = file_path + ".rejected.csv"
+
+    valid_chunks = []
+    rejected_count = 0
+    try:
+        chunks = pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=IMPORT_CHUNK_ROWS)
+        for chunk_number, chunk_df in enumerate(chunks):
+            valid_df, rejected_df = validate_statement_rows(chunk_df.rename(columns=rename_map), username)
+            valid_chunks.append(valid_df)
+
+            if chunk_number == 0 and os.path.exists(rejected_path):
+                os.remove(rejected_path)  # left over from an earlier import of this file
+            if rejected_df.shape[0] > 0:
+                rejected_df.to_csv(rejected_path, mode="a", index=False, header=not os.path.exists(rejected_path))
+                rejected_count += rejected_df.shape[0]
+    except (OSError, ValueError) as error:
+        print("Could not read statement file:", file_path, "-", error)
+        log_event("statement_import_failed", "ERROR", error, username=username, file_path=file_path)
+        return None
+
+    import_df = pd.concat(valid_chunks, ignore_index=True) if valid_chunks else pd.DataFrame(columns=TXN_FIELDS)
+    import_df[TXN_ID_FIELD] = new_txn_ids(import_df.shape[0])
+
+    if import_df.shape[0] > 0:
+        if STORAGE_BACKEND == "sqlite":
+            connection = get_db_connection()
+            with connection:
+                connection.executemany("INSERT INTO expenses (" + ", ".join(LEDGER_FIELDS) + ")"
+                                       " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       import_df.itertuples(index=False, name=None))
+        else:
+            ensure_partitioned_ledger()
+            with user_ledger_lock(username):
+                # one sort and one write of the data file, for All imported rows together
+                ledger_df = pd.concat([read_user_ledger(username), import_df], ignore_index=True)
+                write_user_ledger(username, ledger_df)
+                rebuild_user_rollups(username)
+                rebuild_user_cube(username)
+
+    log_event("statement_imported", username=username, file_path=file_path, rows=import_df.shape[0],
+              rejected=rejected_count)
+    print("Imported", import_df.shape[0], "Expense Txns for", username + ".", "Rejected:", rejected_count)
+    if rejected_count > 0:
+        print("Rejected rows, with the reason, are saved in:", rejected_path)
+
+    return import_df.shape[0], rejected_count
+
+
+def iter_user_expense_chunks(username, start_date, end_date, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Generator of the user's Expense Txns from Start Date to End Date (both included), sorted by Txn_Date,
+    in dataframes of about chunk_rows rows - so memory use stays the same, however many Txns there are.
+    The user's files are only locked while a snapshot is taken: a "csv" data file is copied to a temporary file
+    (an open handle on the data file itself would stop other sessions replacing it, on Windows), "npy" column files
+    are memory-mapped, and the journal rows are read. Chunks are then read from the snapshot without the lock, with
+    the journal rows merged in by Txn_Date - so saves by other sessions don't wait for the export, and don't change
+    what it sees.
+    params: username - to read Expense Txns for this user
+            start_date, end_date - string type, in 'yyyy-mm-dd' format
+            chunk_rows - number of rows in each dataframe (chunks with journal rows merged in have a few more)
+    :return: generator type - yields dataframes with column fields of LEDGER_FIELDS
+    """
+    if STORAGE_BACKEND == "sqlite":
+        query = ("SELECT " + ", ".join(LEDGER_FIELDS) + " FROM expenses WHERE Username = ?"
+                 " AND Txn_Date BETWEEN ? AND ? ORDER BY Txn_Date, rowid")
+        yield from pd.read_sql_query(query, get_db_connection(), params=[username, start_date, end_date],
+                                     chunksize=chunk_rows)
+        return
+
+    # text column fields are exported as text in every chunk (Not categoricals, whose categories differ from
+    # chunk to chunk) - so All chunks have the same column types
+    column_types = {field: ("int64" if field == "Txn_Amount" else "str") for field in TXN_FIELDS}
+    column_types[TXN_ID_FIELD] = "int64"
+
+    ensure_partitioned_ledger()
+    with user_ledger_lock(username):
+        journal_df = read_user_journal(username)
+
+        # Txns saved before Txn IDs were added get them now, with a one-time full read and write
+        data_path = shard_data_path(username)
+        if journal_df[TXN_ID_FIELD].isna().any() or (os.path.exists(data_path) and not shard_has_txn_ids(username)):
+            read_user_ledger(username)
+            journal_df = read_user_journal(username)
+            data_path = shard_data_path(username)
+
+        # snapshot of the journal rows in the Date range, in order of Txn_Date (and then in the order they were saved)
+        journal_df = journal_df[journal_df["Txn_Date"].astype(str).between(start_date, end_date)]
+        journal_df = journal_df.astype(column_types).sort_values("Txn_Date", kind="stable")[LEDGER_FIELDS]
+
+        # snapshot of the data file - column files are only ever written under a New generation name, so the
+        # memory-mapped ones don't change; a "csv" data file is replaced in place, so it is copied
+        snapshot_path = None
+        column_files = None
+        if data_path.endswith(SHARD_COLUMNS_FILE):
+            with open(data_path, "r") as file:
+                columns_dict = json.load(file)
+            column_files = open_shard_columns(username, columns_dict, LEDGER_FIELDS)
+        elif os.path.exists(data_path):
+            snapshot_file, snapshot_path = tempfile.mkstemp(prefix="expense_export.", suffix=".csv")
+            os.close(snapshot_file)
+            try:
+                shutil.copyfile(data_path, snapshot_path)
+            except OSError:
+                os.remove(snapshot_path)
+                raise
+
+    data_file = None
+    try:
+        if snapshot_path is not None:
+            data_file = open(snapshot_path, "r", newline="")
+        for chunk_df in iter_data_file_chunks(data_file, column_files, start_date, end_date, chunk_rows, column_types):
+            # journal rows dated before the last Date of this chunk go in it - Data file rows come first on a
+            # Txn_Date, as in read_user_ledger(), so rows on the last Date wait until All its data file rows are out
+            journal_rows = int(journal_df["Txn_Date"].searchsorted(chunk_df["Txn_Date"].iloc[-1], side="left"))
+            if journal_rows > 0:
+                chunk_df = pd.concat([chunk_df, journal_df.iloc[:journal_rows]], ignore_index=True)
+                chunk_df = chunk_df.sort_values("Txn_Date", kind="stable", ignore_index=True)
+                journal_df = journal_df.iloc[journal_rows:]
+            yield chunk_df
+    finally:
+        if data_file is not None:
+            data_file.close()
+        if snapshot_path is not None:
+            os.remove(snapshot_path)
+
+    for chunk_start in range(0, journal_df.shape[0], chunk_rows):
+        yield journal_df.iloc[chunk_start:chunk_start + chunk_rows].reset_index(drop=True)
+
+
+def iter_data_file_chunks(data_file, column_files, start_date, end_date, chunk_rows, column_types):
+    """
+    Generator of the Expense Txns of a data file from Start Date to End Date (both included), in order of Txn_Date -
+    read chunk_rows rows at a time, from the snapshot taken by iter_user_expense_chunks().
+    params: data_file - open copy of a "csv" data file, or None
+            column_files - column files of an "npy" data file (see open_shard_columns()), or None
+            start_date, end_date - string type, in 'yyyy-mm-dd' format
+            chunk_rows - number of rows read at a time
+            column_types - dict type - type of each column field in the dataframes
+    :return: generator type - yields non-empty dataframes with column fields of LEDGER_FIELDS
+    """
+    if column_files is not None:
+        # binary search on the memory-mapped Date column, then read the Date range one slice at a time
+        txn_days = column_files["Txn_Date"][0]
+        first_row = np.searchsorted(txn_days, to_epoch_day(start_date), side="left")
+        last_row = np.searchsorted(txn_days, to_epoch_day(end_date), side="right")
+        for chunk_start in range(first_row, last_row, chunk_rows):
+            chunk_df = shard_columns_frame(column_files, chunk_start, min(chunk_start + chunk_rows, last_row))
+            yield chunk_df.astype(column_types)
+        return
+
+    if data_file is None:
+        return
+
+    # csv data file is sorted by Txn_Date - stop reading once past the End Date
+    for chunk_df in pd.read_csv(data_file, dtype=column_types, chunksize=chunk_rows):
+        in_range = chunk_df["Txn_Date"].between(start_date, end_date)
+        if in_range.any():
+            yield chunk_df[in_range][LEDGER_FIELDS]
+        if chunk_df["Txn_Date"].iloc[-1] > end_date:
+            break
+
+
+def write_export_chunks(chunks, file_path):
+    """
+    Writes dataframes one after another to a single export file, in the format given by its extension:
+    '.csv', '.jsonl' (JSON Lines - one JSON record per line), or '.parquet' (needs the 'pyarrow' package).
+    params: chunks - iterable of dataframes, All with the same column fields
+            file_path - export file to create (replaced if it exists)
+    :return: int type - number of rows written
+    """
+    file_format = os.path.splitext(file_path)[1].lower()
+    if file_format not in (".csv", ".jsonl", ".parquet"):
+        raise ValueError("export file name must end in .csv, .jsonl or .parquet")
+
+    if file_format == ".parquet":
+        # optional dependency, only needed for Parquet export
+        import pyarrow
+        import pyarrow.parquet
+        parquet_writer = None
+
+    row_count = 0
+    with open(file_path, "wb") as file:
+        for chunk_df in chunks:
+            if file_format == ".csv":
+                chunk_df.to_csv(file, index=False, header=(row_count == 0))
+            elif file_format == ".jsonl":
+                file.write(chunk_df.to_json(orient="records", lines=True).encode())
+            else:
+                table = pyarrow.Table.from_pandas(chunk_df, preserve_index=False)
+                if parquet_writer is None:
+                    parquet_writer = pyarrow.parquet.ParquetWriter(file, table.schema)
+                parquet_writer.write_table(table)
+            row_count += chunk_df.shape[0]
+
+        if file_format == ".parquet" and parquet_writer is not None:
+            parquet_writer.close()
+
+    return row_count
+
+
+@timed
+def export_user_expenses(username, start_date, end_date, file_path, summary=False):
+    """
+    Exports the user's Expense Txns from Start Date to End Date (both included) to a .csv, .jsonl or .parquet file:
+    python expense_tracker_final.py export <username> <start yyyy-mm-dd> <end yyyy-mm-dd> <file> [summary]
+    Txns are streamed EXPORT_CHUNK_ROWS at a time, from the data file to the export file.
+    With 'summary', the Expense Summary report by Txn Category for the Date range is exported instead.
+    Amounts are exported in currency units (e.g. 12.5), as the User enters them.
+    :return: int type - number of rows exported, or None if nothing was exported
+    """
+    if not (valid_txn_date(start_date) and valid_txn_date(end_date)):
+        return None
+
+    try:
+        if summary:
+            summary_df = fetch_expense_summary_daterange(username, start_date, end_date)
+            if summary_df is None:
+                return None
+            row_count = write_export_chunks([summary_in_currency_units(summary_df).reset_index()], file_path)
+        else:
+            scale = amount_scale()
+            chunks = (chunk_df.assign(Txn_Amount=chunk_df["Txn_Amount"] / scale)
+                      for chunk_df in iter_user_expense_chunks(username, start_date, end_date))
+            row_count = write_export_chunks(chunks, file_path)
+    except (ImportError, ValueError, OSError) as error:
+        print("Could not export to:", file_path, "-", error)
+        log_event("export_failed", "ERROR", error, username=username, file_path=file_path)
+        return None
+
+    log_event("expenses_exported", username=username, file_path=file_path, rows=row_count, summary=summary)
+
+    print("Exported", row_count, "rows for", username, "from", start_date, "to", end_date, "into:", file_path)
+    return row_count
+
+
+def create_new_expense_entry(username):
+    """
+    Create a new Expense entry in the database for the given user.
+    'Uses Expenses' database is a csv file.
+    Display a preview of the Expense entry before final submission, and
+    confirm entry submission status - entry saved or display error msg.
+    :param username:
+    :return: next screen to show - (screen function, arguments)
+    """
+    # Input Expense Txn Entry data fields from user, one field at a time, validating each field's input
+
+    # TXN_DATE (mandatory field)
+    # -------------------------
+    txn_date = input_expense_txn_date()
+    print("")
+
+    # TXN_AMOUNT (mandatory)
+    # ----------------------
+    txn_amount = input_expense_txn_amount()
+    print("")
+
+    # TXN_CATEGORY (mandatory)
+    # ------------------------
+    txn_cat = input_expense_txn_category()
+    print("")
 
     # MERCHANT NAME (optional field)
     # ------------------------------
@@ -1032,23 +3619,30 @@ def create_new_expense_entry(username):
     # username is excluded for now
     print("\nExpense entry details:")
     headers_list = ["Txn_Date", "Txn_Amount", "Txn_Category", "MerchantName", "Txn_Country"]
-    print(tabulate([expense_entry_list], headers=headers_list))
+    preview_list = [txn_date, format_amount(txn_amount), txn_cat, merchant_name, txn_country]
+    print(tabulate([preview_list], headers=headers_list, disable_numparse=True))
 
     # now, add username to Expense entry list at index 0, so Expense data can be updated correctly
     expense_entry_list.insert(0, username)
 
     submit = input("\nPress Enter to confirm Submission, or press '1' and Enter to start over: ").strip()
     if submit == "1":
-        create_new_expense_entry(username)
+        return create_new_expense_entry, (username,)  # show this screen again, to start over
     else:
-        # call helper function to save the new Expense Entry in database
-        save_expense_entry_to_file(expense_entry_list)
+        # call helper function to save the new Expense Entry in database - it shows an error msg if the entry
+        # could Not be saved (nothing was saved then, so saving it again can't duplicate it)
+        txn_id = save_expense_entry_to_file(expense_entry_list)
+        while txn_id is None:
+            retry = input("Press Enter to try saving again, or press '1' and Enter to go back to Main Menu: ").strip()
+            if retry == "1":
+                return display_main_menu, (username,)
+            txn_id = save_expense_entry_to_file(expense_entry_list)
 
         # print success msg to user and navigate to User Dashboard home screen
         print("Expense entry successfully saved in records...")
         time.sleep(1)  # purely for user experience, to see the Success msg.
 
-        display_main_menu(username)
+        return display_main_menu, (username,)
 
 
 def input_expense_txn_date():
@@ -1076,16 +3670,16 @@ def input_expense_txn_amount():
     """
     Prompts user to enter a valid Txn Amount for the Expense entry.
     This is a mandatory data field.
-    return: validated Txn_Amount value
+    return: validated Txn_Amount value, in minor units of the currency (e.g. 1250 cents for 12.50)
     """
-    input_msg = ">>>> Txn Amount: \nPlease enter a number"
+    decimals = ledger_currency()["decimals"]
+    input_msg = ">>>> Txn Amount: \nPlease enter a number (" + ledger_currency()["currency"] + ")"
     txn_amount = None  # initialize txn_amount to None
     while txn_amount is None:
-        try:
-            amt_input = input(input_msg + "\nEnter Txn Amount here: ").strip()
-            txn_amount = float(amt_input)
-        except ValueError:
-            print("Invalid input. Please enter a number")
+        amt_input = input(input_msg + "\nEnter Txn Amount here: ").strip()
+        txn_amount = parse_amount(amt_input)
+        if txn_amount is None:
+            print("Invalid input. Please enter a number, with at most", decimals, "decimal places")
 
     return txn_amount
 
@@ -1150,57 +3744,307 @@ def input_expense_txn_country():
     return txn_country
 
 
-def display_expense_summary_daterange(username, start_date, end_date):
+@timed
+def fetch_expense_summary_daterange(username, start_date, end_date):
+    """
+    Summarizes the user's Expense Txns for the given date range (both dates included), by Txn Category
+    param:  username - to load Expense Txns for the given user
+            start_date, end_date - to summarize Expense Txns within given date range
+    :return: dataframe type - indexed by Txn_Category, with columns: count, sum, mean, max - amounts in minor
+             units, sum and max as exact integers (0 rows if there are No Txns in the date range),
+             or None if data could not be read
+    """
+    if STORAGE_BACKEND == "sqlite":
+        # aggregation is done by the database
+        try:
+            return sqlite_fetch_expense_summary(username, start_date, end_date)
+        except sqlite3.Error as error:
+            print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+            log_event("ledger_read_failed", "ERROR", error, username=username,
+                      function="fetch_expense_summary_daterange")
+            return None
+
+    # load expense txns for this user, for given date range
+    daterange_expenses_df = fetch_user_expenses_by_daterange(username, start_date, end_date)
+
+    # Txns could not be read from database - error msg is already displayed to the user
+    if daterange_expenses_df is None:
+        return None
+
+    if daterange_expenses_df.shape[0] == 0:
+        return pd.DataFrame(columns=["count", "sum", "mean", "max"])
+
+    # generate pivot table summarizing Total Txn Amount, and Max - integer sums of minor units, so they are exact
+    expense_pivot = daterange_expenses_df.pivot_table(
+        values="Txn_Amount",
+        index="Txn_Category",
+        observed=True,  # Txn Categories with Txns in the date range only
+        aggfunc=["count", "sum", "mean", "max"])  # in-built pandas functions passed as string literals,
+    expense_pivot.columns = ["count", "sum", "mean", "max"]
+
+    return expense_pivot
+
+
+@timed
+def fetch_expense_summary_month(username, year_month):
+    """
+    Summarizes the user's Expense Txns for a calendar month, by Txn Category.
+    With text files, this is read from the user's monthly rollups -
+    so the report doesn't need to read or aggregate the month's Expense Txns.
+    param:  username - to summarize Expense Txns for the given user
+            year_month - string type, in 'yyyy-mm' format
+    :return: same as fetch_expense_summary_daterange()
+    """
+    if STORAGE_BACKEND == "sqlite":
+        start_date, end_date = month_date_range(year_month)
+        return fetch_expense_summary_daterange(username, start_date, end_date)
+
+    try:
+        month_totals = load_user_rollups(username)["months"].get(year_month, {})
+    except Exception as error:
+        print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+        log_event("ledger_read_failed", "ERROR", error, username=username, function="fetch_expense_summary_month")
+        return None
+
+    # rollup totals are [count, sum, max, sum of squares] for each category
+    expense_summary_df = pd.DataFrame.from_dict(month_totals, orient="index",
+                                                columns=["count", "sum", "max", "sum_sq"]).sort_index()
+    expense_summary_df["mean"] = expense_summary_df["sum"] / expense_summary_df["count"]
+
+    return expense_summary_df[["count", "sum", "mean", "max"]]
+
+
+def summary_in_currency_units(expense_summary_df):
+    # Expense summary with its amounts (sum, mean, max) in currency units instead of minor units, to show/ export
+    scale = amount_scale()
+    return expense_summary_df.assign(sum=expense_summary_df["sum"] / scale, mean=expense_summary_df["mean"] / scale,
+                                     max=expense_summary_df["max"] / scale)
+
+
+def month_date_range(year_month):
+    # return first and last day of a 'yyyy-mm' month, as 'yyyy-mm-dd' strings
+    month = np.datetime64(year_month, "M")
+    start_date = str(month.astype("datetime64[D]"))
+    end_date = str((month + 1).astype("datetime64[D]") - 1)
+
+    return start_date, end_date
+
+
+@timed
+def fetch_spend_cube(username, dimensions, filters=None):
     """
-    Displays Expense summary to the user for the current month
-    param:  username - to load All Expense Txns for the given user, and all Column fields
-            date_range - tuple type (start_date, end_date) - to retrieve Expense Txns within given date range
+    Drill-down/ roll-up query on the user's spend cube: totals of their Expense Txns grouped by some dimensions
+    (year-month, Txn_Category, Txn_Country, MerchantName), for the Txns matching the filters.
+    With text files, this is read from the user's cube file, plus the few New Txns still in their journal -
+    so the Txns in the data file are Not read.
+    e.g. fetch_spend_cube("kkk", ["MerchantName"], {"Year_Month": "2024-06", "Txn_Category": "Groceries"})
+    params: username - to query the spend cube of the given user
+            dimensions - list type - dimensions (from CUBE_DIMENSIONS) to group by, e.g. ["Txn_Country"]
+            filters - dict type - {dimension: value} to drill down to, e.g. {"Year_Month": "2024-06"}. None for All.
+    :return: dataframe type - indexed by the dimensions, with columns: count, sum, mean, max (in minor units),
+             or None if data could not be read
     """
-    # load ALl expense txns for this user
-    user_expenses_df = fetch_user_expenses(username)
+    if filters is None:
+        filters = {}
+
+    try:
+        if STORAGE_BACKEND == "sqlite":
+            cube_df = sqlite_fetch_spend_cube(username, dimensions, filters)
+        else:
+            with user_ledger_lock(username):
+                cube_df = load_user_cube(username)
+                # journal is read only if it has any Txns - its version is (modification time, size), or None
+                journal_version = shard_version(username)[1]
+                journal_df = read_user_journal(username) if journal_version and journal_version[1] > 0 else None
+            if journal_df is not None and journal_df.shape[0] > 0:
+                # New Txns Not yet merged into the data file are added to the cube on the fly
+                # (their cells are added up with the cube's below, when rolled up to the requested dimensions)
+                cube_df = concat_cube_cells([cube_df, spend_cube_cells(journal_df)])
+
+            # drill down - keep the cells of the selected month/ category/ country/ merchant only
+            for dimension, value in filters.items():
+                cube_df = cube_df[cube_df[dimension] == value]
+    except Exception as error:
+        print("Sorry! There seems to be some error locating your data. Try again in some time.\n")
+        log_event("ledger_read_failed", "ERROR", error, username=username, function="fetch_spend_cube")
+        return None
+
+    # roll up the cells to the requested dimensions - counts and sums add up, max of maxes
+    spend_cube_df = cube_df.groupby(dimensions, observed=True).agg({"count": "sum", "sum": "sum", "max": "max"})
+    spend_cube_df["mean"] = spend_cube_df["sum"] / spend_cube_df["count"]
 
-    # check if function call is for previous month's summary
-    if start_date is None:
-        # re-structure Start Date
-        # -----------------------
-        month = int(datetime.today().strftime('%m'))  # get month from current date
-        prev_month = str(month - 1)
-        prev_month = "0" + prev_month
-        year = datetime.today().strftime('%Y')  # get year from current date
-        start_date = year + "-" + prev_month + "-01"  # note: day will always be "01" in this case
+    return spend_cube_df[["count", "sum", "mean", "max"]]
 
-    # subset DataFrame for given date range (Note: End Date is Not inclusive)
-    daterange_expenses_df = user_expenses_df[(user_expenses_df["Txn_Date"] >= start_date) &
-                                             (user_expenses_df["Txn_Date"] <= end_date)]
+
+@timed
+def display_expense_summary(expense_summary_df, start_date, end_date):
+    """
+    Displays Expense summary to the user for a period, one row per Txn Category
+    params: expense_summary_df - dataframe indexed by Txn_Category, with columns: count, sum, mean, max
+                                 (in minor units), or None if data could not be read
+            start_date, end_date - period of the summary, for display
+    """
+    # Txns could not be read from database - error msg is already displayed to the user
+    if expense_summary_df is None:
+        return
 
     # check if there is at least 1 Expense record in database for this user
     # for the given date range
-    if daterange_expenses_df.shape[0] == 0:
+    if expense_summary_df.shape[0] == 0:
         print("\n\t You have 0 Txns for this Time Period. Please press Enter to go back to main menu... ")
+        return
 
-    else:  # display Expense Summary
-        print("\nExpense Summary for the Period: ", start_date, "to", end_date)
+    print("\nExpense Summary for the Period: ", start_date, "to", end_date)
 
-        # generate pivot table summarizing Total Txn Amount, and Max
-        expense_pivot = daterange_expenses_df.pivot_table(
-            values="Txn_Amount",
-            index="Txn_Category",
-            aggfunc=["count", "sum", "mean", "max"])  # in-built pandas functions passed as string literals,
+    # Sum total of Expenses across all categories, for the given date range - an exact sum of minor units
+    total_expense = int(expense_summary_df["sum"].sum())
 
-        # expense_pivot["sum"] refers to the column field as returned from aggregate function sum() above.
-        # Add a column that displays Txn amounts total for categories as a Proportion (%age) of Total Expenditure
-        expense_pivot["%age_of_total"] = (expense_pivot["sum"] / expense_pivot["sum"].sum()) * 100
+    # expense_summary_df["sum"] refers to the Txn amounts total for each category
+    # Add a column that displays Txn amounts total for categories as a Proportion (%age) of Total Expenditure
+    expense_summary_df = summary_in_currency_units(expense_summary_df)
+    expense_summary_df["%age_of_total"] = (expense_summary_df["sum"] / expense_summary_df["sum"].sum()) * 100
 
-        print("")
-        headers_list = ["Txn_Category", "Total Txns.", "Total Txn_Amount",
-                        "Average Txn_Amount", "Maximum Txn_Amount", "Percent Proportion of Total"]
+    print("")
+    headers_list = ["Txn_Category", "Total Txns.", "Total Txn_Amount",
+                    "Average Txn_Amount", "Maximum Txn_Amount", "Percent Proportion of Total"]
+
+    amount_format = amount_floatfmt()
+    print(tabulate(expense_summary_df, headers=headers_list,
+                   floatfmt=(None, '.0f', amount_format, amount_format, amount_format, '.1f')))
+
+    print("\nTotal Expenditure for the Period: ", format_amount(total_expense))
+    print("--------------------------------------------")
+
+
+def display_expense_summary_daterange(username, start_date, end_date):
+    """
+    Displays Expense summary to the user for the given date range
+    param:  username - to load Expense Txns for the given user, and all Column fields
+            start_date, end_date - to retrieve Expense Txns within given date range
+    """
+    expense_summary_df = fetch_expense_summary_daterange(username, start_date, end_date)
+    display_expense_summary(expense_summary_df, start_date, end_date)
+
+
+def display_expense_summary_month(username, year_month):
+    """
+    Displays Expense summary to the user for a calendar month
+    param:  username - to summarize Expense Txns for the given user
+            year_month - string type, in 'yyyy-mm' format
+    """
+    start_date, end_date = month_date_range(year_month)
+    expense_summary_df = fetch_expense_summary_month(username, year_month)
+    display_expense_summary(expense_summary_df, start_date, end_date)
+
+
+def explore_spend_cube(username, drill_path, dimension, month_grid):
+    """
+    Spend Breakdown screen: displays the user's Expenses grouped by one dimension of their spend cube
+    (Month, Category, Country or Merchant), for the part of the cube drilled down to so far.
+    User can drill down into a row, roll up one level, group by another dimension,
+    or add a month-over-month grid (the last CUBE_GRID_MONTHS months, as columns).
+    params: username - to query the spend cube of the given user
+            drill_path - tuple type - ((dimension, value), ...) drilled down to so far, () for All Expenses
+            dimension - dimension to group by, from CUBE_DIMENSIONS
+            month_grid - Boolean value, set to True to show the month-over-month grid
+    :return: next screen to show - (screen function, arguments)
+    """
+    clear_terminal()
+    display_header(username)
+
+    filters = dict(drill_path)
+    breadcrumb = ["All Expenses"] + [CUBE_DIMENSION_NAMES[field] + ": " + value for field, value in drill_path]
+    print("\nSpend Breakdown: ", " > ".join(breadcrumb))
+    print("Grouped by:", CUBE_DIMENSION_NAMES[dimension])
 
-        print(tabulate(expense_pivot, headers=headers_list, floatfmt=(None, '.0f', '.2f', '.2f', '.2f', '.1f')))
+    spend_cube_df = fetch_spend_cube(username, [dimension], filters)
+
+    # Txns could not be read from database - error msg is already displayed to the user
+    if spend_cube_df is None:
+        input("\nPress Enter to go back to Summary Report menu...")
+        return generate_expense_reports, (username,)
+
+    if spend_cube_df.shape[0] == 0:
+        input("\n\t You have 0 Txns to break down. Please press Enter to go back to Summary Report menu... ")
+        return generate_expense_reports, (username,)
+
+    # months in order, anything else by Total Txn_Amount - biggest spend first
+    if dimension != "Year_Month":
+        spend_cube_df = spend_cube_df.sort_values("sum", ascending=False)
+
+    # Sum total of Expenses in this part of the cube - an exact sum of minor units
+    total_expense = int(spend_cube_df["sum"].sum())
+
+    display_df = summary_in_currency_units(spend_cube_df)
+    display_df["%age_of_total"] = (display_df["sum"] / display_df["sum"].sum()) * 100
+    # row numbers as text - else tabulate shows them as floats, along with the amounts
+    display_df.insert(0, "Row", np.arange(1, display_df.shape[0] + 1).astype(str))
+    headers_list = [CUBE_DIMENSION_NAMES[dimension], "Row", "Total Txns.", "Total Txn_Amount",
+                    "Average Txn_Amount", "Maximum Txn_Amount", "Percent Proportion of Total"]
+    amount_format = amount_floatfmt()
+    floatfmt = (None, None, '.0f', amount_format, amount_format, amount_format, '.1f')
+
+    # month-over-month grid: only when neither grouped nor drilled down by month
+    grid_allowed = dimension != "Year_Month" and "Year_Month" not in filters
+    if month_grid and grid_allowed:
+        grid_df = fetch_spend_cube(username, [dimension, "Year_Month"], filters)
+        if grid_df is not None:
+            grid_df = grid_df["sum"].unstack(fill_value=0) / amount_scale()
+            grid_df = grid_df[sorted(grid_df.columns)[-CUBE_GRID_MONTHS:]]
+            # monthly Totals take the place of Average and Maximum, to fit the screen
+            display_df = display_df[["Row", "count", "sum", "%age_of_total"]].join(grid_df)
+            headers_list = headers_list[:4] + ["Percent Proportion of Total"] + list(grid_df.columns)
+            floatfmt = (None, None, '.0f', amount_format, '.1f') + (amount_format,) * grid_df.shape[1]
+
+    print("")
+    print(tabulate(display_df, headers=headers_list, floatfmt=floatfmt))
+    print("\nTotal Expenditure: ", format_amount(total_expense))
+    print("--------------------------------------------")
+
+    # dimensions Not yet drilled down by, to drill down or group by Next
+    other_dimensions = [field for field in CUBE_DIMENSIONS if field not in filters and field != dimension]
+
+    if other_dimensions:
+        print("\nTo drill down into a row (by " + CUBE_DIMENSION_NAMES[other_dimensions[0]] + "),",
+              "enter its Row Number and Enter...")
+        print("To group by another field, press 'g' and Enter...")
+    if drill_path:
+        print("To roll up one level (to " + breadcrumb[-2] + "), press 'u' and Enter...")
+    if grid_allowed:
+        print("To", "hide" if month_grid else "show", "the month-over-month grid, press 'x' and Enter...")
+    print("To go back to Summary Report menu, just press Enter...")
 
-        # calculate Sum total of Expenses across all categories, for the given date range
-        total_expense = round(daterange_expenses_df["Txn_Amount"].sum(), 2)
-        print("\nTotal Expenditure for the Period: ", total_expense)
-        print("--------------------------------------------")
+    # prompt user to input menu option to continue program control flow
+    user_choice = input("\nEnter your choice here: ").strip().lower()
+    while user_choice != "":
+        if other_dimensions and user_choice.isdigit() and 1 <= int(user_choice) <= display_df.shape[0]:
+            # drill down: filter by the selected row, and group by the Next dimension
+            value = display_df.index[int(user_choice) - 1]
+            return explore_spend_cube, (username, drill_path + ((dimension, value),), other_dimensions[0],
+                                        month_grid)
+        if drill_path and user_choice == "u":
+            # roll up: remove the last filter, and group by its dimension again
+            return explore_spend_cube, (username, drill_path[:-1], drill_path[-1][0], month_grid)
+        if grid_allowed and user_choice == "x":
+            return explore_spend_cube, (username, drill_path, dimension, not month_grid)
+        if other_dimensions and user_choice == "g":
+            print("")
+            for number, field in enumerate(other_dimensions, start=1):
+                print("Press '" + str(number) + "' and Enter to group by", CUBE_DIMENSION_NAMES[field])
+            field_choice = input("\nEnter your choice here, or just press Enter to stay grouped by "
+                                 + CUBE_DIMENSION_NAMES[dimension] + ": ").strip()
+            while field_choice != "" and not (field_choice.isdigit()
+                                              and 1 <= int(field_choice) <= len(other_dimensions)):
+                field_choice = input("Invalid input. Please enter a valid choice: ").strip()
+            if field_choice == "":
+                return explore_spend_cube, (username, drill_path, dimension, month_grid)
+            return explore_spend_cube, (username, drill_path, other_dimensions[int(field_choice) - 1], month_grid)
+        user_choice = input("Invalid input. Please enter a valid choice: ").strip().lower()
+
+    # navigate user to Summary Report menu
+    clear_terminal()
+    display_header(username)
+    return generate_expense_reports, (username,)
 
 
 def generate_expense_reports(username):
@@ -1208,6 +4052,7 @@ def generate_expense_reports(username):
     Display Expense summary reports for the given user.
     Additionally, user can select a type of summary report to show, from a set menu option.
     param: username - to access Expense Txns for the given user
+    :return: next screen to show - (screen function, arguments)
     """
     print("\t-----------------------")
     print("\tExpense Summary Reports")
@@ -1220,45 +4065,39 @@ def generate_expense_reports(username):
     # also sort this data by value in descending order
     input_msg = "\nPlease enter your choice for Summary Report, or just press Enter to go back to Main Menu: "
     user_choice = input(input_msg).strip()
-    while user_choice not in ("1", "2", "3", "4"):
+    while user_choice not in ("1", "2", "3", "4", "5"):
         if user_choice == "":
             break
         user_choice = input("\nInvalid input. Please enter a valid Summary Report choice: ").strip()
 
     if user_choice == "":
         # navigate user to Main Menu / User Dashboard Home screen
-        display_main_menu(username)
+        return display_main_menu, (username,)
+
+    elif user_choice == "5":
+        # Spend Breakdown screen - start with All Expenses, grouped by month
+        return explore_spend_cube, (username, (), "Year_Month", False)
 
     # user selected a valid menu option for Summary reports
     else:
         if user_choice == "1":
             # display Expense Summary for Current month
             # -----------------------------------------
-            # start date is day 1 of curr month
-            start_date = datetime.today().strftime('%Y-%m-01')
-
-            # end date is current date + 1 day,
-            # because helper func. sub-sets data from database Up To End Date (End Date not included)
-            # Note: datetime.timedelta(days) -> increments given date by N days.
-            end_date = (datetime.today() + timedelta(days=1)).strftime("%Y-%m-%d")
+            year_month = datetime.today().strftime('%Y-%m')
 
-            # call helper function to display Expense Summary report for the given date range
-            display_expense_summary_daterange(username, start_date, end_date)
+            # call helper function to display Expense Summary report from the monthly rollups
+            display_expense_summary_month(username, year_month)
 
         elif user_choice == "2":
             # display Expense Summary for Previous month
             # -----------------------------------------
-            # set start date to None
-            # this will be constructed in the helper function from current system date
-            start_date = None
-
-            # End Date will be 'N' days before current system date
+            # last day of previous month is 'N' days before current system date
             # where 'N' is day of current date.
             days_curr_date = int(datetime.today().strftime('%d'))
-            end_date = (datetime.today() - timedelta(days=days_curr_date)).strftime("%Y-%m-%d")
+            year_month = (datetime.today() - timedelta(days=days_curr_date)).strftime("%Y-%m")
 
-            # call helper function to display Expense Summary report for the given date range
-            display_expense_summary_daterange(username, start_date, end_date)
+            # call helper function to display Expense Summary report from the monthly rollups
+            display_expense_summary_month(username, year_month)
 
         elif user_choice == "3":
             # display Expense Summary for specified Date Range
@@ -1287,7 +4126,7 @@ def generate_expense_reports(username):
         # clear our console and display App header
         clear_terminal()
         display_header(username)
-        generate_expense_reports(username)  # call function recursively
+        return generate_expense_reports, (username,)  # show the Summary Report menu again
 
 
 def valid_login(username, passwd):
@@ -1300,35 +4139,36 @@ def valid_login(username, passwd):
     # VALIDATE USER LOGIN CREDENTIALS
     # -------------------------------
 
-    # access user profiles data file to validate username/password
-    try:
-        with open(FILE_PATH_USERS) as file:
-            user_profiles_dict = json.load(file)
-
-        # check if given username is present in the users list
-        if username in user_profiles_dict["username"]:
-            # find index of username in list, so we can retrieve corresponding password from passwords list
-            index = user_profiles_dict["username"].index(username)
-            # check is password is a match
-            if user_profiles_dict["password"][index] == passwd:
-                print("Successful login!!")
-                return True
-            else:
-                print("Password is incorrect. Please try again.\n")
-                return False
-        # username not found in database
-        else:
-            print("Username is incorrect. Please try again.\n")
-            return False
+    # access user profiles to validate username/password
+    profile = find_user_profile("username", username)
 
-    except FileNotFoundError as e:
-        error = [e.strerror, e.filename, datetime.today().strftime('%Y-%m-%d %H:%M:%S')]
-        print("Sorry! There seems to be some error locating your data. Try again in some time.")
+    # username not found in database
+    if profile is None:
+        print("Username is incorrect. Please try again.\n")
+        log_event("login_failed", "WARNING", username=username, reason="unknown username")
+        return False
+
+    # check is password is a match
+    if profile["password"] == passwd:
+        print("Successful login!!")
+        log_event("login", username=username)
+        return True
+    else:
+        print("Password is incorrect. Please try again.\n")
+        log_event("login_failed", "WARNING", username=username, reason="incorrect password")
+        return False
+
+
+def read_key_press():
+    """
+    Reads a single key press from the terminal - msvcrt on Windows, else straight from stdin
+    (see secure_password_input() for how the terminal is set up on Linux and macOS).
+    return: bytes type - the key pressed
+    """
+    if msvcrt is not None:
+        return msvcrt.getch()
 
-        # log error
-        with open("error_logs.txt", "a") as logfile:
-            for data in error:
-                logfile.write(f"{data}\n")
+    return os.read(sys.stdin.fileno(), 1)
 
 
 def secure_password_input(prompt=""):
@@ -1337,16 +4177,37 @@ def secure_password_input(prompt=""):
     param: prompt - str type - prompt message to show to user, default is a blank prompt.
     return: password string as input by the user
     """
+    if not sys.stdin.isatty():  # e.g. input piped in by a script - nothing to mask
+        return input(prompt)
+
+    if msvcrt is not None:
+        return read_masked_password(prompt)
+
+    # on Linux/ macOS, stop the terminal from showing key presses, and pass each key on as soon as it is pressed
+    fd = sys.stdin.fileno()
+    terminal_settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        return read_masked_password(prompt)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, terminal_settings)  # always restore the terminal
+
+
+def read_masked_password(prompt):
+    # read password one key press at a time, showing an asterisk, '*', for each character typed
     # Credits for the below code: Stackoverflow user community
     # --------------------------------------------------------
     pwd_str = ""
     proxy_string = [" "] * 20
     while True:
         sys.stdout.write('\x0D' + prompt + "".join(proxy_string))
-        c = msvcrt.getch()
-        if c == b'\r':
+        sys.stdout.flush()
+        c = read_key_press()
+        if c == b'\r' or c == b'\n':  # Enter, on Windows / on Linux and macOS
             break
-        elif c == b'\x08':
+        elif c == b'\x03':  # Ctrl+C, on Windows
+            raise KeyboardInterrupt
+        elif c == b'\x08' or c == b'\x7f':  # Backspace, on Windows / on Linux and macOS
             pwd_str = pwd_str[:-1]
             proxy_string[len(pwd_str)] = " "
         else:
@@ -1363,6 +4224,7 @@ def user_login():
     User must log in or create new user account to access app features.
     Allows user to access dashboard by entering their username/password, OR
     Allows a New user to set up their account, and log in to dashboard.
+    :return: next screen to show - (screen function, arguments)
     """
     # display Login menu options to user on the app. home screen
     # Existing user login / New User signup
@@ -1407,7 +4269,7 @@ def user_login():
                     turn = -1
                     break
                 else:
-                    turn = -2  # set turn = -1, break, and navigate to main()
+                    turn = -2  # set turn = -2, break, and navigate to Login home page
                     break
 
             if turn == 1:  # user has 1 last attempt to login
@@ -1423,19 +4285,19 @@ def user_login():
 
         # while loop breaks when user login is authenticated or user exceeds max login attempts
         if turn == -1:  # user intends to reset login credentials
-            reset_user_login()
+            return reset_user_login, ()
         elif turn == -2:  # user intends to exit to Login home page
-            main()
+            return login_home_screen, ()
         else:
             # user has successfully validated login
             # take user to Home screen / Dashboard
-            display_main_menu(username)
+            return display_main_menu, (username,)
 
     # ------------------------------
     # '2' -> New User account set up
     # ------------------------------
     else:
-        user_signup()
+        return user_signup, ()
 
 
 def display_main_menu(username):
@@ -1443,6 +4305,7 @@ def display_main_menu(username):
     Display user Dashboard. This function works as a Home screen for the user.
     User can now navigate the Main menu and perform tasks.
     :param username: to access user's data from the database files
+    :return: next screen to show - (screen function, arguments)
     """
     # clear our console and display App header
     clear_terminal()
@@ -1470,7 +4333,7 @@ def display_main_menu(username):
         print("\tNew Expense Entry")
         print("\t------------------")
         # redirect to helper function to create a new expense entry
-        create_new_expense_entry(username)
+        return create_new_expense_entry, (username,)
 
     elif user_choice == "2":  # View Last 10 Entries
         # clear our console and display App header
@@ -1482,7 +4345,7 @@ def display_main_menu(username):
         print("\t-----------------------")
         print("")
         # redirect to helper function to display last 10 expense entries
-        fetch_last_10_txns(username)
+        return fetch_last_10_txns, (username,)
 
     elif user_choice == "3":  # View Entries By Txn Date Range
         # clear our console and display App header
@@ -1493,7 +4356,7 @@ def display_main_menu(username):
         print("\tExpense Entries By Txn Date Range")
         print("\t---------------------------------")
         # redirect to helper function to display Txn Entries by Date Range
-        fetch_txns_by_daterange(username, modify_txn=False)
+        return fetch_txns_by_daterange, (username, False)
 
     elif user_choice == "4":  # Edit/Delete Previous Expense Entry
         # clear our console and display App header
@@ -1504,7 +4367,7 @@ def display_main_menu(username):
         print("\tModify Previous Expense Txns")
         print("\t---------------------------------")
         # redirect to helper function to display Txn Entries by Date Range
-        fetch_txns_by_daterange(username, modify_txn=True)
+        return fetch_txns_by_daterange, (username, True)
 
     elif user_choice == "5":  # View Expense Report
         # clear our console and display App header
@@ -1512,21 +4375,356 @@ def display_main_menu(username):
         display_header(username)
 
         # redirect to helper function to display expense summary reports
-        generate_expense_reports(username)
+        return generate_expense_reports, (username,)
 
     elif user_choice == "6":  # Log Out / Exit
         print("Logging off...")
+        if STORAGE_BACKEND == "files":
+            compact_user_journal(username)  # merge this session's New Expense entries into the sorted data file
         time.sleep(1)
-        main()
+        return login_home_screen, ()
 
 
-def main():
-    # Main Execution Function of the program
+def headless_expense_entry(username, args, current_txn=None):
+    """
+    Builds a validated Expense entry List from command-line options, for the 'add' and 'edit' commands.
+    Options not given keep the value of current_txn (for 'edit'), or are left blank (for 'add').
+    Uses the same validation rules as the New Expense entry prompts, without printing or prompting.
+    :return: list type - Expense entry, with username as the first element
+    """
+    txn_dict = {"Txn_Date": args.date, "Txn_Amount": args.amount, "Txn_Category": args.category,
+                "MerchantName": args.merchant, "Txn_Country": args.country}
+    for field, value in txn_dict.items():
+        if value is None:
+            txn_dict[field] = "" if current_txn is None else current_txn[field]
+    if args.amount is None and current_txn is not None:
+        txn_dict["Txn_Amount"] = format_amount(current_txn["Txn_Amount"])  # validated again as text
+
+    valid_df, rejected_df = validate_statement_rows(pd.DataFrame([txn_dict]), username)
+    if rejected_df.shape[0] > 0:
+        raise ValueError(rejected_df["Reject_Reason"].iloc[0])
+
+    expense_entry_list = [valid_df.iloc[0][field] for field in TXN_FIELDS]
+    expense_entry_list[2] = int(expense_entry_list[2])  # minor units, as a Python int
+
+    return expense_entry_list
+
+
+def expense_records(expenses_df):
+    # Expense Txns as a List of dicts for JSON output, each with its Txn_ID (for the 'edit'/'delete' commands)
+    # Txn_Amount is given in currency units, as entered with --amount
+    records = expenses_df.drop(columns="Username").to_dict(orient="records")
+    for record in records:
+        record["Txn_ID"] = int(record["Txn_ID"])
+        record["Txn_Amount"] = int(record["Txn_Amount"]) / amount_scale()
+
+    return records
+
+
+def expense_entry_record(expense_entry_list, txn_id):
+    # an Expense entry List as a dict for JSON output - same as a record of expense_records()
+    record = dict(zip(TXN_FIELDS[1:] + [TXN_ID_FIELD], expense_entry_list[1:] + [txn_id]))
+    record["Txn_Amount"] = record["Txn_Amount"] / amount_scale()
+
+    return record
+
+
+def run_headless_command(args):
+    """
+    Runs one of the non-interactive commands 'add', 'list', 'edit', 'delete', 'bulk', 'report', 'cube' for a User.
+    No screens are cleared and there are No sleep delays - each command calls the storage functions directly.
+    :return: dict type - result of the command, printed as JSON. Raises ValueError if the command failed.
+    """
+    username = args.username
+    if find_user_profile("username", username) is None:
+        raise ValueError("No User found with username: " + username)
+
+    if args.command == "add":
+        if args.date is None:
+            args.date = datetime.today().strftime('%Y-%m-%d')  # same default as the Txn Date prompt
+        expense_entry_list = headless_expense_entry(username, args)
+        txn_id = save_expense_entry_to_file(expense_entry_list)
+        if txn_id is None:
+            raise ValueError("could not save Expense Txn")
+        return {"added": expense_entry_record(expense_entry_list, txn_id)}
+
+    if args.command == "bulk":
+        return run_bulk_command(username, args)
+
+    if args.command == "report":
+        if args.month is not None:
+            start_date, end_date = month_date_range(args.month)
+            expense_summary_df = fetch_expense_summary_month(username, args.month)
+        else:
+            start_date, end_date = args.start, args.end
+            expense_summary_df = fetch_expense_summary_daterange(username, start_date, end_date)
+        if expense_summary_df is None:
+            raise ValueError("could not read Expense Txns")
+        return {"start": start_date, "end": end_date, "currency": ledger_currency()["currency"],
+                "summary": summary_in_currency_units(expense_summary_df).to_dict(orient="index")}
+
+    if args.command == "cube":
+        return run_cube_command(username, args)
+
+    # 'list', 'edit', 'delete' - the user's Expense Txns, in the Date range if one is given
+    if args.command == "list" and args.start is not None:
+        user_expenses_df = fetch_user_expenses_by_daterange(username, args.start, args.end)
+    else:
+        user_expenses_df = fetch_user_expenses(username)
+    if user_expenses_df is None:
+        raise ValueError("could not read Expense Txns")
+
+    if args.command == "list":
+        return {"txns": expense_records(user_expenses_df)}
+
+    # row index of the user's Expense Txns is their Txn_ID
+    if args.txn_id not in user_expenses_df.index:
+        raise ValueError("No Expense Txn found with Txn_ID: " + str(args.txn_id))
+    current_txn = user_expenses_df.loc[args.txn_id]
+
+    if args.command == "edit":
+        expense_entry_list = headless_expense_entry(username, args, current_txn)
+        update_expense_entry_in_file(expense_entry_list, args.txn_id)
+        return {"edited": expense_entry_record(expense_entry_list, args.txn_id)}
+
+    remove_expense_entry_from_file(username, args.txn_id)
+    return {"deleted": expense_records(user_expenses_df.loc[[args.txn_id]])[0]}
+
+
+def run_bulk_command(username, args):
+    """
+    Runs the 'bulk' command - bulk update or delete of the Expense Txns matching the filter options.
+    Without --yes, only the number of matching Txns (and the first few of them) is shown, and nothing is changed.
+    :return: dict type - result of the command, printed as JSON. Raises ValueError if the options are invalid.
+    """
+    filters = {"start": args.start, "end": args.end, "Txn_Category": args.category, "MerchantName": args.merchant,
+               "Txn_Country": args.country, "min_amount": args.min_amount, "max_amount": args.max_amount}
+    if all(value is None for value in filters.values()):
+        raise ValueError("give at least one filter option - to change All Txns, give the full Date range")
+    for field in ("min_amount", "max_amount"):
+        if filters[field] is not None:
+            # compared with Txn amounts in minor units
+            minor_units = parse_amount(filters[field])
+            if minor_units is None:
+                raise ValueError("invalid amount: " + filters[field])
+            filters[field] = minor_units
+    for date in (args.start, args.end):
+        if date is not None and pd.isna(pd.to_datetime(date, format="%Y-%m-%d", errors="coerce")):
+            raise ValueError("invalid Date: " + date + " - use 'yyyy-mm-dd' format")
+
+    # action - New values to set, with the same rules as the New Expense entry prompts, or delete
+    new_values = {"Txn_Category": args.set_category, "MerchantName": args.set_merchant,
+                  "Txn_Country": args.set_country}
+    new_values = {field: value.strip() for field, value in new_values.items() if value is not None}
+    if args.delete == bool(new_values):
+        raise ValueError("give either --delete, or at least one of --set-category, --set-merchant, --set-country")
+    if new_values.get("Txn_Category", TXN_CATEGORIES[0]) not in TXN_CATEGORIES:
+        raise ValueError("unknown Txn_Category: " + new_values["Txn_Category"])
+    # Txn_Country - alphabets only, or blank (see valid_country()), as for a New entry and for imported rows
+    if new_values.get("Txn_Country", "") != "" and not new_values["Txn_Country"].isalpha():
+        raise ValueError("invalid Txn_Country: " + new_values["Txn_Country"])
+    if new_values.get("Txn_Country") == "":
+        new_values["Txn_Country"] = "none_given"
+    if new_values.get("MerchantName") == "":
+        new_values["MerchantName"] = "none_given"
+
+    matched_df = bulk_change_expenses(username, filters, None if args.delete else new_values, commit=args.yes)
+
+    return {"matched": matched_df.shape[0],
+            "committed": bool(args.yes),
+            "action": "delete" if args.delete else {"set": new_values},
+            "preview": expense_records(matched_df.head(10))}
+
+
+def run_cube_command(username, args):
+    """
+    Runs the 'cube' command - a drill-down/ roll-up query on the user's spend cube (see fetch_spend_cube()).
+    :return: dict type - result of the command, printed as JSON. Raises ValueError if the options are invalid.
+    """
+    # command-line names of the spend cube dimensions, e.g. --by month,country
+    dimension_options = {name.lower(): field for field, name in CUBE_DIMENSION_NAMES.items()}
+
+    dimensions = []
+    for name in args.by.split(","):
+        if name.strip().lower() not in dimension_options:
+            raise ValueError("unknown --by field: " + name + " - use: " + ", ".join(dimension_options))
+        dimensions.append(dimension_options[name.strip().lower()])
+
+    filters = {"Year_Month": args.month, "Txn_Category": args.category, "Txn_Country": args.country,
+               "MerchantName": args.merchant}
+    filters = {field: value for field, value in filters.items() if value is not None}
+    if args.month is not None:
+        month_date_range(args.month)  # raises ValueError if Not a 'yyyy-mm' month
+
+    spend_cube_df = fetch_spend_cube(username, dimensions, filters)
+    if spend_cube_df is None:
+        raise ValueError("could not read Expense Txns")
+
+    return {"by": [CUBE_DIMENSION_NAMES[field] for field in dimensions],
+            "filters": {CUBE_DIMENSION_NAMES[field]: value for field, value in filters.items()},
+            "currency": ledger_currency()["currency"],
+            "cells": summary_in_currency_units(spend_cube_df).reset_index().to_dict(orient="records")}
+
+
+def build_argument_parser():
+    # command-line commands of the program - with No command, the interactive app is started
+    parser = argparse.ArgumentParser(description="Console-based Expense tracker. Run with No command for the app.")
+    commands = parser.add_subparsers(dest="command")
+
+    # non-interactive commands for a User - print their result as JSON
+    add_parser = commands.add_parser("add", help="add an Expense Txn")
+    edit_parser = commands.add_parser("edit", help="edit an Expense Txn, by its Txn_ID from 'list'")
+    for command_parser in (add_parser, edit_parser):
+        command_parser.add_argument("username")
+        if command_parser is edit_parser:
+            command_parser.add_argument("txn_id", type=int)
+        command_parser.add_argument("--date", help="Txn Date, 'yyyy-mm-dd' (default for 'add': Today)")
+        command_parser.add_argument("--amount", help="Txn Amount")
+        command_parser.add_argument("--category", help="Txn Category, one of: " + ", ".join(TXN_CATEGORIES))
+        command_parser.add_argument("--merchant", help="Merchant Name (optional)")
+        command_parser.add_argument("--country", help="Txn Country (optional)")
+
+    list_parser = commands.add_parser("list", help="list Expense Txns, with their Txn_IDs")
+    list_parser.add_argument("username")
+    list_parser.add_argument("--start", help="Start Date, 'yyyy-mm-dd'")
+    list_parser.add_argument("--end", help="End Date, 'yyyy-mm-dd'")
+
+    delete_parser = commands.add_parser("delete", help="delete an Expense Txn, by its Txn_ID from 'list'")
+    delete_parser.add_argument("username")
+    delete_parser.add_argument("txn_id", type=int)
+
+    bulk_parser = commands.add_parser("bulk", help="update or delete All Expense Txns matching the filter options"
+                                                   " (shows the matching Txns only, unless --yes is given)")
+    bulk_parser.add_argument("username")
+    bulk_parser.add_argument("--start", help="filter: Start Date, 'yyyy-mm-dd'")
+    bulk_parser.add_argument("--end", help="filter: End Date, 'yyyy-mm-dd'")
+    bulk_parser.add_argument("--category", help="filter: Txn Category")
+    bulk_parser.add_argument("--merchant", help="filter: Merchant Name (upper/ lower case ignored)")
+    bulk_parser.add_argument("--country", help="filter: Txn Country (upper/ lower case ignored)")
+    bulk_parser.add_argument("--min-amount", help="filter: smallest Txn Amount")
+    bulk_parser.add_argument("--max-amount", help="filter: largest Txn Amount")
+    bulk_parser.add_argument("--set-category", help="action: set Txn Category")
+    bulk_parser.add_argument("--set-merchant", help="action: set Merchant Name")
+    bulk_parser.add_argument("--set-country", help="action: set Txn Country")
+    bulk_parser.add_argument("--delete", action="store_true", help="action: delete the matching Txns")
+    bulk_parser.add_argument("--yes", action="store_true", help="save the changes (default: preview only)")
+
+    report_parser = commands.add_parser("report", help="Expense Summary report by Txn Category")
+    report_parser.add_argument("username")
+    report_parser.add_argument("--month", help="calendar month, 'yyyy-mm'")
+    report_parser.add_argument("--start", help="Start Date, 'yyyy-mm-dd'")
+    report_parser.add_argument("--end", help="End Date, 'yyyy-mm-dd'")
+
+    cube_parser = commands.add_parser("cube", help="Expense totals by Month, Category, Country and/ or Merchant"
+                                                   " (drill down with the filter options)")
+    cube_parser.add_argument("username")
+    cube_parser.add_argument("--by", default="month,category",
+                             help="fields to group by, comma separated: month, category, country, merchant"
+                                  " (default: month,category)")
+    cube_parser.add_argument("--month", help="filter: calendar month, 'yyyy-mm'")
+    cube_parser.add_argument("--category", help="filter: Txn Category")
+    cube_parser.add_argument("--country", help="filter: Txn Country")
+    cube_parser.add_argument("--merchant", help="filter: Merchant Name")
+
+    # maintenance commands
+    commands.add_parser("compact", help="merge All Users' journals into their sorted data files")
+    commands.add_parser("rebuild-rollups", help="rebuild monthly rollups and spend cubes for the reports")
+    commands.add_parser("import-sqlite", help="copy User profiles and Expense Txns into the SQLite database")
+    commands.add_parser("convert-format", help="rewrite data files in the format set by EXPENSE_TRACKER_LEDGER_FORMAT")
+    commands.add_parser("migrate", help="convert the legacy flat data file to per-user shards")
+    commands.add_parser("convert-amounts", help="convert Txn amounts saved by earlier versions to minor units")
+
+    import_parser = commands.add_parser("import-statement", help="bulk import a statement csv file for a User")
+    import_parser.add_argument("file")
+    import_parser.add_argument("username")
+    import_parser.add_argument("mappings", nargs="*", metavar="Expense_Field=Statement_Column")
+
+    export_parser = commands.add_parser("export", help="export Expense Txns or a Summary report to a file")
+    export_parser.add_argument("username")
+    export_parser.add_argument("start")
+    export_parser.add_argument("end")
+    export_parser.add_argument("file", help=".csv, .jsonl or .parquet")
+    export_parser.add_argument("summary", nargs="?", choices=["summary"])
+
+    return parser
+
+
+def run_command_line(argv):
+    """
+    Runs the command given on the command line, e.g.: python expense_tracker_final.py list kkk --start 2024-06-01
+    Non-interactive commands print their result as a single JSON object, and any messages to stderr.
+    :return: int type - exit status, 0 if the command succeeded, else 1
+    """
+    args = build_argument_parser().parse_args(argv)
+
+    if args.command in ("add", "list", "edit", "delete", "bulk", "report", "cube"):
+        if args.command in ("list", "report") and (args.start is None) != (args.end is None):
+            print(json.dumps({"ok": False, "error": "--start and --end must be given together"}))
+            return 1
+        if args.command == "report" and args.month is None and args.start is None:
+            print(json.dumps({"ok": False, "error": "give --month, or --start and --end"}))
+            return 1
+
+        try:
+            # keep stdout for the JSON result only
+            with contextlib.redirect_stdout(sys.stderr):
+                result = run_headless_command(args)
+        except (ValueError, KeyError, OSError) as error:
+            print(json.dumps({"ok": False, "error": str(error)}))
+            log_event("command_failed", "ERROR", error, command=args.command)
+            return 1
+
+        print(json.dumps({"ok": True, **result}))
+        return 0
+
+    if args.command == "compact":
+        compact_all_journals()
+    elif args.command == "rebuild-rollups":
+        rebuild_all_rollups()
+    elif args.command == "import-sqlite":
+        import_files_into_sqlite()
+    elif args.command == "convert-format":
+        convert_ledger_format()
+    elif args.command == "migrate":
+        migrate_flat_ledger_to_shards()
+    elif args.command == "convert-amounts":
+        if os.path.exists(FILE_PATH_SHARDS_AMOUNTS):
+            print("Txn amounts are already saved in minor units in:", DIR_PATH_TXN_SHARDS)
+        else:
+            ensure_partitioned_ledger()  # migrates the legacy flat data file too, if not done yet
+            print("Txn amounts converted to minor units of", ledger_currency()["currency"], "in:", DIR_PATH_TXN_SHARDS)
+    elif args.command == "import-statement":
+        result = import_statement_file(args.file, args.username,
+                                       dict(mapping.split("=", 1) for mapping in args.mappings))
+        return 0 if result is not None else 1
+    elif args.command == "export":
+        result = export_user_expenses(args.username, args.start, args.end, args.file, summary=bool(args.summary))
+        return 0 if result is not None else 1
+
+    return 0
+
+
+def login_home_screen():
+    # App home screen - display App name, version, then the Login menu
     clear_terminal()
     display_header()  # display App name, version,
 
-    user_login()  # Login home screen
+    return user_login, ()  # Login home screen
+
+
+def main():
+    # Main Execution Function of the program
+    # Each screen returns the next screen to show, as (screen function, arguments), and this loop shows it -
+    # so going from screen to screen doesn't pile up function calls (and their data) for the whole session.
+    next_screen = (login_home_screen, ())
+    while next_screen is not None:
+        screen_function, screen_args = next_screen
+        next_screen = screen_function(*screen_args)
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        # a command was given - run it without the interactive app (see build_argument_parser())
+        sys.exit(run_command_line(sys.argv[1:]))
+    else:
+        main()
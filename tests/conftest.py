@@ -0,0 +1,37 @@
+"""
+File name: tests/conftest.py
+----------------------------
+Shared pytest fixtures for the Expense tracker app tests.
+Run from the repository root:
+python -m pytest -q
+"""
+
+import importlib    # to load the app module afresh for each test
+import os           # for file paths
+import sys          # to find the app module
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """
+    The app module (expense_tracker_final), loaded afresh in an empty data directory - so each test starts
+    with No Users, No Expense Txns, empty caches, and the default settings (files backend, "csv" format, USD).
+    The app's data files are all relative paths, so changing into the directory is enough.
+    :return: module type - the app
+    """
+    monkeypatch.chdir(tmp_path)
+    for variable in ("EXPENSE_TRACKER_BACKEND", "EXPENSE_TRACKER_LEDGER_FORMAT", "EXPENSE_TRACKER_CURRENCY",
+                     "EXPENSE_TRACKER_METRICS"):
+        monkeypatch.delenv(variable, raising=False)
+
+    import expense_tracker_final
+    app = importlib.reload(expense_tracker_final)
+    yield app
+
+    if app.db_connection is not None:
+        app.db_connection.close()
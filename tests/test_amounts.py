@@ -0,0 +1,219 @@
+"""
+File name: tests/test_amounts.py
+--------------------------------
+Tests of Txn amounts in minor units:
+1) parse_amount()/ parse_amounts() - text in currency units to whole numbers of minor units, at 0, 2 and 3 decimals
+2) one-time conversion of legacy amounts (currency units, as floats) in shard files and in the SQLite database -
+   and that running it again changes nothing
+3) monthly rollups and spend cube, kept up to date incrementally, match a full rebuild after an edit,
+   a delete and a bulk change
+"""
+
+import json         # to read the rollups and cube files
+import os           # for file paths
+import sqlite3      # to create a legacy SQLite database
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# amount text -> expected minor units at 0, 2 and 3 decimal places (None: not a valid amount for the currency)
+AMOUNT_CASES = [("12", {0: 12, 2: 1200, 3: 12000}),
+                ("12.5", {0: None, 2: 1250, 3: 12500}),
+                ("12.345", {0: None, 2: None, 3: 12345}),
+                ("-0.01", {0: None, 2: -1, 3: -10}),
+                (".", {0: None, 2: None, 3: None}),
+                ("1e5", {0: None, 2: None, 3: None})]
+
+# Txns of the legacy shard - amounts as earlier versions of the app saved them, and the same in cents (USD)
+LEGACY_DATA_ROWS = [("2024-05-02", 12.5, "Groceries", "Costco", "USA"),
+                    ("2024-05-20", 0.1, "Housing", "Rent Co", "USA"),
+                    ("2024-06-01", 3.0, "Groceries", "Lidl", "UK")]
+LEGACY_JOURNAL_ROWS = [("2024-05-03", 0.2, "Groceries", "Costco", "USA"),
+                       ("2024-06-09", 1999.99, "Insurance", "Geico", "USA")]
+LEGACY_CENTS = [1250, 10, 300, 20, 199999]
+
+
+def set_currency_decimals(app, monkeypatch, decimals):
+    # use a currency with the given number of decimal places, without a currency file
+    monkeypatch.setattr(app, "currency_settings", {"currency": "TEST", "decimals": decimals})
+
+
+@pytest.mark.parametrize("decimals", [0, 2, 3])
+@pytest.mark.parametrize("amount_input, expected", AMOUNT_CASES)
+def test_parse_amount(app, monkeypatch, amount_input, expected, decimals):
+    set_currency_decimals(app, monkeypatch, decimals)
+
+    minor_units = app.parse_amount(amount_input)
+    assert minor_units == expected[decimals]
+
+    # a valid amount shows as text that parses back to the same amount
+    if minor_units is not None:
+        assert app.parse_amount(app.format_amount(minor_units)) == minor_units
+
+
+@pytest.mark.parametrize("decimals", [0, 2, 3])
+def test_parse_amounts_matches_parse_amount(app, monkeypatch, decimals):
+    set_currency_decimals(app, monkeypatch, decimals)
+
+    amount_inputs = pd.Series([amount_input for amount_input, _ in AMOUNT_CASES])
+    minor_units = app.parse_amounts(amount_inputs)
+
+    assert str(minor_units.dtype) == "Int64"
+    assert [None if pd.isna(value) else int(value) for value in minor_units] == \
+           [expected[decimals] for _, expected in AMOUNT_CASES]
+
+
+def write_legacy_shard(app, username):
+    """
+    Writes a shard for the given user as earlier versions of the app saved it: a data file (in app.LEDGER_FORMAT)
+    and a journal, with Txn amounts in currency units - and No flag file saying the amounts were converted.
+    """
+    shard_dir = app.shard_dir_path(username)
+    os.makedirs(shard_dir)
+
+    data_df = pd.DataFrame([(username,) + row for row in LEGACY_DATA_ROWS], columns=app.TXN_FIELDS)
+    data_df[app.TXN_ID_FIELD] = [101, 102, 103]
+    if app.LEDGER_FORMAT == "npy":
+        # column files as written now, with the amounts column replaced by floats
+        ledger_df = app.compact_expense_dtypes(data_df.assign(Txn_Amount=0))
+        app.write_shard_data(username, ledger_df, app.build_date_index(ledger_df))
+        with open(os.path.join(shard_dir, app.SHARD_COLUMNS_FILE), "r") as file:
+            amounts_file = json.load(file)["columns"]["Txn_Amount"][0]
+        np.save(os.path.join(shard_dir, amounts_file), data_df["Txn_Amount"].to_numpy(dtype=np.float64))
+    else:
+        data_df.to_csv(os.path.join(shard_dir, app.SHARD_DATA_FILE), index=False)
+
+    journal_df = pd.DataFrame([(username,) + row for row in LEGACY_JOURNAL_ROWS], columns=app.TXN_FIELDS)
+    journal_df[app.TXN_ID_FIELD] = [104, 105]
+    journal_df.to_csv(os.path.join(shard_dir, app.SHARD_JOURNAL_FILE), index=False, header=False)
+
+
+@pytest.mark.parametrize("ledger_format", ["csv", "npy"])
+def test_convert_legacy_shard_amounts(app, monkeypatch, ledger_format):
+    monkeypatch.setattr(app, "LEDGER_FORMAT", ledger_format)
+    write_legacy_shard(app, "kkk")
+
+    # the first read of Expense data converts the amounts of data file and journal
+    ledger_df = app.read_user_ledger("kkk")
+
+    assert ledger_df["Txn_Amount"].dtype == np.int64
+    assert dict(zip(ledger_df.index, ledger_df["Txn_Amount"])) == dict(zip([101, 102, 103, 104, 105], LEGACY_CENTS))
+    assert os.path.exists(app.FILE_PATH_SHARDS_AMOUNTS)
+
+
+@pytest.mark.parametrize("ledger_format", ["csv", "npy"])
+def test_convert_amounts_again_changes_nothing(app, monkeypatch, ledger_format):
+    monkeypatch.setattr(app, "LEDGER_FORMAT", ledger_format)
+    write_legacy_shard(app, "kkk")
+    app.read_user_ledger("kkk")
+
+    # a New Txn in the journal, saved in minor units
+    app.save_expense_entry_to_file(["kkk", "2024-06-10", 4321, "Housing", "Rent Co", "USA"])
+    converted_df = app.read_user_ledger("kkk")
+
+    # as after an interruption: the converter runs again, over data files and journals already in minor units
+    os.remove(app.FILE_PATH_SHARDS_AMOUNTS)
+    with app.file_lock(app.FILE_PATH_SHARDS_LOCK):
+        app.convert_amounts_to_minor_units()
+    app.invalidate_ledger_cache("kkk")
+
+    pd.testing.assert_frame_equal(app.read_user_ledger("kkk"), converted_df)
+
+
+def test_convert_sqlite_amounts_once(app, monkeypatch):
+    # a database from before amounts were saved in minor units: REAL amounts, user_version 0
+    connection = sqlite3.connect(app.FILE_PATH_DB)
+    connection.executescript(app.DB_SCHEMA.replace("Txn_Amount INTEGER", "Txn_Amount REAL"))
+    connection.executemany("INSERT INTO expenses (Username, Txn_Date, Txn_Amount, Txn_Category, MerchantName,"
+                           " Txn_Country, Txn_ID) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [("kkk",) + row + (txn_id,)
+                            for txn_id, row in enumerate(LEGACY_DATA_ROWS + LEGACY_JOURNAL_ROWS, start=1)])
+    connection.commit()
+    connection.close()
+
+    query = "SELECT Txn_Amount FROM expenses ORDER BY Txn_ID"
+    assert [row[0] for row in app.get_db_connection().execute(query)] == LEGACY_CENTS
+
+    # opening the database again doesn't convert it again
+    app.db_connection.close()
+    monkeypatch.setattr(app, "db_connection", None)
+    assert [row[0] for row in app.get_db_connection().execute(query)] == LEGACY_CENTS
+    assert app.get_db_connection().execute("PRAGMA user_version").fetchone()[0] == 1
+
+
+def normalise_cube(cube_df):
+    # spend cube cells as plain rows, in a fixed order - to compare cubes however they were built
+    cube_df = cube_df.reset_index()[["Year_Month", "Txn_Category", "Txn_Country", "MerchantName",
+                                     "count", "sum", "max"]]
+    cube_df = cube_df.astype({"Year_Month": str, "Txn_Category": str, "Txn_Country": str, "MerchantName": str})
+    return cube_df.sort_values(["Year_Month", "Txn_Category", "Txn_Country", "MerchantName"], ignore_index=True)
+
+
+def assert_matches_full_rebuild(app, username):
+    """
+    Checks the user's rollups and spend cube, as kept up to date by the last change, against a rebuild
+    from All their Expense Txns.
+    """
+    shard_dir = app.shard_dir_path(username)
+    app.invalidate_ledger_cache(username)
+
+    # rollups file was saved by the change itself - so it is current, and load_user_rollups() doesn't rebuild it
+    with open(os.path.join(shard_dir, app.SHARD_ROLLUP_FILE), "r") as file:
+        rollups = json.load(file)
+    assert rollups["version"] == app.rollup_version_stamp(username)
+
+    rebuilt_rollups = app.rebuild_user_rollups(username)
+    assert rollups["months"].keys() == rebuilt_rollups["months"].keys()
+    for year_month, categories in rebuilt_rollups["months"].items():
+        assert rollups["months"][year_month].keys() == categories.keys()
+        for category, totals in categories.items():
+            # count, sum and max are exact - sum of squares is a float
+            assert rollups["months"][year_month][category][:3] == totals[:3]
+            assert rollups["months"][year_month][category][3] == pytest.approx(totals[3])
+
+    # cube file holds the cells of the data file, and queries add the journal
+    with open(os.path.join(shard_dir, app.SHARD_CUBE_FILE), "r") as file:
+        assert json.load(file)["version"] == app.rollup_version_stamp(username)[0]
+    cube_df = app.load_user_cube(username)
+    spend_cube_df = app.fetch_spend_cube(username, app.CUBE_DIMENSIONS)
+
+    pd.testing.assert_frame_equal(normalise_cube(cube_df), normalise_cube(app.rebuild_user_cube(username)))
+    pd.testing.assert_frame_equal(normalise_cube(spend_cube_df.drop(columns="mean")),
+                                  normalise_cube(app.spend_cube_cells(app.read_user_ledger(username))))
+
+
+@pytest.mark.parametrize("ledger_format", ["csv", "npy"])
+def test_rollups_and_cube_match_full_rebuild(app, monkeypatch, ledger_format):
+    monkeypatch.setattr(app, "LEDGER_FORMAT", ledger_format)
+    username = "kkk"
+    categories = ["Groceries", "Housing", "Insurance"]
+
+    # Txns over two months - most merged into the data file, the last few still in the journal
+    for day in range(1, 25):
+        app.save_expense_entry_to_file([username, "2024-05-" + str(day).zfill(2), 100 * day + 5,
+                                        categories[day % 3], "Shop " + str(day % 4), "USA"])
+    app.compact_user_journal(username)
+    for day in range(1, 6):
+        app.save_expense_entry_to_file([username, "2024-06-" + str(day).zfill(2), 250 * day,
+                                        categories[day % 3], "Shop " + str(day % 2), "UK"])
+
+    ledger_df = app.read_user_ledger(username)
+    txn_ids = list(ledger_df.index)
+
+    # edit - a Txn moves to another month and category
+    app.update_expense_entry_in_file([username, "2024-06-15", 777, "Insurance", "Geico", "USA"], txn_ids[3])
+    assert_matches_full_rebuild(app, username)
+
+    # delete - one Txn from the data file, and one still in the journal
+    app.remove_expense_entry_from_file(username, txn_ids[10])
+    app.remove_expense_entry_from_file(username, txn_ids[-1])
+    assert_matches_full_rebuild(app, username)
+
+    # bulk change - recategorise every Groceries Txn, then delete a Date range
+    filters = {"Txn_Category": "Groceries"}
+    app.bulk_change_expenses(username, filters, {"Txn_Category": "Housing"}, commit=True)
+    assert_matches_full_rebuild(app, username)
+
+    app.bulk_change_expenses(username, {"start": "2024-05-10", "end": "2024-05-20"}, None, commit=True)
+    assert_matches_full_rebuild(app, username)
@@ -0,0 +1,31 @@
+"""
+File name: tests/test_ledger.py
+-------------------------------
+Tests of saving Expense Txns to the user's shard files.
+"""
+
+import json         # to read the rollups file
+import os           # for file paths
+
+
+def test_save_reports_success_when_only_rollups_fail(app, monkeypatch):
+    username = "kkk"
+    assert app.save_expense_entry_to_file([username, "2024-06-01", 1250, "Groceries", "Costco", "USA"]) is not None
+
+    def failing_save_user_rollups(username, rollups):
+        raise OSError(28, "No space left on device")
+
+    # the journal append succeeds, and only the rollups file can't be written
+    with monkeypatch.context() as patch:
+        patch.setattr(app, "save_user_rollups", failing_save_user_rollups)
+        txn_id = app.save_expense_entry_to_file([username, "2024-06-02", 500, "Groceries", "Lidl", "USA"])
+
+    assert txn_id is not None
+    ledger_df = app.read_user_ledger(username)
+    assert list(ledger_df["Txn_Amount"]) == [1250, 500]
+    assert txn_id in ledger_df.index
+
+    # rollups file was left out of date - so it is rebuilt, with both Txns
+    with open(os.path.join(app.shard_dir_path(username), app.SHARD_ROLLUP_FILE), "r") as file:
+        assert json.load(file)["version"] != app.rollup_version_stamp(username)
+    assert app.load_user_rollups(username)["months"]["2024-06"]["Groceries"][:3] == [2, 1750, 1250]